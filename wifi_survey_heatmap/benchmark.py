@@ -0,0 +1,549 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import sys
+import argparse
+import logging
+import os
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from wifi_survey_heatmap.convert import write_survey
+from wifi_survey_heatmap.heatmap import RENDERERS, HeatMapGenerator
+from wifi_survey_heatmap.interpolate import (
+    DEFAULT_NEIGHBORS, INTERPOLATION_METHODS, interpolate
+)
+from wifi_survey_heatmap.survey import STORES
+from wifi_survey_heatmap.synthetic import (
+    synthetic_floorplan, synthetic_survey, write_synthetic_survey
+)
+from wifi_survey_heatmap.thresholds import survey_stats
+
+FORMAT = "[%(asctime)s %(levelname)s] %(message)s"
+logging.basicConfig(level=logging.WARNING, format=FORMAT)
+logger = logging.getLogger()
+
+#: Module of each command-line entry point, and the slow-to-import packages
+#: that merely importing it (which is all that e.g. ``--help`` needs) must
+#: not import; see :py:class:`~.ImportBenchmark`.
+ENTRY_POINT_IMPORTS = [
+    ('wifi_survey_heatmap.heatmap', ('matplotlib', 'scipy')),
+    ('wifi_survey_heatmap.thresholds', ('matplotlib', 'scipy', 'PIL')),
+    ('wifi_survey_heatmap.convert', ('matplotlib', 'scipy', 'PIL')),
+    ('wifi_survey_heatmap.benchmark', ('matplotlib', 'scipy')),
+    ('wifi_survey_heatmap.rootscanner', ('wx', 'numpy', 'matplotlib')),
+    ('wifi_survey_heatmap.ui', ('matplotlib', 'scipy')),
+]
+
+#: Stages of the heatmap pipeline timed by :py:class:`~.PipelineBenchmark`.
+PIPELINE_STAGES = ['load', 'interpolate', 'plot', 'channels', 'thresholds']
+
+#: Largest survey the ``rbf`` interpolation method is benchmarked with by
+#: default; it needs about 1.6 GB of memory at this size, and four times as
+#: much for twice as many points.
+RBF_MAX_POINTS = 10000
+
+#: Survey sizes benchmarked by default with ``--stage``.
+PIPELINE_SIZES = [10, 100, 1000, 10000, 20000]
+
+
+class InterpolationBenchmark(object):
+    """
+    Time each interpolation method against random surveys of increasing size
+    on a fixed grid, as used by :py:meth:`~.HeatMapGenerator.generate`.
+    """
+
+    def __init__(self, width=2000, height=1500, grid_x=500,
+                 neighbors=DEFAULT_NEIGHBORS, rbf_max_points=RBF_MAX_POINTS,
+                 seed=0):
+        self._width = width
+        self._height = height
+        self._neighbors = neighbors
+        self._rbf_max_points = rbf_max_points
+        self._seed = seed
+        num_x = grid_x
+        num_y = int(num_x / (width / height))
+        gx, gy = np.meshgrid(
+            np.linspace(0, width, num_x), np.linspace(0, height, num_y)
+        )
+        self._gx, self._gy = gx.flatten(), gy.flatten()
+        logger.info('Benchmark grid is %d x %d', num_x, num_y)
+
+    def _survey(self, num_points):
+        rng = np.random.default_rng(self._seed)
+        x = rng.uniform(0, self._width, num_points)
+        y = rng.uniform(0, self._height, num_points)
+        z = -30 - 60 * np.hypot(x, y) / np.hypot(self._width, self._height)
+        return x, y, z
+
+    def run(self, sizes, methods=INTERPOLATION_METHODS):
+        """
+        Return a list of ``(num_points, method, seconds)`` tuples; seconds is
+        None for runs that were skipped.
+        """
+        results = []
+        for num_points in sizes:
+            x, y, z = self._survey(num_points)
+            for method in methods:
+                if method == 'rbf' and num_points > self._rbf_max_points:
+                    logger.info(
+                        'Skipping rbf with %d points (limit %d)',
+                        num_points, self._rbf_max_points
+                    )
+                    results.append((num_points, method, None))
+                    continue
+                start = time.perf_counter()
+                interpolate(
+                    method, x, y, z, self._gx, self._gy,
+                    neighbors=self._neighbors
+                )
+                elapsed = time.perf_counter() - start
+                logger.info('%s with %d points: %.3fs', method, num_points,
+                            elapsed)
+                results.append((num_points, method, elapsed))
+        return results
+
+
+class PipelineBenchmark(object):
+    """
+    Time each stage of ``wifi-heatmap`` and ``wifi-heatmap-thresholds``
+    against deterministic synthetic surveys (see
+    :py:func:`~.synthetic_survey`) of increasing size, for each of the
+    given alternatives of that stage:
+
+    * ``load`` - reading the survey file and
+      :py:meth:`~.HeatMapGenerator.load_data`, for each storage format in
+      ``stores``
+    * ``interpolate`` - interpolating every metric onto the grid, for each
+      method in ``methods``
+    * ``plot`` - rendering the heatmap of every metric, for each renderer in
+      ``renderers``
+    * ``channels`` - :py:meth:`~.HeatMapGenerator._channel_to_signal`
+    * ``thresholds`` - :py:func:`~.survey_stats` (without its cache), for
+      each storage format in ``stores``
+
+    Stages other than ``load`` and ``thresholds`` read the survey from a
+    binary file. Each stage is timed ``repeat`` times and the fastest run
+    is reported.
+    """
+
+    def __init__(self, width=2000, height=1500, bssids_per_scan=12,
+                 iperf=1.0, methods=INTERPOLATION_METHODS,
+                 renderers=RENDERERS, stores=sorted(STORES.keys()),
+                 rbf_max_points=RBF_MAX_POINTS, repeat=1, seed=0):
+        self._width = width
+        self._height = height
+        self._bssids_per_scan = bssids_per_scan
+        self._iperf = iperf
+        self._methods = methods
+        self._renderers = renderers
+        self._stores = stores
+        self._rbf_max_points = rbf_max_points
+        self._repeat = repeat
+        self._seed = seed
+
+    def _time(self, func):
+        """
+        Return a ``(seconds, result)`` tuple of the fastest of ``repeat``
+        calls of ``func``, and what it returned.
+        """
+        best = None
+        for _ in range(self._repeat):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    @staticmethod
+    def _generator(title, method='local', renderer='matplotlib'):
+        return HeatMapGenerator(
+            None, title, False, 'RdYlBu_r', None, interpolation=method,
+            renderer=renderer, force=True
+        )
+
+    def run(self, sizes, stages=PIPELINE_STAGES):
+        """
+        Return a list of ``(num_points, stage, variant, seconds)`` tuples;
+        ``variant`` is the storage format, interpolation method or renderer
+        the stage was timed with (if it has any) and seconds is None for
+        runs that were skipped.
+        """
+        results = []
+        cwd = os.getcwd()
+        for num_points in sizes:
+            # heatmaps are written to the current directory, named after
+            # the survey, so each size gets its own scratch directory
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                try:
+                    results.extend(self._run_size(num_points, stages))
+                finally:
+                    os.chdir(cwd)
+        return results
+
+    def _run_size(self, num_points, stages):
+        from matplotlib.image import imsave
+        results = []
+
+        def record(stage, variant, seconds):
+            logger.info(
+                '%s (%s) with %d points: %s', stage, variant or '-',
+                num_points, seconds
+            )
+            results.append((num_points, stage, variant, seconds))
+
+        imsave('floorplan.png', synthetic_floorplan(self._width, self._height))
+        data = synthetic_survey(
+            num_points, bssids_per_scan=self._bssids_per_scan,
+            iperf=self._iperf, width=self._width, height=self._height,
+            img_path='floorplan.png', seed=self._seed
+        )
+        for store in set(self._stores) | {'npz'}:
+            write_survey('survey' + STORES[store], data)
+        title = 'survey' + STORES['npz']
+        # set up (and import) everything once before timing any of it
+        gen = self._generator(title)
+        tasks, keys = gen._prepare()
+        for store in (self._stores if 'load' in stages else []):
+            record('load', store, self._time(
+                lambda: self._generator('survey' + STORES[store]).load_data()
+            )[0])
+        grids = None
+        for method in (self._methods if 'interpolate' in stages else []):
+            if method == 'rbf' and num_points > self._rbf_max_points:
+                logger.info(
+                    'Skipping rbf with %d points (limit %d)',
+                    num_points, self._rbf_max_points
+                )
+                record('interpolate', method, None)
+                continue
+            interp = self._generator(title, method=method)
+            interp._prepare()
+            seconds, result = self._time(
+                lambda: interp._interpolate(*interp._grid_data, keys=keys)
+            )
+            record('interpolate', method, seconds)
+            if grids is None:
+                grids = result
+        if 'plot' in stages:
+            a, gx, gy, num_x, num_y = gen._grid_data
+            if grids is None:
+                grids = gen._interpolate(a, gx, gy, num_x, num_y, keys=keys)
+            for renderer in self._renderers:
+                plot = self._generator(title, renderer=renderer)
+                plot._prepare()
+                plot._plot_data = (a, grids, num_x, num_y)
+                record('plot', renderer, self._time(
+                    lambda: [plot._plot_metric(k) for k in keys]
+                )[0])
+        if 'channels' in stages:
+            record('channels', None, self._time(gen._channel_to_signal)[0])
+        for store in (self._stores if 'thresholds' in stages else []):
+            record('thresholds', store, self._time(
+                lambda: survey_stats('survey' + STORES[store], cache=False)
+            )[0])
+        return results
+
+
+class ImportBenchmark(object):
+    """
+    Time the import of each command-line entry point module in a fresh
+    interpreter with ``python -X importtime``, and check that it doesn't
+    import any of the packages it is meant to defer.
+    """
+
+    def __init__(self, repeat=3):
+        self._repeat = repeat
+
+    @staticmethod
+    def _import(module):
+        """
+        Return a ``(seconds, modules)`` tuple for importing ``module`` once:
+        its cumulative import time and the names of all modules imported, or
+        ``(None, [])`` if the import failed.
+        """
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True
+        )
+        if proc.returncode != 0:
+            logger.info('Importing %s failed:\n%s', module, proc.stderr)
+            return None, []
+        seconds = None
+        modules = []
+        for line in proc.stderr.splitlines():
+            # import time: <self us> | <cumulative us> | <indented name>
+            if not line.startswith('import time:'):
+                continue
+            fields = line.split('|')
+            name = fields[2].strip()
+            if not fields[1].strip().isdigit():
+                continue
+            modules.append(name)
+            if name == module:
+                seconds = int(fields[1]) / 1e6
+        return seconds, modules
+
+    def run(self, entry_points=ENTRY_POINT_IMPORTS):
+        """
+        Return a list of ``(module, seconds, heavy)`` tuples, where
+        ``seconds`` is the fastest of ``repeat`` imports (None if the import
+        failed, e.g. because an optional dependency is missing) and
+        ``heavy`` is a list of the deferred packages it imported anyway.
+        """
+        results = []
+        for module, deferred in entry_points:
+            times = []
+            modules = []
+            for _ in range(self._repeat):
+                seconds, modules = self._import(module)
+                if seconds is None:
+                    break
+                times.append(seconds)
+            heavy = sorted(
+                pkg for pkg in deferred
+                if any(
+                    m == pkg or m.startswith(pkg + '.') for m in modules
+                )
+            )
+            results.append((module, min(times) if times else None, heavy))
+            logger.info('Import of %s: %s', module, results[-1][1:])
+        return results
+
+
+def format_import_results(results):
+    lines = ['%-34s  %10s  %s' % ('module', 'seconds', 'deferred imports')]
+    for module, seconds, heavy in results:
+        lines.append('%-34s  %10s  %s' % (
+            module, 'failed' if seconds is None else '%.3f' % seconds,
+            ', '.join(heavy) or '-'
+        ))
+    return '\n'.join(lines)
+
+
+def format_pipeline_results(results):
+    lines = ['%8s  %-12s  %-10s  %10s' % (
+        'points', 'stage', 'variant', 'seconds'
+    )]
+    for num_points, stage, variant, elapsed in results:
+        lines.append('%8d  %-12s  %-10s  %10s' % (
+            num_points, stage, variant or '-',
+            'skipped' if elapsed is None else '%.3f' % elapsed
+        ))
+    return '\n'.join(lines)
+
+
+def format_results(results):
+    lines = ['%8s  %-8s  %10s' % ('points', 'method', 'seconds')]
+    for num_points, method, elapsed in results:
+        lines.append('%8d  %-8s  %10s' % (
+            num_points, method,
+            'skipped' if elapsed is None else '%.3f' % elapsed
+        ))
+    return '\n'.join(lines)
+
+
+def parse_args(argv):
+    """
+    parse arguments/options
+
+    this uses the new argparse module instead of optparse
+    see: <https://docs.python.org/2/library/argparse.html>
+    """
+    p = argparse.ArgumentParser(
+        description='wifi survey heatmap interpolation benchmark'
+    )
+    p.add_argument('-v', '--verbose', dest='verbose', action='count', default=0,
+                   help='verbose output. specify twice for debug-level output.')
+    p.add_argument('-m', '--method', dest='methods', action='append',
+                   choices=INTERPOLATION_METHODS, default=None,
+                   help='Interpolation method to benchmark; may be given '
+                        'multiple times (default: all methods)')
+    p.add_argument('-s', '--stage', dest='stages', action='append',
+                   choices=PIPELINE_STAGES + ['all'], default=None,
+                   help='Instead of interpolation alone, benchmark this '
+                        'stage of the heatmap pipeline on synthetic '
+                        'surveys ("all" for every stage); may be given '
+                        'multiple times. Default sizes: %s' % ' '.join(
+                            str(x) for x in PIPELINE_SIZES
+                        ))
+    p.add_argument('-r', '--renderer', dest='renderers', action='append',
+                   choices=RENDERERS, default=None,
+                   help='With --stage plot, heatmap renderer to benchmark; '
+                        'may be given multiple times (default: all '
+                        'renderers)')
+    p.add_argument('--store', dest='stores', action='append',
+                   choices=sorted(STORES.keys()), default=None,
+                   help='With --stage load or thresholds, survey storage '
+                        'format to benchmark; may be given multiple times '
+                        '(default: all formats)')
+    p.add_argument('--bssids', dest='bssids', action='store', type=int,
+                   default=12,
+                   help='Number of access points in the scan results of '
+                        'each synthetic survey point (default: '
+                        '%(default)s)')
+    p.add_argument('--iperf', dest='iperf', action='store', type=float,
+                   default=1.0,
+                   help='Fraction of synthetic survey points with iperf3 '
+                        'results (default: %(default)s)')
+    p.add_argument('--floorplan-size', dest='floorplan_size', action='store',
+                   type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'),
+                   default=[2000, 1500],
+                   help='Size of the synthetic floorplan in pixels '
+                        '(default: 2000 1500)')
+    p.add_argument('--repeat', dest='repeat', action='store', type=int,
+                   default=1,
+                   help='With --stage, time each stage this many times and '
+                        'report the fastest (default: %(default)s)')
+    p.add_argument('--write-survey', dest='write_survey', action='store',
+                   type=str, default=None, metavar='PATH',
+                   help='Just write a synthetic survey with the first of '
+                        'SIZES points to PATH (JSON, .npz or .sqlite), and '
+                        'its floorplan to PATH with a .png extension')
+    p.add_argument('-g', '--grid-x', dest='grid_x', action='store', type=int,
+                   default=500,
+                   help='Number of grid columns to evaluate '
+                        '(default: %(default)s)')
+    p.add_argument('--neighbors', dest='neighbors', action='store', type=int,
+                   default=DEFAULT_NEIGHBORS,
+                   help='Number of nearest points used by the "local" '
+                        'method (default: %(default)s)')
+    p.add_argument('--rbf-max-points', dest='rbf_max_points', action='store',
+                   type=int, default=RBF_MAX_POINTS,
+                   help='Skip the "rbf" method above this many points, as '
+                        'its memory use grows with N*N (default: '
+                        '%(default)s)')
+    p.add_argument('--imports', dest='imports', action='store_true',
+                   default=False,
+                   help='Instead of interpolation, time the import of each '
+                        'command-line entry point module and exit non-zero '
+                        'if one imports a package it should defer (e.g. '
+                        'matplotlib or scipy)')
+    p.add_argument(
+        'SIZES', type=int, nargs='*', default=None,
+        help='Survey sizes (number of points) to benchmark (default: 100 '
+             '1000 10000)'
+    )
+    args = p.parse_args(argv)
+    return args
+
+
+def set_log_info():
+    """set logger level to INFO"""
+    set_log_level_format(logging.INFO,
+                         '%(asctime)s %(levelname)s:%(name)s:%(message)s')
+
+
+def set_log_debug():
+    """set logger level to DEBUG, and debug-level output format"""
+    set_log_level_format(
+        logging.DEBUG,
+        "%(asctime)s [%(levelname)s %(filename)s:%(lineno)s - "
+        "%(name)s.%(funcName)s() ] %(message)s"
+    )
+
+
+def set_log_level_format(level, format):
+    """
+    Set logger level and format.
+
+    :param level: logging level; see the :py:mod:`logging` constants.
+    :type level: int
+    :param format: logging formatter format string
+    :type format: str
+    """
+    formatter = logging.Formatter(fmt=format)
+    logger.handlers[0].setFormatter(formatter)
+    logger.setLevel(level)
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+
+    # set logging level
+    if args.verbose > 1:
+        set_log_debug()
+    elif args.verbose == 1:
+        set_log_info()
+
+    if args.imports:
+        results = ImportBenchmark().run()
+        print(format_import_results(results))
+        if any(heavy for _, _, heavy in results):
+            raise SystemExit(1)
+        return
+
+    width, height = args.floorplan_size
+    if args.write_survey is not None:
+        write_synthetic_survey(
+            args.write_survey, (args.SIZES or [1000])[0],
+            os.path.splitext(args.write_survey)[0] + '.png', width=width,
+            height=height, bssids_per_scan=args.bssids, iperf=args.iperf
+        )
+        return
+
+    if args.stages:
+        stages = PIPELINE_STAGES if 'all' in args.stages else args.stages
+        bench = PipelineBenchmark(
+            width=width, height=height, bssids_per_scan=args.bssids,
+            iperf=args.iperf, methods=args.methods or INTERPOLATION_METHODS,
+            renderers=args.renderers or RENDERERS,
+            stores=args.stores or sorted(STORES.keys()),
+            rbf_max_points=args.rbf_max_points, repeat=args.repeat
+        )
+        results = bench.run(args.SIZES or PIPELINE_SIZES, stages=stages)
+        print(format_pipeline_results(results))
+        return
+
+    bench = InterpolationBenchmark(
+        grid_x=args.grid_x, neighbors=args.neighbors,
+        rbf_max_points=args.rbf_max_points
+    )
+    results = bench.run(
+        args.SIZES or [100, 1000, 10000],
+        methods=args.methods or INTERPOLATION_METHODS
+    )
+    print(format_results(results))
+
+
+if __name__ == '__main__':
+    main()
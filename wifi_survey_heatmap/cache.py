@@ -0,0 +1,154 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+from wifi_survey_heatmap.survey import open_temp
+
+logger = logging.getLogger(__name__)
+
+#: Default maximum total size of a :py:class:`~.GridCache`, in bytes.
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+
+class GridCache(object):
+    """
+    On-disk cache of interpolated heatmap grids.
+
+    Each grid is stored as a float32 ``.npy`` file named after a hash of
+    everything that determines its contents (see :py:meth:`~.key`), so
+    re-rendering a survey with different colors, contours or thresholds can
+    skip interpolation entirely. Cache hits update the file's modification
+    time, and the least recently used files are removed whenever the total
+    size of the cache exceeds ``max_bytes``.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(x, y, values, shape, method, **params):
+        """
+        Return the cache key for one interpolated grid.
+
+        :param x: X coordinates of the survey points
+        :param y: Y coordinates of the survey points
+        :param values: metric value at each survey point
+        :param shape: shape of the interpolation grid, along with anything
+          else that determines the grid coordinates (i.e. the image size)
+        :type shape: tuple
+        :param method: interpolation method name
+        :type method: str
+        :param params: any further parameters of the interpolation method
+        :return: hex digest
+        :rtype: str
+        """
+        h = hashlib.sha256()
+        h.update(repr((method, tuple(shape), sorted(params.items()))).encode())
+        for arr in (x, y, values):
+            h.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+        return h.hexdigest()
+
+    def _fname(self, key):
+        return os.path.join(self.path, '%s.npy' % key)
+
+    def get(self, key):
+        """
+        Return the cached grid for ``key``, or None on a cache miss. Grids
+        that cannot be read (e.g. truncated by a crash) are removed.
+        """
+        fname = self._fname(key)
+        try:
+            z = np.load(fname)
+        except OSError:
+            return None
+        except (EOFError, ValueError):
+            logger.warning('Removing unreadable cached grid: %s', fname)
+            try:
+                os.unlink(fname)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(fname)
+        except OSError:
+            pass
+        logger.debug('Grid cache hit: %s', fname)
+        return z.astype(np.float64)
+
+    def put(self, key, z):
+        """
+        Store the grid ``z`` under ``key`` and evict old entries if needed.
+        """
+        fh, tmp = open_temp(self._fname(key), 'wb')
+        try:
+            with fh:
+                np.save(fh, np.asarray(z, dtype=np.float32))
+            os.replace(tmp, self._fname(key))
+        except Exception:
+            os.unlink(tmp)
+            raise
+        logger.debug('Grid cache store: %s', self._fname(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used grids until the cache is no larger
+        than ``max_bytes``.
+        """
+        entries = []
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith('.npy'):
+                continue
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(e[1] for e in entries)
+        for _, size, fname in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            logger.debug('Evicting from grid cache: %s', fname)
+            try:
+                os.unlink(fname)
+            except OSError:
+                continue
+            total -= size
@@ -0,0 +1,236 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import sys
+import argparse
+import logging
+import json
+import os
+
+from wifi_survey_heatmap.journal import (
+    has_journal_events, journal_path, replay_journal
+)
+from wifi_survey_heatmap.store import SQLiteStore
+from wifi_survey_heatmap.survey import (
+    NPZ_EXTENSION, SQLITE_EXTENSION, read_npz, write_npz
+)
+
+FORMAT = "[%(asctime)s %(levelname)s] %(message)s"
+logging.basicConfig(level=logging.WARNING, format=FORMAT)
+logger = logging.getLogger()
+
+
+def read_survey(path):
+    """
+    Read a whole JSON, binary (``.npz``) or SQLite (``.sqlite``) survey file
+    into a dict. Changes to JSON or binary surveys that are still only in
+    the survey's journal (see :py:mod:`~.journal`) are applied, like
+    :py:func:`~.load_survey` does.
+
+    :param path: path to the survey file
+    :type path: str
+    :rtype: dict
+    """
+    if not path.endswith(SQLITE_EXTENSION) and has_journal_events(path):
+        data = {}
+        points = replay_journal(path, header=data)
+        data['survey_points'] = points
+        return data
+    if path.endswith(NPZ_EXTENSION):
+        return read_npz(path)
+    if path.endswith(SQLITE_EXTENSION):
+        with SQLiteStore(path) as store:
+            data = store.header
+            data['survey_points'] = [p for _, p in store.points()]
+        return data
+    with open(path, 'r') as fh:
+        return json.loads(fh.read())
+
+
+def _remove_sqlite(path, database=True):
+    """
+    Remove the SQLite database at ``path`` (unless ``database`` is False)
+    and its write-ahead log and shared memory files, where they exist.
+    """
+    suffixes = ['-wal', '-shm']
+    if database:
+        suffixes.insert(0, '')
+    for suffix in suffixes:
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+def write_survey(path, data):
+    """
+    Write a survey dict to a JSON, binary (``.npz``) or SQLite (``.sqlite``)
+    survey file, depending on the extension of ``path``. An existing SQLite
+    store is replaced, not added to, and an existing journal of changes to a
+    JSON or binary survey at ``path`` is removed, as it doesn't apply to the
+    new file.
+
+    :param path: path to the survey file
+    :type path: str
+    :param data: survey, i.e. a dict with ``img_path`` and ``survey_points``
+    :type data: dict
+    """
+    if path.endswith(NPZ_EXTENSION):
+        write_npz(path, data)
+    elif path.endswith(SQLITE_EXTENSION):
+        tmp = path + '.tmp'
+        _remove_sqlite(tmp)
+        with SQLiteStore(tmp) as store:
+            for key, value in data.items():
+                if key != 'survey_points':
+                    store.set_header(key, value)
+            for point in data['survey_points']:
+                store.add_point(point)
+            store.checkpoint()
+        # SQLite would apply a write-ahead log left over from the old store
+        # to the new one
+        _remove_sqlite(path, database=False)
+        os.replace(tmp, path)
+    else:
+        with open(path, 'w') as fh:
+            fh.write(json.dumps(data, indent=2))
+    if os.path.exists(journal_path(path)):
+        logger.info('Removing stale journal %s', journal_path(path))
+        os.unlink(journal_path(path))
+
+
+def convert(src, dest, verify=False):
+    """
+    Convert a survey file between the JSON, binary and SQLite formats; the
+    format of each file is determined by its extension. Only conversions
+    between JSON and the binary format preserve key order exactly.
+
+    :param src: path to the survey file to read
+    :type src: str
+    :param dest: path to the survey file to write
+    :type dest: str
+    :param verify: whether to read ``dest`` back and check that it holds
+      exactly the same survey as ``src``
+    :type verify: bool
+    :raises RuntimeError: if verification fails
+    """
+    data = read_survey(src)
+    if 'survey_points' not in data:
+        raise RuntimeError('No survey points found in %s' % src)
+    logger.info(
+        'Converting %d survey points from %s to %s',
+        len(data['survey_points']), src, dest
+    )
+    write_survey(dest, data)
+    if verify and read_survey(dest) != data:
+        raise RuntimeError('%s does not match %s' % (dest, src))
+    logger.info('Wrote: %s', dest)
+
+
+def parse_args(argv):
+    """
+    parse arguments/options
+
+    this uses the new argparse module instead of optparse
+    see: <https://docs.python.org/2/library/argparse.html>
+    """
+    p = argparse.ArgumentParser(
+        description='Convert wifi survey files between JSON, the binary '
+                    '(.npz) format and SQLite (.sqlite) stores'
+    )
+    p.add_argument('-v', '--verbose', dest='verbose', action='count', default=0,
+                   help='verbose output. specify twice for debug-level output.')
+    p.add_argument('--verify', dest='verify', action='store_true',
+                   default=False,
+                   help='Read the converted file back and check that it '
+                        'holds exactly the same survey')
+    p.add_argument('SOURCE', type=str, help='Survey file to convert')
+    p.add_argument(
+        'DEST', type=str,
+        help='Output survey file; written in the binary format if this ends '
+             'in .npz, as a SQLite store if it ends in .sqlite, otherwise as '
+             'JSON'
+    )
+    args = p.parse_args(argv)
+    return args
+
+
+def set_log_info():
+    """set logger level to INFO"""
+    set_log_level_format(logging.INFO,
+                         '%(asctime)s %(levelname)s:%(name)s:%(message)s')
+
+
+def set_log_debug():
+    """set logger level to DEBUG, and debug-level output format"""
+    set_log_level_format(
+        logging.DEBUG,
+        "%(asctime)s [%(levelname)s %(filename)s:%(lineno)s - "
+        "%(name)s.%(funcName)s() ] %(message)s"
+    )
+
+
+def set_log_level_format(level, format):
+    """
+    Set logger level and format.
+
+    :param level: logging level; see the :py:mod:`logging` constants.
+    :type level: int
+    :param format: logging formatter format string
+    :type format: str
+    """
+    formatter = logging.Formatter(fmt=format)
+    logger.handlers[0].setFormatter(formatter)
+    logger.setLevel(level)
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+
+    # set logging level
+    if args.verbose > 1:
+        set_log_debug()
+    elif args.verbose == 1:
+        set_log_info()
+
+    try:
+        convert(args.SOURCE, args.DEST, verify=args.verify)
+    except RuntimeError as ex:
+        logger.error(str(ex))
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
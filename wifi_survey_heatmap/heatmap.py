@@ -37,28 +37,95 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 
 import sys
 import argparse
+import glob
+import hashlib
 import logging
 import json
+import multiprocessing
+import os
+import re
+import time
 import numpy
 
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import matplotlib.cm as cm
-import matplotlib.pyplot as pp
-from mpl_toolkits.axes_grid1 import make_axes_locatable
-from scipy.interpolate import Rbf
-from pylab import imread, imshow
-from matplotlib.offsetbox import AnchoredText
-from matplotlib.patheffects import withStroke
-from matplotlib.font_manager import FontManager
-from matplotlib.colors import ListedColormap
-import matplotlib
+from PIL import Image
 
+# matplotlib (and scipy, see the interpolate module) are imported where they
+# are first used, so that e.g. ``--help`` or the ``raster`` renderer don't pay
+# for importing pyplot.
+
+from wifi_survey_heatmap.cache import DEFAULT_CACHE_SIZE, GridCache
+from wifi_survey_heatmap.interpolate import (
+    DEFAULT_NEIGHBORS, INTERPOLATION_METHODS, grid_shape, interpolate_fields
+)
+from wifi_survey_heatmap.journal import journal_path
+from wifi_survey_heatmap.profiling import StageProfiler, format_profile
+from wifi_survey_heatmap.raster import (
+    HEATMAP_SCALE, base_layer, colormap_lut, composite, lut_indices,
+    render_heatmap, resize, write_png
+)
+from wifi_survey_heatmap.survey import (
+    METRICS, STORES, BSSIDIndex, is_survey_file, load_survey, survey_filename
+)
+from wifi_survey_heatmap.tiles import (
+    TileIndex, TilePyramid, load_manifest, save_manifest, tile_hash,
+    tile_path, write_tile
+)
 
 FORMAT = "[%(asctime)s %(levelname)s] %(message)s"
 logging.basicConfig(level=logging.WARNING, format=FORMAT)
 logger = logging.getLogger()
 
+# HeatMapGenerator whose plots are being rendered by a process pool; set in
+# the parent before the pool forks, so workers inherit the loaded survey,
+# interpolated grids and floorplan image instead of receiving them pickled.
+_WORKER_GENERATOR = None
+
+# HeatMapGenerators of the surveys being rendered by generate_batch(); set in
+# the parent before the pool forks, like _WORKER_GENERATOR.
+_WORKER_BATCH = None
+
+
+#: Heatmap renderers selectable with ``wifi-heatmap --renderer``.
+RENDERERS = ['matplotlib', 'raster']
+
+#: Size (in floorplan pixels) of the cells used to de-duplicate point labels;
+#: only one label per AP name is drawn in each cell.
+LABEL_CELL_SIZE = 60
+
+#: Minimum number of survey points a BSSID must have been seen at to get a
+#: ``--per-bssid`` heatmap.
+PER_BSSID_MIN_POINTS = 3
+
+#: Manifest written next to the heatmaps of a survey (formatted with its
+#: title) that records a hash of the inputs of each of them, so outputs whose
+#: inputs haven't changed are not re-rendered. Its extension must not be one
+#: of the survey :py:data:`~.STORES`, or ``wifi-heatmap '*.json'`` would
+#: pick it up as a survey.
+OUTPUT_MANIFEST = 'manifest_%s.heatmap'
+
+#: Maximum number of interpolation grid cells of a ``preview`` render, see
+#: :py:meth:`~.HeatMapGenerator.generate`.
+PREVIEW_GRID_CELLS = 4000
+
+#: Maximum width or height of the floorplan in a ``preview`` render, in
+#: pixels.
+PREVIEW_SIZE = 800
+
+#: Prefix of the output filenames of ``wifi-heatmap --preview``, so previews
+#: never overwrite the full resolution images.
+PREVIEW_PREFIX = 'preview_'
+
+#: Seconds between checks of the survey file in ``--watch`` mode.
+WATCH_INTERVAL = 0.2
+
+#: Seconds the survey file must stay unchanged before ``--watch`` re-renders.
+WATCH_DEBOUNCE = 0.3
+
+#: Number of ``--per-bssid`` heatmaps interpolated at a time, which bounds
+#: the memory used by their grids.
+PER_BSSID_BATCH = 32
 
 WIFI_CHANNELS = {
     # center frequency to (channel, bandwidth MHz)
@@ -127,6 +194,39 @@ WIFI_CHANNELS = {
     5825.0: (165, 20.0)
 }
 
+#: Center frequencies (MHz) of :py:data:`~.WIFI_CHANNELS`, in ascending order
+CHANNEL_FREQUENCIES = np.array(sorted(WIFI_CHANNELS.keys()))
+
+
+def _channel_overlap_matrix():
+    """
+    Return a matrix of which channels overlap which, indexed like
+    :py:data:`~.CHANNEL_FREQUENCIES`: element ``[i, j]`` is 1 if the center
+    frequency of channel ``i`` is within the bandwidth of channel ``j``, so
+    multiplying it with a vector of per-channel signal spreads each signal
+    over every channel it overlaps.
+    """
+    freqs = CHANNEL_FREQUENCIES
+    width = np.array([WIFI_CHANNELS[f][1] for f in freqs])
+    low = np.trunc(freqs - width / 2.0)
+    high = np.trunc(freqs + width / 2.0 + 1.0)
+    overlap = (
+        (freqs[:, None] >= low[None, :]) & (freqs[:, None] < high[None, :])
+    )
+    return overlap.astype(float)
+
+
+#: Channel overlap matrix; see :py:func:`~._channel_overlap_matrix`
+CHANNEL_OVERLAP = _channel_overlap_matrix()
+
+
+class SurveyError(Exception):
+    """
+    Raised when a survey cannot be rendered at all, e.g. because it has no
+    points or no floorplan image.
+    """
+    pass
+
 
 class HeatMapGenerator(object):
 
@@ -146,7 +246,12 @@ class HeatMapGenerator(object):
 
     def __init__(
         self, image_path, title, showpoints, cname, contours, ignore_ssids=[], aps=None,
-        thresholds=None, hidebssid=False
+        thresholds=None, hidebssid=False, interpolation='rbf',
+        neighbors=DEFAULT_NEIGHBORS, jobs=1, cache_dir=None,
+        cache_size=DEFAULT_CACHE_SIZE, renderer='matplotlib',
+        grid_cell_size=None, grid_cells=None, adaptive_grid=False,
+        tiles_dir=None, store=None, per_bssid=False, force=False,
+        images=None, profiler=None, preview=False
     ):
         self._ap_names = {}
         if aps is not None:
@@ -155,35 +260,64 @@ class HeatMapGenerator(object):
                     x.upper(): y for x, y in json.loads(fh.read()).items()
                 }
         self._layout = None
+        self._base = None
+        self._bases = {}
+        self._scale = 1.0
+        self._previewing = False
+        self._images = images
+        self._drawn = {}
+        self._lut = None
         self._image_width = 0
         self._image_height = 0
         self._corners = [(0, 0), (0, 0), (0, 0), (0, 0)]
         self._title = title
         self._showpoints = showpoints
+        self._cname = cname
         self._cmap = self.get_cmap(cname)
         self._contours = contours
-        if not self._title.endswith('.json'):
-            self._title += '.json'
+        self._title = survey_filename(self._title, store=store)
         self._ignore_ssids = ignore_ssids
         self._hidebssid = hidebssid
+        self._interpolation = interpolation
+        self._neighbors = neighbors
+        self._jobs = jobs
+        self._renderer = renderer
+        self._grid_cell_size = grid_cell_size
+        self._grid_cells = grid_cells
+        self._adaptive_grid = adaptive_grid
+        self._tiles_dir = tiles_dir
+        self._per_bssid = per_bssid
+        self._force = force
+        self._preview = preview
+        self._manifest = None
+        self._old_manifest = None
+        self._render_params = None
+        self._grid_data = None
+        self._cache = None
+        self._profiler = profiler
+        if profiler is None:
+            self._profiler = StageProfiler(enabled=False)
+        if cache_dir is not None:
+            self._cache = GridCache(cache_dir, max_bytes=cache_size)
         logger.debug(
             'Initialized HeatMapGenerator; title=%s',
             self._title
         )
-        with open(self._title, 'r') as fh:
-            self._data = json.loads(fh.read())
-        if 'survey_points' not in self._data:
-            logger.error('No survey points found in {}'.format(self._title))
-            exit()
-        logger.info('Loaded %d survey points',
-                    len(self._data['survey_points']))
+        try:
+            with self._stage('load_survey'):
+                self._survey = load_survey(self._title)
+        except OSError as ex:
+            raise SurveyError('Cannot read %s: %s' % (self._title, ex))
+        except ValueError:
+            raise SurveyError('No survey points found in %s' % self._title)
+        if not len(self._survey):
+            raise SurveyError('No survey points found in %s' % self._title)
 
         # Try to load image from JSON if not overwritten
         if image_path is None:
-            if 'img_path' not in self._data:
-                logger.error('No image path found in {}'.format(self._title))
-                exit(1)
-            self._image_path = self._data['img_path']
+            if 'img_path' not in self._survey.header:
+                raise SurveyError('No image path found in %s' % self._title)
+            self._image_path = self._survey.header['img_path']
         else:
             self._image_path = image_path
 
@@ -194,7 +328,18 @@ class HeatMapGenerator(object):
                 self.thresholds = json.loads(fh.read())
             logger.debug('Thresholds: %s', self.thresholds)
 
+    def _stage(self, name, metric=None):
+        """
+        Return a context manager that records stage ``name`` of rendering
+        this survey, for metric ``metric`` if given, with the profiler (see
+        :py:class:`~.StageProfiler`).
+        """
+        return self._profiler.stage(name, survey=self._title, metric=metric)
+
     def get_cmap(self, cname):
+        import matplotlib.cm as cm
+        from matplotlib import colormaps
+        from matplotlib.colors import ListedColormap
         multi_string = cname.split('//')
         if len(multi_string) == 2:
             cname = multi_string[0]
@@ -209,50 +354,71 @@ class HeatMapGenerator(object):
             print(newcolors)
             return ListedColormap(newcolors)
         else:
-            return pp.get_cmap(cname)
+            return colormaps[cname]
 
     def load_data(self):
-        a = defaultdict(list)
-        check = set()
-        for row in self._data['survey_points']:
-            point = (row['x'], row['y'])
-            if point in check:
-                logger.warning(f"Two overlapping datapoints found. Discarding one of them. point={point}")
-                continue
-            check.add(point)
-            a['x'].append(row['x'])
-            a['y'].append(row['y'])
-            a['channel'].append(row['result']['channel'])
-            if 'tcp' in row['result']:
-                a['tcp_upload_Mbps'].append(
-                    row['result']['tcp']['received_Mbps']
-                )
-            if 'tcp-reverse' in row['result']:
-                a['tcp_download_Mbps'].append(
-                    row['result']['tcp-reverse']['received_Mbps']
-                )
-            if 'udp' in row['result']:
-                a['udp_download_Mbps'].append(row['result']['udp']['Mbps'])
-                a['jitter_download'].append(row['result']['udp']['jitter_ms'])
-            if 'udp-reverse' in row['result']:
-                a['udp_upload_Mbps'].append(
-                    row['result']['udp-reverse']['Mbps'])
-                a['jitter_upload'].append(
-                    row['result']['udp-reverse']['jitter_ms'])
-            a['tx_power'].append(row['result']['tx_power'])
-            a['frequency'].append(row['result']['frequency']*1e-3)
-            if 'bitrate' in row['result']:
-                a['channel_bitrate'].append(row['result']['bitrate'])
-            a['signal_quality'].append(row['result']['signal_mbm']+130)
-            ap = self._ap_names.get(
-                row['result']['mac'].upper(),
-                row['result']['mac']
+        """
+        Return the survey data as a dict of column name to array, with one
+        entry per distinct survey point: ``x`` and ``y`` coordinates, the
+        ``index`` of the point in the survey, ``ap`` labels and a float array
+        for every metric in
+        :py:data:`~.METRICS`, which is NaN where the metric has no value at
+        that point. Of several points at the same coordinates, only the first
+        is kept. If there are no duplicates, the arrays are the loaded survey
+        arrays themselves rather than copies.
+        """
+        survey = self._survey
+        idx = survey.distinct()
+        a = {
+            'x': survey.x[idx], 'y': survey.y[idx],
+            'index': np.arange(len(survey))[idx]
+        }
+        for key in METRICS.keys():
+            a[key] = survey.values[key][idx]
+        macs, mac_idx = np.unique(
+            np.asarray(survey.mac)[idx], return_inverse=True
+        )
+        names = np.array([self._ap_names.get(m.upper(), m) for m in macs])
+        a['ap'] = np.char.add(
+            names[mac_idx.ravel()], np.char.mod(
+                ' (%.1f GHz)',
+                1e-3 * survey.ap_frequency[idx].astype(int)
             )
-            a['ap'].append(ap + ' ({0:.1f} GHz)'.format(1e-3*int(row['result']['frequency'])))
+        )
         return a
 
+    def _interpolation_inputs(self, a, keys=None):
+        """
+        Return the ``(x, y, fields)`` to interpolate: the survey points plus
+        any floorplan corners that weren't surveyed, with each metric set to
+        its minimum at those corners, and only metrics that have values.
+        ``keys`` are the metrics to include, by default all :py:attr:`graphs`.
+        """
+        corners = np.array([
+            c for c in self._corners
+            if not ((a['x'] == c[0]) & (a['y'] == c[1])).any()
+        ], dtype=float).reshape((-1, 2))
+        x = np.concatenate((a['x'], corners[:, 0]))
+        y = np.concatenate((a['y'], corners[:, 1]))
+        fields = {}
+        for k in (self.graphs.keys() if keys is None else keys):
+            if np.isnan(a[k]).all():
+                continue
+            fields[k] = np.concatenate(
+                (a[k], np.full(len(corners), np.nanmin(a[k])))
+            )
+        return x, y, fields
+
     def _load_image(self):
-        self._layout = imread(self._image_path)
+        key = os.path.abspath(self._image_path)
+        if self._images is not None and key in self._images:
+            # decoded (and resampled) for another survey already
+            self._layout, self._bases = self._images[key]
+        else:
+            from matplotlib.image import imread
+            self._layout = imread(self._image_path)
+            if self._images is not None:
+                self._images[key] = (self._layout, self._bases)
         self._image_width = len(self._layout[0])
         self._image_height = len(self._layout) - 1
         self._corners = [
@@ -264,92 +430,783 @@ class HeatMapGenerator(object):
             self._image_width, self._image_height
         )
 
-    def generate(self):
-        self._load_image()
-        a = self.load_data()
-        for x, y in self._corners:
-            a['x'].append(x)
-            a['y'].append(y)
-            for k in a.keys():
-                if k in ['x', 'y', 'ap']:
-                    continue
-                a['ap'].append(None)
-                a[k] = [0 if x is None else x for x in a[k]]
-                a[k].append(min(a[k]))
-        self._channel_graphs()
-        num_x = int(self._image_width / 4)
-        num_y = int(num_x / (self._image_width / self._image_height))
+    @property
+    def _extent(self):
+        """the extent the floorplan image covers in plot coordinates"""
+        return (
+            -0.5, len(self._layout[0]) - 0.5, len(self._layout) - 0.5, -0.5
+        )
+
+    def _new_figure(self):
+        import matplotlib.pyplot as pp
+        return pp.subplots(
+            figsize=(self._image_width / 300, self._image_height / 300)
+        )
+
+    def _prepare_base_layer(self, scale=1.0):
+        """
+        Work out the size in pixels that the floorplan is drawn at in the
+        saved heatmaps, and resample it to that size once. Each heatmap is
+        then alpha-composited onto a copy of this base layer and drawn as a
+        single image, instead of every plot drawing and resampling the
+        full-resolution floorplan and the heatmap separately.
+
+        The ``raster`` renderer works this out without matplotlib, as
+        :py:data:`~.HEATMAP_SCALE` of the floorplan's size, and tile output
+        draws the floorplan at its native size. ``scale`` shrinks the saved
+        heatmaps (and so the base layer) by that factor, for previews; base
+        layers are kept for each scale they were prepared at.
+        """
+        self._lut = colormap_lut(self._cmap)
+        self._scale = scale
+        if scale in self._bases:
+            self._base = self._bases[scale]
+            return
+        if self._tiles_dir is not None:
+            width = len(self._layout[0])
+            height = len(self._layout)
+        elif self._renderer == 'raster':
+            width = len(self._layout[0]) * HEATMAP_SCALE
+            height = len(self._layout) * HEATMAP_SCALE
+        else:
+            import matplotlib.cm as cm
+            import matplotlib.pyplot as pp
+            fig, ax = self._new_figure()
+            ax.axis('off')
+            fig.colorbar(cm.ScalarMappable(cmap=self._cmap), ax=ax)
+            extent = self._extent
+            ax.set_xlim(extent[0], extent[1])
+            ax.set_ylim(extent[2], extent[3])
+            ax.set_aspect('equal')
+            ax.apply_aspect()
+            pos = ax.get_position()
+            width = pos.width * fig.get_figwidth() * 300
+            height = pos.height * fig.get_figheight() * 300
+            pp.close(fig)
+        self._base = base_layer(
+            self._layout, max(1, int(round(width * scale))),
+            max(1, int(round(height * scale)))
+        )
+        self._bases[scale] = self._base
+
+    def generate(self, preview=False):
+        """
+        Render all heatmaps and channel graphs whose inputs changed since the
+        last run.
+
+        :param preview: interpolate onto a coarse grid of at most
+          :py:data:`~.PREVIEW_GRID_CELLS` cells and save images at most
+          :py:data:`~.PREVIEW_SIZE` pixels across, without channel graphs,
+          for a quick first look at what changed; the manifest is not
+          updated, so a following full run renders the same outputs again at
+          full resolution. A generator constructed with ``preview=True``
+          always renders previews, including channel graphs, to
+          :py:data:`~.PREVIEW_PREFIX` filenames.
+        :type preview: bool
+        """
+        preview = preview or self._preview
+        with self._stage('preview' if preview else 'generate'):
+            if self._tiles_dir is not None:
+                self._prepare(preview)
+                return
+            tasks, keys = self._prepare(preview)
+            a, gx, gy, num_x, num_y = self._grid_data
+            grids = {}
+            if keys:
+                with self._stage('interpolate'):
+                    grids = self._interpolate(
+                        a, gx, gy, num_x, num_y, keys=keys
+                    )
+                keys = [
+                    k for k in keys
+                    if self._looks_changed(a, k, grids.get(k), preview)
+                ]
+            self._plot_data = (a, grids, num_x, num_y)
+            tasks.extend(('_plot_metric', (k,)) for k in keys)
+            before = self._output_states()
+            with self._stage('render'):
+                self._render(tasks)
+            if self._per_bssid:
+                with self._stage('per_bssid'):
+                    self._generate_per_bssid(a, gx, gy, num_x, num_y)
+            if not preview:
+                self._save_manifest(before)
+
+    def _prepare(self, preview=False):
+        """
+        Load the floorplan and survey data, and work out what has to be
+        rendered (see :py:meth:`~.generate`). Tile output is generated right
+        away. Otherwise, returns a ``(tasks, keys)`` tuple of the channel
+        graph rendering tasks to run and the metrics whose heatmaps need to be
+        rendered, and sets ``_grid_data`` to the ``(a, gx, gy, num_x, num_y)``
+        data and grid to interpolate them with.
+        """
+        if self._layout is None:
+            with self._stage('load_image'):
+                self._load_image()
+        scale = 1.0
+        self._previewing = preview
+        if preview and self._tiles_dir is None:
+            scale = min(1.0, PREVIEW_SIZE / float(max(
+                len(self._layout[0]), len(self._layout)
+            )))
+        with self._stage('base_layer'):
+            self._prepare_base_layer(scale)
+        with self._stage('load_data'):
+            a = self.load_data()
+        with self._stage('grid'):
+            num_x, num_y = grid_shape(
+                self._image_width, self._image_height,
+                cell_size=self._grid_cell_size, cells=self._grid_cells,
+                x=a['x'] if self._adaptive_grid else None,
+                y=a['y'] if self._adaptive_grid else None
+            )
+        if self._tiles_dir is not None:
+            if self._per_bssid:
+                logger.warning('Per-BSSID heatmaps are not tiled; skipping')
+            with self._stage('tiles'):
+                self._generate_tiles(a)
+            return None
+        with self._stage('changes'):
+            return self._changed_outputs(preview, a, num_x, num_y)
+
+    def _changed_outputs(self, preview, a, num_x, num_y):
+        """
+        The part of :py:meth:`~._prepare` that works out which outputs
+        changed, and sets up the interpolation grid.
+        """
+        self._load_manifest(num_x, num_y)
+        if preview and num_x * num_y > PREVIEW_GRID_CELLS:
+            num_x, num_y = grid_shape(
+                self._image_width, self._image_height,
+                cells=PREVIEW_GRID_CELLS
+            )
+        tasks = []
+        if self._renderer == 'raster':
+            logger.info('Skipping channel graphs with the raster renderer')
+        elif self._preview or not preview:
+            tasks.extend(
+                ('_plot_channels', args) for args in self._channel_graphs()
+                if self._changed(args[3], tile_hash(
+                    [], [], {}, dict(self._render_params, chart=[
+                        args[0], args[1], args[2], args[4]
+                    ])
+                ))
+            )
         x = np.linspace(0, self._image_width, num_x)
         y = np.linspace(0, self._image_height, num_y)
         gx, gy = np.meshgrid(x, y)
         gx, gy = gx.flatten(), gy.flatten()
-        for k, ptitle in self.graphs.items():
+        keys = [
+            k for k in self.graphs.keys()
+            if self._changed(
+                self._output_name(k),
+                self._heatmap_hash(a, k, self.graphs[k])
+            )
+        ]
+        self._grid_data = (a, gx, gy, num_x, num_y)
+        return tasks, keys
+
+    def _plot_metrics(self, keys):
+        """
+        Interpolate and render the heatmaps of metrics ``keys``, from the
+        data prepared by :py:meth:`~._prepare`; used to split the heatmaps
+        of a survey across tasks in :py:func:`~.generate_batch`.
+        """
+        a, gx, gy, num_x, num_y = self._grid_data
+        with self._stage('interpolate'):
+            grids = self._interpolate(a, gx, gy, num_x, num_y, keys=keys)
+        self._plot_data = (a, grids, num_x, num_y)
+        for key in keys:
+            self._plot_metric(key)
+
+    def _output_name(self, key):
+        """
+        Return the filename of the heatmap or graph ``key``; previews (see
+        :py:meth:`~.generate`) are written with :py:data:`~.PREVIEW_PREFIX`.
+        """
+        prefix = PREVIEW_PREFIX if self._preview else ''
+        return '%s%s_%s.png' % (prefix, key, self._title)
+
+    def _survey_state(self):
+        """
+        Return the size and modification time of the survey file and of
+        the files changes to it are written to before they reach it (the
+        journal, or the SQLite write-ahead log), or None for those that
+        don't exist.
+        """
+        return [
+            _file_state(fname) for fname in (
+                self._title, journal_path(self._title), self._title + '-wal'
+            )
+        ]
+
+    def watch(self, interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE):
+        """
+        Render the heatmaps, then keep watching the survey for changes and
+        re-render those affected by each change, until interrupted. The
+        floorplan, matplotlib and the interpolation code stay loaded in
+        between, and each update first renders a quick
+        :py:meth:`~.generate` ``preview`` and then the full resolution
+        heatmaps (unless the survey changed again in the meantime, or the
+        generator only renders previews).
+
+        :param interval: seconds between checks of the survey file
+        :type interval: float
+        :param debounce: seconds the survey must stay unchanged before it is
+          re-rendered, so that a burst of writes causes only one update
+        :type debounce: float
+        """
+        state = self._survey_state()
+        self.generate()
+        logger.info('Watching %s for changes', self._title)
+        while True:
+            time.sleep(interval)
+            if self._survey_state() == state:
+                continue
+            current = None
+            while current != self._survey_state():
+                current = self._survey_state()
+                time.sleep(debounce)
+            state = current
+            start = time.time()
             try:
+                with self._stage('load_survey'):
+                    self._survey = load_survey(self._title)
+            except (OSError, ValueError):
+                logger.warning(
+                    'Cannot load %s; waiting for the next change',
+                    self._title, exc_info=True
+                )
+                continue
+            if self._tiles_dir is None:
+                self.generate(preview=True)
+                logger.info(
+                    'Rendered preview in %.2f seconds', time.time() - start
+                )
+                if self._preview or self._survey_state() != state:
+                    continue
+            self.generate()
+            logger.info(
+                'Re-rendered %s in %.2f seconds', self._title,
+                time.time() - start
+            )
+
+    def _load_manifest(self, num_x, num_y):
+        """
+        Load the :py:data:`~.OUTPUT_MANIFEST` of the previous run (unless
+        ``force`` was given), and work out the render options that every
+        output depends on: the floorplan image content, grid size and the
+        options that change how heatmaps are drawn.
+        """
+        self._old_manifest = {}
+        if not self._force:
+            self._old_manifest = load_manifest(
+                '.', name=OUTPUT_MANIFEST % self._title
+            )
+        self._manifest = dict(self._old_manifest)
+        self._render_params = {
+            'image': self._image_digest(),
+            'grid': [num_x, num_y],
+            'renderer': self._renderer,
+            'cmap': self._cname,
+            'contours': self._contours,
+            'showpoints': self._showpoints,
+            'hidebssid': self._hidebssid,
+            'interpolation': self._interpolation,
+            'neighbors': self._neighbors,
+        }
+
+    def _image_digest(self):
+        """
+        Return a hash of the contents of the floorplan image file, so that
+        outputs are re-rendered when it is edited in place.
+        """
+        with open(self._image_path, 'rb') as fh:
+            return hashlib.sha256(fh.read()).hexdigest()
+
+    def _heatmap_hash(self, a, key, name):
+        """
+        Return a hash of everything the heatmap of metric ``key`` depends on:
+        the coordinates and values of the points it has values at (including
+        unsurveyed floorplan corners), its color scale range, title and, if
+        they are drawn, the point labels.
+        """
+        x, y, fields = self._interpolation_inputs(a, keys=[key])
+        if key not in fields:
+            return None
+        valid = ~np.isnan(fields[key])
+        params = dict(
+            self._render_params, title=name,
+            range=[float(v) for v in self._value_range(a, key)]
+        )
+        if self._showpoints and not self._hidebssid:
+            params['labels'] = a['ap'][valid[:len(a['ap'])]].tolist()
+        return tile_hash(x[valid], y[valid], {key: fields[key][valid]}, params)
+
+    def _changed(self, fname, digest):
+        """
+        Record that output ``fname`` is now generated from inputs with hash
+        ``digest`` and return whether it needs to be (re-)written, i.e. if it
+        doesn't exist or was last written from different inputs.
+        """
+        self._manifest[fname] = digest
+        if (
+            digest is None or self._old_manifest.get(fname) != digest or
+            not os.path.exists(fname)
+        ):
+            return True
+        logger.info('Skipping %s: inputs unchanged', fname)
+        return False
+
+    def _looks_changed(self, a, key, z, preview):
+        """
+        Return whether the heatmap of metric ``key`` drawn from grid ``z``
+        would look different from the one this generator last drew to the
+        same file, and if so remember ``z`` for the next time. The colors
+        of two grids that differ by no more than half a colormap step are
+        the same, so when a change to the survey (e.g. one new point in
+        :py:meth:`~.watch`) leaves most of a heatmap alone, as it often does
+        for metrics the new point doesn't have or agrees with, the image is
+        not written again. Grids must be identical if contours are drawn,
+        and the points must be the same if they are shown.
+
+        Previews are compared with the last preview instead, and writing one
+        means the full resolution heatmap has to be drawn again.
+        """
+        fname = self._output_name(key)
+        vmin, vmax = self._value_range(a, key)
+        if z is None and vmin != vmax:
+            return True
+        params = dict(
+            self._render_params, range=[float(vmin), float(vmax)],
+            scale=self._scale
+        )
+        if self._showpoints:
+            valid = ~np.isnan(a[key])
+            params['points'] = [
+                a['x'][valid].tolist(), a['y'][valid].tolist(),
+                a[key][valid].tolist(), a['ap'][valid].tolist()
+            ]
+        look = tile_hash([], [], {}, params)
+        old_look, old_z = self._drawn.get((fname, preview), (None, None))
+        if vmin == vmax:
+            same = old_look == look
+        elif old_look != look or old_z is None or old_z.shape != z.shape:
+            same = False
+        else:
+            tolerance = 0.0
+            if self._contours is None:
+                tolerance = (vmax - vmin) / (2.0 * len(self._lut))
+            nan = np.isnan(z)
+            same = bool(
+                np.array_equal(nan, np.isnan(old_z)) and
+                np.all(np.abs(z - old_z)[~nan] <= tolerance)
+            )
+        if same and os.path.exists(fname):
+            logger.info('Skipping %s: heatmap looks the same', fname)
+            if not preview:
+                # the file is as good as written from the current inputs
+                self._old_manifest[fname] = self._manifest[fname]
+            return False
+        self._drawn[(fname, preview)] = (
+            look, None if vmin == vmax else z
+        )
+        if preview:
+            self._drawn.pop((fname, False), None)
+        return True
+
+    def _output_states(self):
+        """
+        Return a dict of the size and modification time of every output in
+        the manifest (None for those that don't exist), for
+        :py:meth:`~._save_manifest` to tell which ones rendering wrote.
+        """
+        return {fname: _file_state(fname) for fname in self._manifest}
+
+    def _save_manifest(self, before):
+        """
+        Write the :py:data:`~.OUTPUT_MANIFEST`, dropping outputs that should
+        have been rendered but weren't (e.g. for lack of data), so they are
+        tried again next time. Outputs are compared to their
+        :py:meth:`~._output_states` ``before`` rendering, rather than to the
+        time rendering started: file times come from a coarser clock, so a
+        file written right away can look older than that.
+        """
+        for fname, digest in list(self._manifest.items()):
+            if digest is None:
+                del self._manifest[fname]
+            elif digest != self._old_manifest.get(fname) and (
+                _file_state(fname) in (None, before.get(fname))
+            ):
+                del self._manifest[fname]
+        save_manifest(
+            '.', self._manifest, name=OUTPUT_MANIFEST % self._title
+        )
+
+    def _bssid_fields(self, a):
+        """
+        Return a ``(fields, names)`` tuple for the ``--per-bssid`` heatmaps:
+        a dict of heatmap key to the signal quality of one AP at each survey
+        point in ``a`` (NaN where it wasn't seen), and a dict of heatmap key
+        to AP name. APs are identified by BSSID, or by name for BSSIDs in the
+        ``--ap-names`` file; where an AP with several BSSIDs was seen more
+        than once at a point, its strongest signal is used.
+        """
+        index = BSSIDIndex(self._survey.scan, ignore_ssids=self._ignore_ssids)
+        # scan results refer to survey points; map them to points in ``a``
+        position = np.full(len(self._survey), -1)
+        position[a['index']] = np.arange(len(a['index']))
+        groups = {}
+        titles = {}
+        for idx, bssid in enumerate(index.bssids.tolist()):
+            name = self._ap_names.get(bssid.upper())
+            if name is None:
+                name = bssid
+                if index.ssids[idx]:
+                    titles[name] = '%s (%s)' % (bssid, index.ssids[idx])
+            groups.setdefault(name, []).append(idx)
+        fields = {}
+        names = {}
+        for name, members in groups.items():
+            values = np.full(len(a['x']), np.nan)
+            for idx in members:
+                points, signal = index.observations(idx)
+                points = position[points]
+                seen = points >= 0
+                np.fmax.at(values, points[seen], signal[seen] + 130)
+            if np.count_nonzero(~np.isnan(values)) < PER_BSSID_MIN_POINTS:
+                continue
+            key = base = 'bssid_%s' % re.sub(r'[^\w.-]+', '_', name).strip('_')
+            suffix = 1
+            while key in fields:
+                suffix += 1
+                key = '%s_%d' % (base, suffix)
+            fields[key] = values
+            names[key] = titles.get(name, name)
+        logger.info(
+            'Found %d APs (%d BSSIDs) in scan results; %d seen at enough '
+            'points for a heatmap', len(groups), len(index), len(fields)
+        )
+        return fields, names
+
+    def _generate_per_bssid(self, a, gx, gy, num_x, num_y):
+        """
+        Render a signal quality heatmap of every AP in the scan results, all
+        on the same color scale: the ``signal_quality`` thresholds if given,
+        or else the range of all APs' signals.
+
+        APs seen at the same set of points share one interpolation (see
+        :py:func:`~.interpolate_fields`) if they end up in the same batch.
+        The heatmaps are interpolated and rendered in batches, each as one
+        rendering task, so with several jobs the interpolation runs in
+        parallel as well; batches are small enough to give every job a share
+        of the work, and never larger than :py:data:`~.PER_BSSID_BATCH`.
+        Returns the number of heatmaps rendered.
+        """
+        if self._survey.scan is None:
+            logger.warning(
+                'Cannot create per-BSSID heatmaps: survey has no scan results'
+            )
+            return 0
+        fields, names = self._bssid_fields(a)
+        if not fields:
+            return 0
+        b = {'x': a['x'], 'y': a['y'], 'ap': a['ap']}
+        b.update(fields)
+        vmin, vmax = self._value_range(
+            {'signal_quality': np.concatenate(list(fields.values()))},
+            'signal_quality'
+        )
+        for key in fields.keys():
+            self.thresholds[key] = {'min': vmin, 'max': vmax}
+        titles = {k: '%s signal quality [%%]' % names[k] for k in fields}
+        fields = {
+            k: v for k, v in fields.items()
+            if self._changed(
+                self._output_name(k),
+                self._heatmap_hash(b, k, titles[k])
+            )
+        }
+        if not fields:
+            return 0
+        # put APs seen at the same points next to each other, so that they
+        # mostly end up in the same batch
+        groups = {}
+        for key, values in fields.items():
+            groups.setdefault(np.isnan(values).tobytes(), []).append(key)
+        keys = [k for group in groups.values() for k in group]
+        size = min(PER_BSSID_BATCH, -(-len(keys) // max(1, self._jobs)))
+        batches = [keys[i:i + size] for i in range(0, len(keys), size)]
+        self._bssid_data = (b, titles, gx, gy, num_x, num_y)
+        try:
+            self._render([('_plot_bssids', (keys,)) for keys in batches])
+        finally:
+            self._bssid_data = None
+        return len(fields)
+
+    def _plot_bssids(self, keys):
+        """
+        Interpolate and render one batch of ``--per-bssid`` heatmaps.
+        """
+        b, titles, gx, gy, num_x, num_y = self._bssid_data
+        with self._stage('interpolate'):
+            grids = self._interpolate(b, gx, gy, num_x, num_y, keys=keys)
+        self._plot_data = (b, grids, num_x, num_y)
+        for key in keys:
+            self._plot_metric(key, titles[key])
+
+    def _generate_tiles(self, a):
+        """
+        Write every metric as a pyramid of :py:data:`~.TILE_SIZE` PNG tiles,
+        in a ``<tiles_dir>/<metric>/<zoom>/<x>/<y>.png`` layout, instead of
+        one image per metric.
+
+        Each tile is interpolated (with the ``local`` method) from only the
+        survey points that can affect it, found with a
+        :py:class:`~.TileIndex`. A hash of those points, their values and the
+        render settings is kept for every tile in a manifest, and tiles whose
+        hash hasn't changed since the last run are not rendered again.
+        """
+        if self._interpolation != 'local':
+            logger.info('Tiles always use the local interpolation method')
+        x, y, fields = self._interpolation_inputs(a)
+        ranges = {k: self._value_range(a, k) for k in fields.keys()}
+        pyramid = TilePyramid(len(self._layout[0]), len(self._layout))
+        index = TileIndex(x, y, neighbors=self._neighbors)
+        params = {
+            'cmap': self._cname,
+            'neighbors': self._neighbors,
+            'image': [
+                self._image_digest(), pyramid.width, pyramid.height
+            ],
+            'ranges': {k: [float(v) for v in r] for k, r in ranges.items()},
+        }
+        old_manifest = load_manifest(self._tiles_dir)
+        manifest = {}
+        tasks = []
+        for tile in pyramid.tiles():
+            extent, _ = pyramid.extent(*tile)
+            idx = index.neighborhood(extent)
+            name = '%d/%d/%d' % tile
+            manifest[name] = tile_hash(
+                x[idx], y[idx], {k: v[idx] for k, v in fields.items()},
+                params
+            )
+            if manifest[name] == old_manifest.get(name) and all(
+                os.path.exists(tile_path(self._tiles_dir, k, tile))
+                for k in fields.keys()
+            ):
+                continue
+            tasks.append(('_render_tile', (tile, idx)))
+        logger.info(
+            'Rendering %d of %d tiles (zoom levels 0-%d) to %s', len(tasks),
+            len(manifest), pyramid.max_zoom, self._tiles_dir
+        )
+        self._tile_data = (pyramid, x, y, fields, ranges)
+        self._render(tasks)
+        save_manifest(self._tiles_dir, manifest)
+
+    def _render_tile(self, tile, idx):
+        """
+        Interpolate, colorize and write one ``(zoom, x, y)`` tile of every
+        metric from the survey points at indices ``idx``.
+        """
+        pyramid, x, y, fields, ranges = self._tile_data
+        (x0, y0, x1, y1), (width, height) = pyramid.extent(*tile)
+        # evaluate at the center of each tile pixel
+        gx, gy = np.meshgrid(
+            x0 + (np.arange(width) + 0.5) * (x1 - x0) / width,
+            y0 + (np.arange(height) + 0.5) * (y1 - y0) / height
+        )
+        with self._stage('tile_interpolate'):
+            grids = interpolate_fields(
+                'local', x[idx], y[idx],
+                {k: v[idx] for k, v in fields.items()},
+                gx.flatten(), gy.flatten(), neighbors=self._neighbors
+            )
+        base = resize(
+            self._base[
+                int(y0):int(np.ceil(y1)), int(x0):int(np.ceil(x1))
+            ], width, height, resample=Image.BICUBIC
+        )
+        for k, z in grids.items():
+            vmin, vmax = ranges[k]
+            with self._stage('tile_write', k):
+                write_tile(
+                    tile_path(self._tiles_dir, k, tile),
+                    composite(base, z.reshape((height, width)), vmin, vmax,
+                              self._lut),
+                    tile_size=pyramid.tile_size
+                )
+
+    def _render(self, tasks):
+        """
+        Run a list of ``(method name, args)`` plotting tasks, either serially
+        or, if more than one job was requested, in a pool of forked worker
+        processes.
+        """
+        global _WORKER_GENERATOR
+        if self._jobs < 2 or len(tasks) < 2:
+            for method, args in tasks:
+                getattr(self, method)(*args)
+            return
+        logger.info('Rendering %d plots with %d jobs', len(tasks), self._jobs)
+        _WORKER_GENERATOR = self
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(self._jobs, len(tasks)),
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=_init_worker
+            ) as pool:
+                futures = [
+                    pool.submit(_render_worker, method, args)
+                    for method, args in tasks
+                ]
+                for future in futures:
+                    self._profiler.extend(future.result())
+        finally:
+            _WORKER_GENERATOR = None
+
+    def _plot_metric(self, key, name=None):
+        a, grids, num_x, num_y = self._plot_data
+        if name is None:
+            name = self.graphs[key]
+        try:
+            with self._stage('plot', key):
                 self._plot(
-                    a, k, '%s - %s' % (self._title, ptitle), gx, gy, num_x, num_y
+                    a, key, '%s - %s' % (self._title, name),
+                    grids.get(key), num_x, num_y
                 )
-            except:
-                logger.warning(
-                    "Cannot create %s plot: insufficient data",
-                    k,
-                    exc_info=True,
+        except:
+            logger.warning(
+                "Cannot create %s plot: insufficient data",
+                key,
+                exc_info=True,
+            )
+
+    def _interpolate(self, a, gx, gy, num_x, num_y, keys=None):
+        """
+        Interpolate every plottable metric (or just ``keys``) onto the grid
+        in one pass, so the interpolation for the survey coordinates is only
+        set up once rather than once per metric. Returns a dict of metric
+        name to a ``(num_y, num_x)`` array.
+
+        If a grid cache is configured, grids found in it are not interpolated
+        again, and newly interpolated grids are added to it.
+        """
+        x, y, fields = self._interpolation_inputs(a, keys=keys)
+        result = {}
+        keys = {}
+        if self._cache is not None:
+            params = {}
+            if self._interpolation == 'local':
+                params['neighbors'] = self._neighbors
+            for k in list(fields.keys()):
+                keys[k] = self._cache.key(
+                    x, y, fields[k],
+                    (num_x, num_y, self._image_width, self._image_height),
+                    self._interpolation, **params
                 )
+                z = self._cache.get(keys[k])
+                if z is not None and z.shape == (num_y, num_x):
+                    logger.info('Using cached grid for %s', k)
+                    result[k] = z
+                    del fields[k]
+        try:
+            grids = interpolate_fields(
+                self._interpolation, x, y, fields, gx, gy,
+                neighbors=self._neighbors
+            )
+        except Exception:
+            logger.warning('Cannot interpolate survey data', exc_info=True)
+            return result
+        for k, z in grids.items():
+            result[k] = z.reshape((num_y, num_x))
+            if self._cache is not None:
+                self._cache.put(keys[k], result[k])
+        return result
 
     def _channel_to_signal(self):
         """
         Return a dictionary of 802.11 channel number to combined "quality" value
         for all APs seen on the given channel. This includes interpolation to
-        overlapping channels based on channel width of each channel.
-        """
-        # build a dict of frequency (GHz) to list of quality values
-        channels = defaultdict(list)
-        for row in self._data['survey_points']:
-            for scan in row['result']['scan_results']:
-                ssid = row['result']['scan_results'][scan]['ssid']
-                if ssid in self._ignore_ssids:
-                    continue
-                freq = row['result']['scan_results'][scan]['frequency'] / 1e6
-                channels[int(freq)].append(
-                    row['result']['scan_results'][scan]['signal_mbm'] + 100
-                )
-        # collapse down to dict of frequency (GHz) to average quality (float)
-        for freq in channels.keys():
-            channels[freq] = sum(channels[freq]) / len(channels[freq])
-        # build the full dict of frequency to quality for all channels
-        freq_qual = {x: 0.0 for x in WIFI_CHANNELS.keys()}
-        # then, update to account for full bandwidth of each channel
-        for freq, qual in channels.items():
-            freq_qual[freq] += qual
-            for spread in range(
-                int(freq - (WIFI_CHANNELS[freq][1] / 2.0)),
-                int(freq + (WIFI_CHANNELS[freq][1] / 2.0) + 1.0)
-            ):
-                if spread in freq_qual and spread != freq:
-                    freq_qual[spread] += qual
+        overlapping channels based on channel width of each channel. Scan
+        results on frequencies that aren't in :py:data:`~.WIFI_CHANNELS` are
+        skipped with a warning.
+        """
+        scan = self._survey.scan
+        if scan is None:
+            raise KeyError('scan_results')
+        freqs = (np.asarray(scan['frequency']) / 1e6).astype(int)
+        quality = np.asarray(scan['signal_mbm']) + 100
+        if self._ignore_ssids:
+            keep = ~np.isin(scan['ssid'], self._ignore_ssids)
+            freqs = freqs[keep]
+            quality = quality[keep]
+        # index of each scan result's channel in CHANNEL_FREQUENCIES
+        idx = np.searchsorted(CHANNEL_FREQUENCIES, freqs)
+        idx[idx == len(CHANNEL_FREQUENCIES)] = 0
+        unknown = CHANNEL_FREQUENCIES[idx] != freqs
+        if unknown.any():
+            logger.warning(
+                'Skipping %d scan results on unknown frequencies: %s MHz',
+                unknown.sum(), sorted(set(freqs[unknown].tolist()))
+            )
+            idx = idx[~unknown]
+            quality = quality[~unknown]
+        # average quality on each channel
+        counts = np.bincount(idx, minlength=len(CHANNEL_FREQUENCIES))
+        sums = np.bincount(
+            idx, weights=quality, minlength=len(CHANNEL_FREQUENCIES)
+        )
+        mean = np.divide(
+            sums, counts, out=np.zeros(len(sums)), where=counts > 0
+        )
+        # then spread it over the full bandwidth of each channel
+        freq_qual = CHANNEL_OVERLAP @ mean
         return {
-            WIFI_CHANNELS[x][0]: freq_qual[x] for x in freq_qual.keys()
+            WIFI_CHANNELS[f][0]: q
+            for f, q in zip(CHANNEL_FREQUENCIES.tolist(), freq_qual.tolist())
         }
 
     def _plot_channels(self, names, values, title, fname, ticks):
-        pp.rcParams['figure.figsize'] = (
-            self._image_width / 300, self._image_height / 300
-        )
-        fig, ax = pp.subplots()
-        ax.set_title(title)
-        ax.bar(names, values)
-        ax.set_xlabel('Channel')
-        ax.set_ylabel('Mean Quality')
-        ax.set_xticks(ticks)
-        # ax.set_xticklabels(names)
-        logger.info('Writing plot to: %s', fname)
-        pp.savefig(fname, dpi=300)
-        pp.close('all')
+        import matplotlib.pyplot as pp
+        with self._stage('channels', title):
+            fig, ax = self._new_figure()
+            ax.set_title(title)
+            ax.bar(names, values)
+            ax.set_xlabel('Channel')
+            ax.set_ylabel('Mean Quality')
+            ax.set_xticks(ticks)
+            # ax.set_xticklabels(names)
+            logger.info('Writing plot to: %s', fname)
+            self._savefig(fname)
+            pp.close('all')
+
+    def _savefig(self, fname):
+        """
+        Save the current figure to ``fname`` at the output scale. Previews
+        favor PNG encoding speed over file size, like the ``raster``
+        renderer's :py:func:`~.write_png`.
+        """
+        import matplotlib.pyplot as pp
+        kwargs = {}
+        if self._previewing:
+            kwargs['pil_kwargs'] = {'compress_level': 1}
+        # not pp.savefig(), which draws the whole figure again afterwards
+        pp.gcf().savefig(fname, dpi=300 * self._scale, **kwargs)
 
     def _channel_graphs(self):
+        """
+        Return a list of argument tuples for :py:meth:`~._plot_channels`, one
+        per channel utilization graph; empty if the survey has no scan data.
+        """
         try:
-            c2s = self._channel_to_signal()
+            with self._stage('channel_to_signal'):
+                c2s = self._channel_to_signal()
         except KeyError:
-            return
+            return []
         names24 = []
         values24 = []
         names5 = []
@@ -361,21 +1218,26 @@ class HeatMapGenerator(object):
             else:
                 names5.append(ch)
                 values5.append(val)
-        self._plot_channels(
-            names24, values24, '2.4GHz Channel Utilization',
-            '%s_%s.png' % ('channels24', self._title),
-            names24
-        )
         ticks5 = [
             38, 46, 54, 62, 102, 110, 118, 126, 134, 142, 151, 159
         ]
-        self._plot_channels(
-            names5, values5, '5GHz Channel Utilization',
-            '%s_%s.png' % ('channels5', self._title),
-            ticks5
-        )
+        return [
+            (
+                names24, values24, '2.4GHz Channel Utilization',
+                self._output_name('channels24'),
+                names24
+            ),
+            (
+                names5, values5, '5GHz Channel Utilization',
+                self._output_name('channels5'),
+                ticks5
+            ),
+        ]
 
     def _add_inner_title(self, ax, title, loc, size=None, **kwargs):
+        import matplotlib.pyplot as pp
+        from matplotlib.offsetbox import AnchoredText
+        from matplotlib.patheffects import withStroke
         if size is None:
             size = dict(size=pp.rcParams['legend.fontsize'])
         at = AnchoredText(
@@ -389,92 +1251,349 @@ class HeatMapGenerator(object):
         )
         return at
 
-    def _plot(self, a, key, title, gx, gy, num_x, num_y):
-        if key not in a:
-            logger.info("Skipping {} due to insufficient data".format(key))
-            return
-        if not len(a['x']) == len(a['y']) == len(a[key]):
-            logger.info("Skipping {} because data has holes".format(key))
+    def _plot_labels(self, ax, x, y, labels, fontsize):
+        """
+        Label survey points with their AP name. Points within the same
+        :py:data:`~.LABEL_CELL_SIZE` cell that share a label would just draw
+        the same text on top of each other, so only the first of them is
+        labeled; this bounds the number of text artists by floorplan area
+        rather than survey size.
+        """
+        if not len(labels):
             return
-        logger.debug('Plotting: %s', key)
-        pp.rcParams['figure.figsize'] = (
-            self._image_width / 300, self._image_height / 300
+        names, label_ids = np.unique(
+            np.asarray(labels, dtype=str), return_inverse=True
         )
-        fig, ax = pp.subplots()
-        ax.set_title(title)
+        cells = np.column_stack((
+            (x // LABEL_CELL_SIZE).astype(int),
+            (y // LABEL_CELL_SIZE).astype(int),
+            label_ids.ravel()
+        ))
+        _, first = np.unique(cells, axis=0, return_index=True)
+        first.sort()
+        logger.debug('Drawing %d of %d point labels', len(first), len(x))
+        for i in first:
+            ax.text(
+                x[i], y[i], names[label_ids.ravel()[i]], fontsize=fontsize,
+                horizontalalignment='center'
+            )
+
+    def _value_range(self, a, key):
+        """
+        Return the ``(vmin, vmax)`` color scale range of a metric, from the
+        thresholds file if given there or else from the data.
+        """
         if 'min' in self.thresholds.get(key, {}):
             vmin = self.thresholds[key]['min']
             logger.debug('Using min threshold from thresholds: %s', vmin)
         else:
-            vmin = min(a[key])
+            vmin = np.nanmin(a[key])
             logger.debug('Using calculated min threshold: %s', vmin)
         if 'max' in self.thresholds.get(key, {}):
             vmax = self.thresholds[key]['max']
             logger.debug('Using max threshold from thresholds: %s', vmax)
         else:
-            vmax = max(a[key])
+            vmax = np.nanmax(a[key])
             logger.debug('Using calculated max threshold: %s', vmax)
         logger.info("{} has range [{},{}]".format(key, vmin, vmax))
-        # Interpolate the data only if there is something to interpolate
-        if vmin != vmax:
-            rbf = Rbf(
-                a['x'], a['y'], a[key], function='linear'
+        return vmin, vmax
+
+    def _plot_raster(self, a, key, z, vmin, vmax):
+        """
+        Render a heatmap straight to a PNG with NumPy and Pillow, skipping
+        matplotlib entirely; used by the ``raster`` renderer. Produces the
+        same heatmap colors as the matplotlib renderer, but without a title,
+        contours or point labels.
+        """
+        points = None
+        colors = None
+        if self._showpoints:
+            valid = ~np.isnan(a[key])
+            points = np.column_stack(
+                (a['x'][valid], a['y'][valid])
+            ) * (self._base.shape[1] / float(self._image_width))
+            colors = self._lut[lut_indices(
+                a[key][valid], vmin, vmax, len(self._lut)
+            )]
+        fname = self._output_name(key)
+        with self._stage('composite', key):
+            image = render_heatmap(
+                self._base, z, vmin, vmax, self._lut, points=points,
+                point_colors=colors
             )
-            z = rbf(gx, gy)
-            z = z.reshape((num_y, num_x))
+        logger.info('Writing plot to: %s', fname)
+        with self._stage('write_png', key):
+            write_png(fname, image)
+
+    def _plot(self, a, key, title, z, num_x, num_y):
+        if np.isnan(a[key]).all():
+            logger.info("Skipping {} due to insufficient data".format(key))
+            return
+        logger.debug('Plotting: %s', key)
+        vmin, vmax = self._value_range(a, key)
+        # Use the interpolated data only if there is a range to show
+        if vmin != vmax:
+            if z is None:
+                logger.warning(
+                    "Cannot create %s plot: no interpolated data", key
+                )
+                return
         else:
             # Uniform array with the same color everywhere
             # (avoids interpolation artifacts)
             z = numpy.ones((num_y, num_x))*vmin
-        # Render the interpolated data to the plot
-        ax.axis('off')
-        # begin color mapping
-        norm = matplotlib.colors.Normalize(vmin=vmin, vmax=vmax, clip=True)
-        mapper = cm.ScalarMappable(norm=norm, cmap=self._cmap)
-        # end color mapping
-        image = ax.imshow(
-            z,
-            extent=(0, self._image_width, self._image_height, 0),
-            alpha=0.5, zorder=100,
-            cmap=self._cmap, vmin=vmin, vmax=vmax
-        )
+        if self._renderer == 'raster':
+            self._plot_raster(a, key, z, vmin, vmax)
+            return
+        import matplotlib
+        import matplotlib.cm as cm
+        import matplotlib.pyplot as pp
+        from matplotlib.font_manager import FontManager
+        with self._stage('figure', key):
+            fig, ax = self._new_figure()
+            ax.set_title(title)
+            # Render the interpolated data to the plot
+            ax.axis('off')
+            # begin color mapping
+            norm = matplotlib.colors.Normalize(
+                vmin=vmin, vmax=vmax, clip=True
+            )
+            mapper = cm.ScalarMappable(norm=norm, cmap=self._cmap)
+            # end color mapping
+        # Draw the heatmap composited onto the floorplan base layer
+        with self._stage('composite', key):
+            overlay = composite(self._base, z, vmin, vmax, self._lut)
+        with self._stage('imshow', key):
+            ax.imshow(
+                overlay, extent=self._extent, interpolation='nearest',
+                zorder=1
+            )
+            # The raw heatmap is never drawn, it only provides the color bar
+            image = ax.imshow(
+                z,
+                extent=(0, self._image_width, self._image_height, 0),
+                alpha=0.5, zorder=100, visible=False,
+                cmap=self._cmap, vmin=vmin, vmax=vmax
+            )
 
         # Draw contours if requested and meaningful in this plot
         if self._contours is not None and vmin != vmax:
-            CS = ax.contour(z, colors='k', linewidths=1, levels=self._contours,
-                            extent=(0, self._image_width, self._image_height, 0),
-                            alpha=0.3, zorder=150, origin='upper')
-            ax.clabel(CS, inline=1, fontsize=6)
-        cbar = fig.colorbar(image)
+            with self._stage('contour', key):
+                CS = ax.contour(
+                    z, colors='k', linewidths=1, levels=self._contours,
+                    extent=(0, self._image_width, self._image_height, 0),
+                    alpha=0.3, zorder=150, origin='upper'
+                )
+                ax.clabel(CS, inline=1, fontsize=6)
+        with self._stage('colorbar', key):
+            cbar = fig.colorbar(image)
 
-        # Print only one ytick label when there is only one value to be shown
-        if vmin == vmax:
-            cbar.set_ticks([vmin])
+            # Print only one ytick label when there is only one value to be
+            # shown
+            if vmin == vmax:
+                cbar.set_ticks([vmin])
 
-        # Draw floorplan itself to the lowest layer with full opacity
-        ax.imshow(self._layout, interpolation='bicubic', zorder=1, alpha=1)
         labelsize = FontManager.get_default_size() * 0.4
         if(self._showpoints):
             # begin plotting points
-            for idx in range(0, len(a['x'])):
-                if (a['x'][idx], a['y'][idx]) in self._corners:
-                    continue
-                ax.plot(
-                    a['x'][idx], a['y'][idx], zorder=200,
-                    marker='o', markeredgecolor='black', markeredgewidth=1,
-                    markerfacecolor=mapper.to_rgba(a[key][idx]), markersize=6
+            with self._stage('points', key):
+                valid = ~np.isnan(a[key])
+                px = a['x'][valid]
+                py = a['y'][valid]
+                ax.scatter(
+                    px, py, zorder=200,
+                    marker='o', edgecolors='black', linewidths=1,
+                    c=mapper.to_rgba(a[key][valid]), s=36
                 )
                 if not self._hidebssid:
-                    ax.text(
-                        a['x'][idx], a['y'][idx] - 30,
-                        a['ap'][idx], fontsize=labelsize,
-                        horizontalalignment='center'
+                    self._plot_labels(
+                        ax, px, py - 30, a['ap'][valid], labelsize
                     )
             # end plotting points
-        fname = '%s_%s.png' % (key, self._title)
+        fname = self._output_name(key)
         logger.info('Writing plot to: %s', fname)
-        pp.savefig(fname, dpi=300)
-        pp.close('all')
+        with self._stage('savefig', key):
+            self._savefig(fname)
+            pp.close('all')
+
+
+def _file_state(fname):
+    """
+    Return the size and modification time of file ``fname``, or None if it
+    doesn't exist.
+    """
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _init_worker():
+    # never try to open a GUI backend from a worker process; this switches
+    # pyplot's backend if it was already imported
+    import matplotlib
+    matplotlib.use('agg')
+
+
+def _render_worker(method, args):
+    """run one rendering task; return its profile records"""
+    profiler = _WORKER_GENERATOR._profiler
+    profiler.begin_task()
+    getattr(_WORKER_GENERATOR, method)(*args)
+    return profiler.end_task()
+
+
+def _batch_worker(idx, method, args):
+    """
+    run one rendering task of survey ``idx``; return its duration and
+    profile records
+    """
+    profiler = _WORKER_BATCH[idx]._profiler
+    profiler.begin_task()
+    start = time.time()
+    getattr(_WORKER_BATCH[idx], method)(*args)
+    return time.time() - start, profiler.end_task()
+
+
+def generate_batch(image_path, titles, showpoints, cname, contours, **kwargs):
+    """
+    Render the heatmaps of several surveys in one process, with the same
+    options. Each floorplan image is only decoded (and resampled) once, no
+    matter how many surveys use it, and the heatmaps of all surveys are
+    rendered by a single pool of ``jobs`` worker processes: one task per
+    survey, or, if there are fewer surveys than jobs, with each survey's
+    metrics split across several tasks.
+
+    The arguments are those of :py:class:`~.HeatMapGenerator`, except for
+    ``titles``, a list of survey titles. Surveys that cannot be loaded, or
+    whose floorplan cannot be, are logged and skipped, and the others are
+    still rendered.
+
+    :return: one dict per survey with its ``title``, number of ``points``,
+      number of outputs ``rendered`` and the seconds spent on loading and
+      preparing it (``load``) and on rendering (``render``; summed over
+      tasks, so this can exceed the wall time); surveys that were skipped
+      have the reason in ``error``
+    :rtype: list
+    """
+    global _WORKER_BATCH
+    jobs = kwargs.get('jobs', 1)
+    kwargs['images'] = {}
+    generators = []
+    timings = []
+    pending = {}
+    for title in titles:
+        start = time.time()
+        try:
+            gen = HeatMapGenerator(
+                image_path, title, showpoints, cname, contours, **kwargs
+            )
+            prepared = gen._prepare(preview=gen._preview)
+        except (SurveyError, OSError) as ex:
+            logger.error('Skipping survey %s: %s', title, ex)
+            generators.append(None)
+            timings.append({
+                'title': title, 'points': 0, 'rendered': 0,
+                'load': time.time() - start, 'render': 0.0, 'error': str(ex)
+            })
+            continue
+        generators.append(gen)
+        timings.append({
+            'title': gen._title, 'points': len(gen._survey), 'rendered': 0,
+            'load': time.time() - start, 'render': 0.0
+        })
+        if prepared is not None:
+            pending[len(generators) - 1] = prepared
+    tasks = []
+    splits = -(-jobs // max(1, len(pending)))
+    for idx, (channel_tasks, keys) in pending.items():
+        tasks.extend((idx, method, args) for method, args in channel_tasks)
+        num = max(1, min(len(keys), splits))
+        tasks.extend(
+            (idx, '_plot_metrics', (keys[i::num],))
+            for i in range(num) if keys[i::num]
+        )
+        timings[idx]['rendered'] = len(channel_tasks) + len(keys)
+    logger.info(
+        'Rendering %d surveys in %d tasks with %d jobs', len(pending),
+        len(tasks), jobs
+    )
+    before = {idx: generators[idx]._output_states() for idx in pending}
+    profiler = kwargs.get('profiler') or StageProfiler(enabled=False)
+    _WORKER_BATCH = generators
+    try:
+        with profiler.stage('render'):
+            if jobs < 2 or len(tasks) < 2:
+                results = [_batch_worker(*task) for task in tasks]
+            else:
+                with ProcessPoolExecutor(
+                    max_workers=min(jobs, len(tasks)),
+                    mp_context=multiprocessing.get_context('fork'),
+                    initializer=_init_worker
+                ) as pool:
+                    results = list(pool.map(_batch_worker, *zip(*tasks)))
+                for _, records in results:
+                    profiler.extend(records)
+    finally:
+        _WORKER_BATCH = None
+    for (idx, _, _), (elapsed, _) in zip(tasks, results):
+        timings[idx]['render'] += elapsed
+    for idx in pending.keys():
+        gen = generators[idx]
+        if gen._per_bssid:
+            bssid_start = time.time()
+            with gen._stage('per_bssid'):
+                timings[idx]['rendered'] += gen._generate_per_bssid(
+                    *gen._grid_data
+                )
+            timings[idx]['render'] += time.time() - bssid_start
+        if not gen._preview:
+            gen._save_manifest(before[idx])
+    return timings
+
+
+def format_timings(timings):
+    """Format the result of :py:func:`~.generate_batch` as a table."""
+    width = max([len(t['title']) for t in timings] + [6])
+    lines = ['%-*s  %8s  %8s  %8s  %8s' % (
+        width, 'survey', 'points', 'rendered', 'load', 'render'
+    )]
+    for t in timings:
+        if 'error' in t:
+            lines.append('%-*s  failed: %s' % (width, t['title'], t['error']))
+            continue
+        lines.append('%-*s  %8d  %8d  %8.2f  %8.2f' % (
+            width, t['title'], t['points'], t['rendered'], t['load'],
+            t['render']
+        ))
+    return '\n'.join(lines)
+
+
+def expand_titles(patterns):
+    """
+    Return the survey titles given on the command line, with any glob
+    patterns replaced by the survey files they match (see
+    :py:func:`~.is_survey_file`); other files, such as thresholds, are
+    skipped.
+    """
+    titles = []
+    for pattern in patterns:
+        if not any(c in pattern for c in '*?['):
+            titles.append(pattern)
+            continue
+        matches = []
+        for fname in sorted(glob.glob(pattern)):
+            if is_survey_file(fname):
+                matches.append(fname)
+            else:
+                logger.debug('Skipping %s: not a survey file', fname)
+        if not matches:
+            logger.warning('No survey files match %s', pattern)
+        titles.extend(matches)
+    if not titles:
+        raise SystemExit('No surveys to render')
+    return titles
 
 
 def parse_args(argv):
@@ -506,13 +1625,112 @@ def parse_args(argv):
     p.add_argument('-p', '--picture', dest='IMAGE', type=str, action='store',
                    default=None, help='Path to background image')
     p.add_argument(
-        'TITLE', type=str, help='Title for survey (and data filename)'
+        'TITLE', type=str, nargs='+',
+        help='Title for survey (and data filename). Several titles, or a '
+             'quoted glob pattern matching survey files, render all of those '
+             'surveys in one process'
     )
+    p.add_argument('--store', dest='store', action='store', type=str,
+                   choices=sorted(STORES.keys()), default=None,
+                   help='Format of the survey file to read. Default is '
+                        'determined by the TITLE extension, or the file '
+                        'that exists for it')
     p.add_argument('-s', '--show-points', dest='showpoints', action='count',
                    default=0, help='show measurement points in file')
     p.add_argument('-H', '--hide-bssid', dest='hidebssid', action='store_true',
                    default=False, help='Hide the default point information')
+    p.add_argument('--interpolation', dest='interpolation', action='store',
+                   choices=INTERPOLATION_METHODS, default='rbf',
+                   help='Interpolation method. "rbf" (default) fits a global '
+                        'radial basis function through every point; "local" '
+                        'only uses the nearest points of each grid cell and '
+                        'is much faster for surveys with thousands of points')
+    p.add_argument('--neighbors', dest='neighbors', action='store', type=int,
+                   default=DEFAULT_NEIGHBORS,
+                   help='Number of nearest points used by the "local" '
+                        'interpolation method (default: %(default)s)')
+    grid = p.add_mutually_exclusive_group()
+    grid.add_argument('--grid-cell-size', dest='grid_cell_size',
+                      action='store', type=float, default=None,
+                      help='Size of one interpolation grid cell, in '
+                           'floorplan pixels (default: 4)')
+    grid.add_argument('--grid-cells', dest='grid_cells', action='store',
+                      type=int, default=None,
+                      help='Target total number of interpolation grid '
+                           'cells, regardless of floorplan size')
+    grid.add_argument('--adaptive-grid', dest='adaptive_grid',
+                      action='store_true', default=False,
+                      help='Choose the interpolation grid resolution from '
+                           'the spacing of the survey points')
+    p.add_argument('--per-bssid', dest='per_bssid', action='store_true',
+                   default=False,
+                   help='Also generate a signal quality heatmap for every '
+                        'AP in the scan results (from wifi-survey --scan); '
+                        'BSSIDs given the same name in --ap-names are '
+                        'combined into one heatmap')
+    p.add_argument('--force', dest='force', action='store_true',
+                   default=False,
+                   help='Re-render every heatmap and graph, even those '
+                        'whose inputs have not changed since the last run')
+    p.add_argument('--watch', dest='watch', action='store_true',
+                   default=False,
+                   help='Keep running and re-render the heatmaps affected '
+                        'by each change to the survey file, first as a '
+                        'coarse preview and then at full resolution')
+    p.add_argument('--preview', dest='preview', action='store_true',
+                   default=False,
+                   help='Quickly render every heatmap at a small size, on '
+                        'a coarse interpolation grid, to preview_*.png '
+                        'files, e.g. to try out colormaps, thresholds and '
+                        'contours; the full resolution images are left '
+                        'alone')
+    p.add_argument('-r', '--renderer', dest='renderer', action='store',
+                   choices=RENDERERS, default=None,
+                   help='Heatmap renderer. "raster" writes just the '
+                        'floorplan, heatmap and a color bar, without '
+                        'matplotlib; it is much faster but has no titles, '
+                        'contours, point labels or channel graphs. Default '
+                        'is "raster" with --preview or --watch unless '
+                        'contours are requested, otherwise "matplotlib"')
+    p.add_argument('--tiles', dest='tiles_dir', action='store', type=str,
+                   default=None,
+                   help='Instead of one image per metric, write a pyramid '
+                        'of 256x256 pixel tiles at several zoom levels to '
+                        'this directory; only tiles near changed points are '
+                        're-rendered on later runs')
+    p.add_argument('--cache-dir', dest='cache_dir', action='store',
+                   type=str, default=None,
+                   help='Directory to cache interpolated grids in, so that '
+                        're-rendering the same survey (i.e. with different '
+                        'colors, contours or thresholds) skips interpolation')
+    p.add_argument('--cache-size', dest='cache_size', action='store',
+                   type=int, default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+                   help='Maximum size of the grid cache in MiB; least '
+                        'recently used grids are removed beyond this '
+                        '(default: %(default)s)')
+    p.add_argument('-j', '--jobs', dest='jobs', action='store', type=int,
+                   default=1,
+                   help='Number of plots to render in parallel worker '
+                        'processes (default: %(default)s)')
+    p.add_argument('--profile', dest='profile', action='store', type=str,
+                   default=None, metavar='REPORT',
+                   help='Record the wall time, CPU time and peak memory use '
+                        'of each stage of rendering, and of each metric; '
+                        'print them as a table and write them to the JSON '
+                        'file REPORT')
+    p.add_argument('--profile-stats', dest='profile_stats', action='store',
+                   type=str, default=None, metavar='DIR',
+                   help='With --profile, also write cProfile statistics of '
+                        'each stage to a file in DIR, for use with pstats')
     args = p.parse_args(argv)
+    if args.profile_stats is not None and args.profile is None:
+        p.error('--profile-stats requires --profile')
+    if args.preview and args.tiles_dir is not None:
+        p.error('--preview cannot be used with --tiles')
+    if args.renderer is None:
+        args.renderer = 'matplotlib'
+        if (args.preview or args.watch) and args.N is None:
+            args.renderer = 'raster'
     return args
 
 
@@ -556,10 +1774,57 @@ def main():
 
     showpoints = True if args.showpoints > 0 else False
 
-    HeatMapGenerator(
-        args.IMAGE, args.TITLE, showpoints, args.CNAME, args.N,
-        ignore_ssids=args.ignore, aps=args.aps, thresholds=args.thresholds, hidebssid=args.hidebssid
-    ).generate()
+    kwargs = dict(
+        ignore_ssids=args.ignore, aps=args.aps, thresholds=args.thresholds,
+        hidebssid=args.hidebssid, interpolation=args.interpolation,
+        neighbors=args.neighbors, jobs=args.jobs, cache_dir=args.cache_dir,
+        cache_size=args.cache_size * 1024 * 1024, renderer=args.renderer,
+        grid_cell_size=args.grid_cell_size, grid_cells=args.grid_cells,
+        adaptive_grid=args.adaptive_grid, tiles_dir=args.tiles_dir,
+        store=args.store, per_bssid=args.per_bssid, force=args.force,
+        preview=args.preview
+    )
+    profiler = None
+    if args.profile is not None:
+        profiler = StageProfiler(stats_dir=args.profile_stats)
+        kwargs['profiler'] = profiler
+    titles = expand_titles(args.TITLE)
+    try:
+        if len(titles) > 1:
+            if args.watch:
+                raise SystemExit('--watch only supports a single survey')
+            start = time.time()
+            timings = generate_batch(
+                args.IMAGE, titles, showpoints, args.CNAME, args.N, **kwargs
+            )
+            print(format_timings(timings))
+            failed = len([t for t in timings if 'error' in t])
+            print('Rendered %d surveys in %.2f seconds' % (
+                len(timings) - failed, time.time() - start
+            ))
+            if failed:
+                raise SystemExit('%d of %d surveys failed' % (
+                    failed, len(timings)
+                ))
+            return
+        try:
+            generator = HeatMapGenerator(
+                args.IMAGE, titles[0], showpoints, args.CNAME, args.N,
+                **kwargs
+            )
+        except SurveyError as ex:
+            raise SystemExit(str(ex))
+        if not args.watch:
+            generator.generate()
+            return
+        try:
+            generator.watch()
+        except KeyboardInterrupt:
+            pass
+    finally:
+        if profiler is not None and profiler.records:
+            profiler.write_report(args.profile)
+            print(format_profile(profiler.summary()))
 
 
 if __name__ == '__main__':
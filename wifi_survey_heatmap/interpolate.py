@@ -0,0 +1,302 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import logging
+
+import numpy as np
+
+# scipy is only imported where it is used, as importing it takes longer than
+# the rest of wifi-heatmap's startup together.
+
+logger = logging.getLogger(__name__)
+
+#: Interpolation methods selectable with ``wifi-heatmap --interpolation``.
+#: ``rbf`` is a global linear radial basis function fit over every survey
+#: point; it solves a dense NxN system and evaluates an NxG kernel matrix, so
+#: it is only practical for a few hundred points. ``local`` uses a KD-tree to
+#: find the nearest survey points of each grid cell and blends them with a
+#: compactly-supported kernel, which scales roughly as N log N.
+INTERPOLATION_METHODS = ['rbf', 'local']
+
+#: Default number of nearest survey points used by the ``local`` method.
+DEFAULT_NEIGHBORS = 16
+
+#: Default size, in floorplan pixels, of one interpolation grid cell.
+DEFAULT_CELL_SIZE = 4
+
+#: With an adaptive grid, the number of grid cells spanning the typical
+#: (median) distance between neighbouring survey points.
+ADAPTIVE_CELLS_PER_SPACING = 4
+
+#: Bounds on the adaptive grid: at least this many cells along the longer
+#: side of the floorplan, and no more than this many cells in total.
+ADAPTIVE_MIN_CELLS_ACROSS = 100
+ADAPTIVE_MAX_CELLS = 1000000
+
+#: Upper bound on the number of kernel matrix elements evaluated at once when
+#: applying the ``rbf`` method to the grid (~32 MiB of float64).
+RBF_CHUNK_ELEMENTS = 4 * 1024 * 1024
+
+
+def interpolate(method, x, y, z, gx, gy, neighbors=DEFAULT_NEIGHBORS):
+    """
+    Interpolate scattered survey values onto a set of grid points.
+
+    :param method: interpolation method; one of
+      :py:data:`~.INTERPOLATION_METHODS`
+    :type method: str
+    :param x: X coordinates of the survey points
+    :type x: list
+    :param y: Y coordinates of the survey points
+    :type y: list
+    :param z: value measured at each survey point
+    :type z: list
+    :param gx: X coordinates of the grid points to evaluate
+    :type gx: numpy.ndarray
+    :param gy: Y coordinates of the grid points to evaluate
+    :type gy: numpy.ndarray
+    :param neighbors: number of nearest survey points considered by the
+      ``local`` method
+    :type neighbors: int
+    :return: interpolated value at each grid point
+    :rtype: numpy.ndarray
+    """
+    return Interpolator(method, x, y, gx, gy, neighbors=neighbors)(z)
+
+
+def grid_shape(width, height, cell_size=None, cells=None, x=None, y=None):
+    """
+    Return the ``(num_x, num_y)`` size of the interpolation grid for a
+    floorplan of ``width`` x ``height`` pixels.
+
+    The grid resolution is, in order of precedence: ``cells`` (target total
+    number of grid cells), ``cell_size`` (size of a grid cell in pixels), or,
+    if survey point coordinates ``x`` and ``y`` are given, chosen adaptively
+    from the spacing of the survey points; otherwise
+    :py:data:`~.DEFAULT_CELL_SIZE` is used. Grid cost therefore doesn't have
+    to scale with the pixel size of the floorplan.
+
+    :rtype: tuple
+    """
+    if cells is not None:
+        cell_size = np.sqrt(width * height / float(cells))
+    elif cell_size is None and x is not None and len(x) > 1:
+        cell_size = adaptive_cell_size(width, height, x, y)
+    elif cell_size is None:
+        cell_size = DEFAULT_CELL_SIZE
+    num_x = max(2, int(width / cell_size))
+    num_y = max(2, int(num_x / (width / height)))
+    logger.debug(
+        'Using %d x %d interpolation grid (cell size %.1f px)',
+        num_x, num_y, cell_size
+    )
+    return num_x, num_y
+
+
+def adaptive_cell_size(width, height, x, y):
+    """
+    Pick a grid cell size from the median distance between each survey point
+    and its nearest neighbour, within the bounds of
+    :py:data:`~.ADAPTIVE_MIN_CELLS_ACROSS` and
+    :py:data:`~.ADAPTIVE_MAX_CELLS`.
+    """
+    from scipy.spatial import cKDTree
+    points = np.column_stack((x, y)).astype(float)
+    dist, _ = cKDTree(points).query(points, k=2)
+    spacing = np.median(dist[:, 1])
+    cell_size = spacing / ADAPTIVE_CELLS_PER_SPACING
+    cell_size = min(cell_size, max(width, height) / ADAPTIVE_MIN_CELLS_ACROSS)
+    cell_size = max(
+        cell_size, 1.0, np.sqrt(width * height / float(ADAPTIVE_MAX_CELLS))
+    )
+    logger.info(
+        'Median point spacing is %.1f px; using adaptive grid cell size of '
+        '%.1f px', spacing, cell_size
+    )
+    return cell_size
+
+
+def interpolate_fields(method, x, y, fields, gx, gy,
+                       neighbors=DEFAULT_NEIGHBORS):
+    """
+    Interpolate several metrics measured at the same survey points.
+
+    Metrics without missing values share a single :py:class:`~.Interpolator`
+    and are solved and evaluated together. Metrics with holes (NaN values)
+    fall back to an interpolator built over just the points they were
+    measured at; metrics with identical holes share that one too.
+
+    :param method: interpolation method; one of
+      :py:data:`~.INTERPOLATION_METHODS`
+    :type method: str
+    :param x: X coordinates of the survey points
+    :type x: list
+    :param y: Y coordinates of the survey points
+    :type y: list
+    :param fields: metric name to the value at each survey point
+    :type fields: dict
+    :param gx: X coordinates of the grid points to evaluate
+    :type gx: numpy.ndarray
+    :param gy: Y coordinates of the grid points to evaluate
+    :type gy: numpy.ndarray
+    :param neighbors: number of nearest survey points considered by the
+      ``local`` method
+    :type neighbors: int
+    :return: metric name to interpolated value at each grid point
+    :rtype: dict
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # group metrics by the set of points they have values for
+    groups = {}
+    for key, values in fields.items():
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        if not valid.any():
+            logger.info('Not interpolating %s: no values', key)
+            continue
+        groups.setdefault(valid.tobytes(), (valid, {}))[1][key] = values
+    result = {}
+    for valid, group in groups.values():
+        logger.debug(
+            'Interpolating %s over %d of %d points', sorted(group.keys()),
+            valid.sum(), len(valid)
+        )
+        interp = Interpolator(
+            method, x[valid], y[valid], gx, gy, neighbors=neighbors
+        )
+        keys = list(group.keys())
+        z = interp(np.column_stack([group[k][valid] for k in keys]))
+        for idx, key in enumerate(keys):
+            result[key] = z[:, idx]
+    return result
+
+
+class Interpolator(object):
+    """
+    Interpolation from a fixed set of survey points onto a fixed set of grid
+    points. All of the work that only depends on the coordinates is done
+    once, when the class is constructed; calling the instance with one or more
+    columns of values then only costs a triangular solve (``rbf``) and one
+    matrix product per call, regardless of how many columns are passed.
+
+    For the ``rbf`` method this is the same linear radial basis function as
+    :py:class:`scipy.interpolate.Rbf` with ``function='linear'``, but the
+    kernel matrix is LU-factored once and reused for every metric. For the
+    ``local`` method, the KD-tree lookup and kernel weights are stored as a
+    sparse ``G x N`` matrix.
+    """
+
+    def __init__(self, method, x, y, gx, gy, neighbors=DEFAULT_NEIGHBORS):
+        if method not in INTERPOLATION_METHODS:
+            raise ValueError('Unknown interpolation method: %s' % method)
+        self.method = method
+        self._points = np.column_stack((x, y)).astype(float)
+        self._grid = np.column_stack((gx, gy)).astype(float)
+        if method == 'rbf':
+            from scipy.linalg import lu_factor
+            from scipy.spatial.distance import cdist
+            self._lu = lu_factor(cdist(self._points, self._points))
+        else:
+            self._weights = self._local_weight_matrix(neighbors)
+
+    def __call__(self, values):
+        """
+        Interpolate values onto the grid.
+
+        :param values: value at each survey point, either shape ``(N,)`` or
+          ``(N, M)`` for ``M`` metrics at once
+        :type values: numpy.ndarray
+        :return: interpolated values of shape ``(G,)`` or ``(G, M)``
+        :rtype: numpy.ndarray
+        """
+        values = np.asarray(values, dtype=float)
+        if self.method == 'local':
+            return self._weights @ values
+        from scipy.linalg import lu_solve
+        from scipy.spatial.distance import cdist
+        coeffs = lu_solve(self._lu, values)
+        result = np.empty((len(self._grid),) + values.shape[1:])
+        step = max(1, RBF_CHUNK_ELEMENTS // len(self._points))
+        for start in range(0, len(self._grid), step):
+            kernel = cdist(self._grid[start:start + step], self._points)
+            result[start:start + step] = kernel @ coeffs
+        return result
+
+    def _local_weight_matrix(self, neighbors):
+        """
+        Build the sparse ``G x N`` weight matrix of the ``local`` (modified
+        Shepard) method.
+
+        Each grid point is computed from only its ``neighbors`` nearest survey
+        points, found with a KD-tree, weighted by the Franke-Little kernel
+        ``((R - d) / (R * d)) ** 2`` where ``R`` is the distance to the
+        furthest of those neighbours. The result passes exactly through the
+        survey points and never leaves the range of the measured values.
+        """
+        from scipy.sparse import csr_matrix
+        from scipy.spatial import cKDTree
+        k = min(neighbors, len(self._points))
+        tree = cKDTree(self._points)
+        dist, idx = tree.query(self._grid, k=k, workers=-1)
+        if k == 1:
+            dist = dist[:, np.newaxis]
+            idx = idx[:, np.newaxis]
+        weights = local_weights(dist)
+        return csr_matrix(
+            (weights.ravel(), idx.ravel(),
+             np.arange(0, weights.size + 1, k)),
+            shape=(len(self._grid), len(self._points))
+        )
+
+
+def local_weights(dist):
+    """
+    Return normalized Franke-Little weights for a ``(G, k)`` array of
+    distances from each grid point to its ``k`` nearest survey points.
+    """
+    # stretch the support radius a hair so the furthest neighbour (and
+    # the k=1 case) still gets a non-zero weight
+    radius = dist[:, -1:] * (1.0 + 1e-6) + 1e-9
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = ((radius - dist) / (radius * dist)) ** 2
+    # grid points that coincide with a survey point take its value exactly
+    exact = dist <= 1e-9
+    hits = exact.any(axis=1)
+    weights[hits] = exact[hits]
+    weights /= weights.sum(axis=1, keepdims=True)
+    return weights
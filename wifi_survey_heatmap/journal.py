@@ -0,0 +1,323 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import json
+import logging
+import os
+import threading
+
+from wifi_survey_heatmap.survey import iter_survey_file, open_temp
+
+logger = logging.getLogger(__name__)
+
+#: Suffix added to a survey filename for its journal file.
+JOURNAL_SUFFIX = '.journal'
+
+#: Default number of seconds between background compactions of a journal.
+COMPACT_INTERVAL = 30
+
+
+def journal_path(path):
+    """return the path of the journal for the survey file at ``path``"""
+    return path + JOURNAL_SUFFIX
+
+
+def _read_journal(path):
+    """
+    Return a ``(bases, events)`` tuple for a journal file: a dict of the
+    sequence number of each ``base`` event in it (see
+    :py:meth:`~.SurveyJournal.compact`) to that event, and a list of all
+    other events. A truncated last line, as left by a crash during an
+    append, is ignored.
+    """
+    bases = {}
+    events = []
+    if not os.path.exists(path):
+        return bases, events
+    with open(path, 'r') as fh:
+        for line in fh:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                logger.warning('Ignoring incomplete journal entry in %s', path)
+                continue
+            if event['event'] == 'base':
+                bases[event['seq']] = event
+            else:
+                events.append(event)
+    return bases, events
+
+
+def has_journal_events(path):
+    """
+    Return whether the survey file at ``path`` has a journal with any events
+    in it, which may not have been compacted into the survey file yet.
+    """
+    jpath = journal_path(path)
+    if not os.path.exists(jpath):
+        return False
+    return len(_read_journal(jpath)[1]) > 0
+
+
+def replay_journal(path, header=None):
+    """
+    Return the list of survey points in the survey file at ``path`` with any
+    changes from its journal that haven't been compacted into it applied.
+
+    :param path: path to the survey file
+    :type path: str
+    :param header: if given, a dict that the other top-level keys of the
+      survey file are stored in
+    :type header: dict
+    :rtype: list
+    """
+    if header is None:
+        header = {}
+    points = list(iter_survey_file(path, header=header))
+    seq = header.get('journal_seq', 0)
+    bases, events = _read_journal(journal_path(path))
+    ids = range(len(points))
+    base = bases.get(seq)
+    if base is not None and len(base['ids']) == len(points):
+        ids = base['ids']
+    state = dict(zip(ids, points))
+    applied = 0
+    for event in events:
+        if event['seq'] <= seq:
+            # already compacted into the survey file
+            continue
+        applied += 1
+        if event['event'] == 'add':
+            state[event['id']] = event['point']
+        elif event['id'] not in state:
+            continue
+        elif event['event'] == 'move':
+            state[event['id']]['x'] = event['x']
+            state[event['id']]['y'] = event['y']
+        elif event['event'] == 'remove':
+            del state[event['id']]
+    if applied:
+        logger.info(
+            'Applied %d journal events to %d survey points from %s',
+            applied, len(points), path
+        )
+    return list(state.values())
+
+
+class SurveyJournal(object):
+    """
+    Journal of changes to a survey file, which keeps saving a change
+    independent of the size of the survey.
+
+    Each added, moved or removed point is appended to a JSON-lines journal
+    next to the survey file, and a background thread periodically compacts
+    the journal: it writes the complete survey to the survey file and starts
+    a new, empty journal. If the process dies before a compaction,
+    :py:func:`~.replay_journal` (used when loading surveys) applies the
+    remaining events.
+
+    Every event has a sequence number, and the survey file records the last
+    one it includes as ``journal_seq``, so a crash partway through a
+    compaction can't apply any event twice. Changes can still be made while
+    the survey file is being written; see :py:meth:`~.compact`.
+
+    Points are identified by IDs returned by :py:meth:`~.add_point`; points
+    that were already in the survey have their index as their ID. The
+    methods match those of :py:class:`~.SQLiteStore`.
+
+    :param path: path to the survey file
+    :type path: str
+    :param header: top-level keys of the survey other than ``survey_points``
+    :type header: dict
+    :param points: survey points, i.e. as returned by
+      :py:func:`~.replay_journal`
+    :type points: list
+    :param write: function to write the complete survey dict to the survey
+      file; it must replace the file atomically and leave the journal alone,
+      as it runs while changes are still being journalled
+    :type write: callable
+    :param interval: seconds between compactions
+    :type interval: float
+    """
+
+    def __init__(self, path, header, points, write,
+                 interval=COMPACT_INTERVAL):
+        self.path = path
+        self._journal = journal_path(path)
+        self._header = dict(header)
+        self._seq = self._header.pop('journal_seq', 0)
+        self._points = dict(enumerate(points))
+        self._next_id = len(points)
+        self._write = write
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._fh = None
+        self._dirty = False
+        # events appended since the last base event
+        self._recent = []
+        self._stop = threading.Event()
+        if has_journal_events(path) or not os.path.exists(path):
+            # start from the replayed survey, so IDs match the survey file
+            self.compact()
+        else:
+            # a new journal also drops any incomplete last line
+            with self._lock:
+                self._reset()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), daemon=True
+        )
+        self._thread.start()
+
+    def _base(self):
+        """
+        Return the base event of the survey file holding the current points;
+        must hold ``self._lock``.
+        """
+        return {
+            'event': 'base', 'seq': self._seq,
+            'ids': list(self._points.keys())
+        }
+
+    def _reset(self, base=None, events=()):
+        """
+        Start a new journal for the survey file written at ``base`` (by
+        default, the current points), holding ``events``; must hold
+        ``self._lock``.
+        """
+        fh, tmp = open_temp(self._journal)
+        with fh:
+            for event in [base or self._base()] + list(events):
+                fh.write(json.dumps(event) + '\n')
+        os.replace(tmp, self._journal)
+        if self._fh is not None:
+            self._fh.close()
+        self._fh = open(self._journal, 'a')
+
+    def _write_event(self, event):
+        self._fh.write(json.dumps(event) + '\n')
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def _append(self, event):
+        """append an event to the journal; must hold ``self._lock``"""
+        self._seq += 1
+        event['seq'] = self._seq
+        self._write_event(event)
+        self._recent.append(event)
+        self._dirty = True
+
+    def add_point(self, point):
+        """
+        Add a survey point.
+
+        :param point: JSON-serializable survey point dict
+        :type point: dict
+        :return: ID of the new point
+        :rtype: int
+        """
+        with self._lock:
+            point_id = self._next_id
+            self._next_id += 1
+            self._points[point_id] = point
+            self._append({'event': 'add', 'id': point_id, 'point': point})
+        return point_id
+
+    def move_point(self, point_id, x, y):
+        with self._lock:
+            self._points[point_id]['x'] = x
+            self._points[point_id]['y'] = y
+            self._append({'event': 'move', 'id': point_id, 'x': x, 'y': y})
+
+    def remove_point(self, point_id):
+        with self._lock:
+            del self._points[point_id]
+            self._append({'event': 'remove', 'id': point_id})
+
+    def compact(self):
+        """
+        Write the complete survey to the survey file and start a new journal.
+
+        Only taking a copy of the points and starting the new journal hold
+        the lock, so points can be added, moved and removed while the survey
+        file is written. Before it is written, a base event with the IDs of
+        the copied points is appended to the journal, so that if the process
+        dies partway through, :py:func:`~.replay_journal` can apply the
+        events after it to either version of the survey file. The new
+        journal then starts with that base event, followed by the events
+        appended since.
+        """
+        with self._compact_lock:
+            with self._lock:
+                data = dict(self._header)
+                data['journal_seq'] = self._seq
+                # move_point changes points in place, so copy them
+                data['survey_points'] = [
+                    dict(p) for p in self._points.values()
+                ]
+                base = self._base()
+                if self._fh is not None:
+                    self._write_event(base)
+                self._recent = []
+                self._dirty = False
+            try:
+                self._write(data)
+            except BaseException:
+                with self._lock:
+                    self._dirty = True
+                raise
+            with self._lock:
+                self._reset(base, self._recent)
+        logger.debug(
+            'Compacted journal into %s at seq %d', self.path, base['seq']
+        )
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            if self._dirty:
+                try:
+                    self.compact()
+                except Exception:
+                    logger.error('Journal compaction failed', exc_info=True)
+
+    def close(self):
+        """stop compacting in the background, and compact one last time"""
+        self._stop.set()
+        self._thread.join()
+        if self._dirty:
+            self.compact()
+        with self._lock:
+            self._fh.close()
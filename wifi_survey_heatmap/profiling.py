@@ -0,0 +1,299 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import cProfile
+import json
+import logging
+import os
+import re
+import resource
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def _reset_peak_rss():
+    """
+    Reset the peak resident set size of this process to its current RSS,
+    where the OS supports that (Linux), so the peak of each stage can be
+    measured separately.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as fh:
+            fh.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss():
+    """
+    Return the peak resident set size of this process in bytes, since it
+    started or since the last :py:func:`~._reset_peak_rss`.
+    """
+    try:
+        with open('/proc/self/status', 'r') as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # kilobytes on Linux, and not resettable
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _Frame(object):
+
+    def __init__(self, name, labels, profile, parent=None):
+        self.name = name
+        self.labels = labels
+        self.profile = profile
+        # names (with labels) of this stage and the stages it is nested in
+        self.path = (parent.path if parent is not None else []) + [
+            ' '.join([name] + [str(v) for v in labels.values()])
+        ]
+        self.peak = 0
+        self.start = time.time()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+
+class StageProfiler(object):
+    """
+    Records the wall time, CPU time and peak resident set size (RSS) of
+    named, possibly nested, stages of a run, see :py:meth:`~.stage`.
+
+    CPU time and RSS are those of the process the stage ran in. Each record
+    has the process ID, and the records of stages run in forked worker
+    processes are passed back with :py:meth:`~.begin_task`,
+    :py:meth:`~.end_task` and :py:meth:`~.extend`. Where the OS
+    doesn't support resetting the peak RSS of a process, the peak of each
+    stage is the peak of the process so far.
+
+    :param stats_dir: if given, directory to write a cProfile statistics
+      file for each stage to (see :py:mod:`pstats`); these exclude the time
+      spent in stages nested in it, which have their own files
+    :type stats_dir: str
+    :param enabled: whether to record anything; a disabled profiler's
+      :py:meth:`~.stage` does nothing
+    :type enabled: bool
+    """
+
+    def __init__(self, stats_dir=None, enabled=True):
+        self.enabled = enabled
+        self.records = []
+        self._stats_dir = stats_dir
+        self._stack = []
+        self._count = 0
+        self._pid = os.getpid()
+        if stats_dir is not None and enabled:
+            os.makedirs(stats_dir, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """
+        Context manager that records one run of stage ``name``. Any keyword
+        arguments (e.g. ``metric``) are stored with the record; None values
+        are left out.
+        """
+        if not self.enabled:
+            yield
+            return
+        peak = _peak_rss()
+        for frame in self._stack:
+            frame.peak = max(frame.peak, peak)
+        if self._stack and self._stack[-1].profile is not None:
+            self._stack[-1].profile.disable()
+        profile = None
+        if self._stats_dir is not None:
+            profile = cProfile.Profile()
+        _reset_peak_rss()
+        frame = _Frame(
+            name, {k: v for k, v in labels.items() if v is not None},
+            profile, parent=self._stack[-1] if self._stack else None
+        )
+        self._stack.append(frame)
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            self._finish(frame)
+            if self._stack and self._stack[-1].profile is not None:
+                self._stack[-1].profile.enable()
+
+    def _finish(self, frame):
+        wall = time.perf_counter() - frame.wall
+        cpu = time.process_time() - frame.cpu
+        self._stack.pop()
+        peak = max(frame.peak, _peak_rss())
+        for outer in self._stack:
+            outer.peak = max(outer.peak, peak)
+        record = dict(frame.labels)
+        record.update({
+            'stage': frame.name, 'path': frame.path, 'pid': os.getpid(),
+            'start': frame.start, 'wall': wall, 'cpu': cpu, 'peak_rss': peak,
+        })
+        if frame.profile is not None:
+            self._count += 1
+            fname = os.path.join(self._stats_dir, '%s-%d-%d.pstats' % (
+                re.sub(r'[^\w.-]+', '_', '_'.join(
+                    [frame.name] + [str(v) for v in frame.labels.values()]
+                )), os.getpid(), self._count
+            ))
+            frame.profile.dump_stats(fname)
+            record['pstats'] = fname
+        self.records.append(record)
+
+    def begin_task(self):
+        """
+        Call at the start of each task that may run in a forked worker
+        process. In a worker, this forgets the records and open stages
+        inherited from the parent process.
+        """
+        if os.getpid() == self._pid:
+            return
+        if self._stack and self._stack[-1].profile is not None:
+            self._stack[-1].profile.disable()
+        self._stack = []
+        self.records = []
+
+    def end_task(self):
+        """
+        Call at the end of each task started with :py:meth:`~.begin_task`.
+        In a worker, returns the records of the task (and forgets them), to
+        be passed to :py:meth:`~.extend` in the parent process; otherwise
+        they are recorded already, and this returns an empty list.
+        """
+        if os.getpid() == self._pid:
+            return []
+        records = self.records
+        self.records = []
+        return records
+
+    def extend(self, records):
+        """
+        Add records returned by :py:meth:`~.end_task` in a worker process,
+        nested under the current stage.
+        """
+        prefix = self._stack[-1].path if self._stack else []
+        for record in records:
+            record['path'] = prefix + record['path']
+        self.records.extend(records)
+
+    def summary(self):
+        """
+        Return the records combined by stage and labels, and by the stages
+        they were nested in: a list of dicts with the ``stage``, labels and
+        ``path`` of the records, their number (``calls``), total ``wall`` and
+        ``cpu`` seconds and highest ``peak_rss``. Each row comes right after
+        the row of the stage it was nested in, in the order they started.
+        """
+        rows = {}
+        for record in sorted(self.records, key=lambda r: r['start']):
+            key = tuple(record['path'])
+            if key not in rows:
+                rows[key] = {
+                    k: v for k, v in record.items()
+                    if k not in ('pid', 'start', 'wall', 'cpu', 'peak_rss',
+                                 'pstats')
+                }
+                rows[key].update(
+                    calls=0, wall=0.0, cpu=0.0, peak_rss=0,
+                    start=record['start']
+                )
+            row = rows[key]
+            row['calls'] += 1
+            row['wall'] += record['wall']
+            row['cpu'] += record['cpu']
+            row['peak_rss'] = max(row['peak_rss'], record['peak_rss'])
+
+        def order(key):
+            return [
+                rows[key[:i]]['start'] if key[:i] in rows else
+                rows[key]['start'] for i in range(1, len(key) + 1)
+            ]
+
+        result = []
+        for key in sorted(rows.keys(), key=order):
+            del rows[key]['start']
+            result.append(rows[key])
+        return result
+
+    def write_report(self, path):
+        """
+        Write all records and the :py:meth:`~.summary` to the JSON file
+        ``path``.
+        """
+        with open(path, 'w') as fh:
+            fh.write(json.dumps(
+                {'records': self.records, 'summary': self.summary()},
+                indent=2
+            ))
+        logger.info('Wrote profile report to: %s', path)
+
+
+def format_profile(summary):
+    """
+    Format the :py:meth:`~.StageProfiler.summary` of a run as a table, with
+    nested stages indented under the stage they ran in.
+    """
+    surveys = set(row.get('survey') for row in summary)
+    rows = []
+    for row in summary:
+        name = '  ' * (len(row['path']) - 1) + row['stage']
+        labels = [
+            str(v) for k, v in row.items()
+            if k not in ('stage', 'path', 'calls', 'wall', 'cpu',
+                         'peak_rss') and (k != 'survey' or len(surveys) > 1)
+        ]
+        rows.append((name, ' '.join(labels) or '-', row))
+    width = max([len(r[0]) for r in rows] + [5])
+    lwidth = max([len(r[1]) for r in rows] + [13])
+    lines = ['%-*s  %-*s  %6s  %9s  %9s  %9s' % (
+        width, 'stage', lwidth,
+        'survey metric' if len(surveys) > 1 else 'metric', 'calls',
+        'wall [s]', 'cpu [s]', 'peak MiB'
+    )]
+    for name, labels, row in rows:
+        lines.append('%-*s  %-*s  %6d  %9.3f  %9.3f  %9.1f' % (
+            width, name, lwidth, labels, row['calls'], row['wall'],
+            row['cpu'], row['peak_rss'] / 1048576.0
+        ))
+    return '\n'.join(lines)
@@ -0,0 +1,302 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import logging
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+logger = logging.getLogger(__name__)
+
+#: Opacity of the heatmap overlay drawn on top of the floorplan.
+OVERLAY_ALPHA = 0.5
+
+#: Fraction of the floorplan's size that the ``raster`` renderer draws
+#: heatmaps at. This is the size of the heatmap axes in the matplotlib
+#: renderer's figures (the floorplan's size, with the default subplot
+#: parameters and a color bar taking 20% of the axes width), so both renderers
+#: draw heatmaps at the same resolution.
+HEATMAP_SCALE = 0.62
+
+#: The eight bytes every PNG file starts with.
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def colormap_lut(cmap):
+    """
+    Return the RGBA lookup table of a matplotlib colormap as a
+    ``(cmap.N, 4)`` float array, so the same colors can be applied with plain
+    NumPy indexing (see :py:func:`~.lut_indices`).
+    """
+    return np.asarray(cmap(np.arange(cmap.N)), dtype=float)
+
+
+def lut_indices(z, vmin, vmax, n):
+    """
+    Map values to colormap lookup table indices exactly the way
+    :py:meth:`matplotlib.axes.Axes.imshow` with a clipping
+    :py:class:`matplotlib.colors.Normalize` does. Like ``imshow``, a range
+    with ``vmin == vmax`` maps everything to the first color of the
+    colormap.
+    """
+    if vmax == vmin:
+        return np.zeros(np.shape(z), dtype=np.intp)
+    x = np.clip((np.asarray(z, dtype=float) - vmin) / (vmax - vmin), 0, 1)
+    return np.minimum((x * n).astype(np.intp), n - 1)
+
+
+def _float_image(arr, width, height, resample=Image.BILINEAR):
+    """
+    Return a 2D float array as a Pillow ``F`` image resized to ``width`` x
+    ``height`` pixels.
+    """
+    img = Image.fromarray(np.asarray(arr, dtype=np.float32), mode='F')
+    if img.size == (width, height):
+        return img
+    return img.resize((width, height), resample)
+
+
+def resize(arr, width, height, resample=Image.BILINEAR):
+    """
+    Resize a 2D float array, or a ``uint8`` RGB / RGBA image array, to
+    ``width`` x ``height`` pixels.
+    """
+    if arr.shape[1] == width and arr.shape[0] == height:
+        return arr
+    if arr.ndim == 2:
+        return np.asarray(
+            _float_image(arr, width, height, resample), dtype=float
+        )
+    img = Image.fromarray(arr)
+    return np.asarray(img.resize((width, height), resample))
+
+
+def to_rgb8(image):
+    """
+    Convert an image array as returned by :py:func:`matplotlib.pyplot.imread`
+    (float in [0, 1] or ``uint8``; grayscale, RGB or RGBA) to an opaque
+    ``uint8`` RGB array, flattening any transparency onto white.
+    """
+    image = np.asarray(image)
+    if image.dtype != np.uint8:
+        image = np.round(np.clip(image, 0, 1) * 255).astype(np.uint8)
+    if image.ndim == 2:
+        image = np.stack((image, image, image), axis=-1)
+    if image.shape[2] == 4:
+        alpha = image[:, :, 3:].astype(float) / 255
+        rgb = image[:, :, :3] * alpha + 255 * (1 - alpha)
+        image = np.round(rgb).astype(np.uint8)
+    return np.ascontiguousarray(image[:, :, :3])
+
+
+def base_layer(image, width, height):
+    """
+    Return the floorplan ``image`` resampled once to the ``width`` x
+    ``height`` output raster as an opaque ``uint8`` RGB array, ready to have
+    each metric's heatmap composited onto it with :py:func:`~.composite`.
+    """
+    logger.debug('Resampling floorplan to %d x %d base layer', width, height)
+    return resize(to_rgb8(image), width, height, resample=Image.BICUBIC)
+
+
+def composite(base, z, vmin, vmax, lut, alpha=OVERLAY_ALPHA):
+    """
+    Colorize the interpolated grid ``z`` and alpha-blend it onto ``base``.
+
+    ``z`` is bilinearly resampled to the size of ``base`` first, and then
+    mapped through the colormap lookup table ``lut``
+    (see :py:func:`~.colormap_lut`).
+
+    :return: ``uint8`` RGB array the same size as ``base``
+    :rtype: numpy.ndarray
+    """
+    height, width = base.shape[:2]
+    n = len(lut)
+    if n <= 256 and np.all(lut[:, 3] == 1):
+        # opaque colormap; let Pillow resample, colorize and blend. Its
+        # float to 8 bit conversion truncates and clips, so scaling the
+        # range to [0, n] gives the same indices as lut_indices; scaling
+        # before resampling is the same as after, and much cheaper.
+        if vmax == vmin:
+            overlay = Image.new('L', (width, height), 0)
+        else:
+            scaled = (np.asarray(z, dtype=float) - vmin) * (
+                n / float(vmax - vmin)
+            )
+            overlay = _float_image(scaled, width, height).convert('L')
+            if n < 256:
+                overlay = overlay.point(
+                    [min(i, n - 1) for i in range(256)]
+                )
+        overlay.putpalette(
+            np.round(lut[:, :3] * 255).astype(np.uint8).tobytes()
+        )
+        return np.asarray(Image.blend(
+            Image.fromarray(base), overlay.convert('RGB'), alpha
+        ))
+    z = resize(np.asarray(z, dtype=float), width, height)
+    rgba = lut[lut_indices(z, vmin, vmax, n)]
+    a = alpha * rgba[:, :, 3:]
+    out = base * (1 - a) + rgba[:, :, :3] * 255 * a
+    return np.round(out).astype(np.uint8)
+
+
+def colorbar(lut, width, height, alpha=OVERLAY_ALPHA):
+    """
+    Return a vertical color bar of ``lut`` (highest value at the top) as a
+    ``uint8`` RGB array, blended onto white with the same opacity as the
+    heatmap overlay.
+    """
+    idx = (np.arange(height)[::-1] * len(lut)) // height
+    rgba = lut[idx]
+    a = alpha * rgba[:, 3:]
+    rgb = np.round(255 * (1 - a) + rgba[:, :3] * 255 * a).astype(np.uint8)
+    return np.repeat(rgb[:, np.newaxis, :], width, axis=1)
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 only has the fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+def draw_markers(image, points, colors, radius):
+    """
+    Draw a filled circle with a black outline of the given ``radius`` at
+    each of ``points`` onto the ``uint8`` RGB array ``image``, in place.
+    All markers are drawn at once with NumPy indexing, later points on top
+    of earlier ones.
+
+    :param points: ``(N, 2)`` array of point coordinates in pixels
+    :param colors: ``(N, 4)`` float RGBA color of each point
+    """
+    dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    dist = np.hypot(dx, dy)
+    inside = dist <= radius + 0.5
+    edge = (dist > radius - 0.5)[inside]
+    centers = np.round(np.asarray(points, dtype=float)).astype(np.intp)
+    ys = centers[:, 1:] + dy[inside]
+    xs = centers[:, :1] + dx[inside]
+    fill = np.round(np.asarray(colors)[:, :3] * 255).astype(np.uint8)
+    rgb = np.repeat(fill[:, np.newaxis, :], len(edge), axis=1)
+    rgb[:, edge] = 0
+    valid = (
+        (ys >= 0) & (ys < image.shape[0]) & (xs >= 0) & (xs < image.shape[1])
+    )
+    image[ys[valid], xs[valid]] = rgb[valid]
+
+
+def render_heatmap(base, z, vmin, vmax, lut, points=None, point_colors=None):
+    """
+    Render a complete heatmap image without matplotlib: the heatmap
+    composited onto the floorplan ``base`` layer, optional survey point
+    markers, and a color bar labeled with ``vmin`` and ``vmax`` on the right.
+
+    :param points: optional ``(N, 2)`` array of point coordinates in
+      ``base`` pixels
+    :param point_colors: ``(N, 4)`` float RGBA color of each point
+    :return: ``uint8`` RGB array
+    :rtype: numpy.ndarray
+    """
+    height, width = base.shape[:2]
+    bar_width = max(10, width // 50)
+    margin = bar_width
+    font_size = max(10, height // 60)
+    font = _font(font_size)
+    labels = ['%g' % vmax] if vmin == vmax else ['%g' % vmax, '%g' % vmin]
+    label_width = max(
+        int(ImageDraw.Draw(Image.new('RGB', (1, 1))).textlength(
+            x, font=font
+        )) for x in labels
+    )
+    # the color bar and its labels are drawn with Pillow on a separate
+    # strip, so the full size image is never converted to a Pillow image
+    strip = Image.new(
+        'RGB', (3 * margin + bar_width + label_width, height), 'white'
+    )
+    strip.paste(
+        Image.fromarray(colorbar(lut, bar_width, height - 2 * margin)),
+        (margin, margin)
+    )
+    draw = ImageDraw.Draw(strip)
+    draw.rectangle(
+        (margin, margin, margin + bar_width - 1, height - margin - 1),
+        outline='black'
+    )
+    text_x = margin + bar_width + margin // 2
+    if vmin == vmax:
+        draw.text((text_x, height // 2), labels[0], fill='black', font=font,
+                  anchor='lm')
+    else:
+        draw.text((text_x, margin), labels[0], fill='black', font=font,
+                  anchor='lm')
+        draw.text((text_x, height - margin), labels[1], fill='black',
+                  font=font, anchor='lm')
+    out = np.empty((height, width + strip.size[0], 3), dtype=np.uint8)
+    out[:, :width] = composite(base, z, vmin, vmax, lut)
+    out[:, width:] = np.asarray(strip)
+    if points is not None and len(points):
+        draw_markers(out, points, point_colors, max(3, width // 400))
+    return out
+
+
+def write_png(fname, image):
+    """
+    Write a ``uint8`` RGB or RGBA array to ``fname`` as a PNG, favoring
+    encoding speed over file size: the rows are not filtered, and are
+    compressed at the fastest zlib level. Pillow would try every PNG filter
+    on every row, which takes longer than compressing them, and heatmaps
+    have large flat areas that compress about as well without a filter.
+    """
+    height, width, channels = image.shape
+    rows = np.zeros((height, width * channels + 1), dtype=np.uint8)
+    rows[:, 1:] = image.reshape((height, width * channels))
+    header = struct.pack(
+        '>IIBBBBB', width, height, 8, {3: 2, 4: 6}[channels], 0, 0, 0
+    )
+    with open(fname, 'wb') as fh:
+        fh.write(PNG_SIGNATURE)
+        for tag, data in (
+            (b'IHDR', header), (b'IDAT', zlib.compress(rows, 1)),
+            (b'IEND', b'')
+        ):
+            fh.write(struct.pack('>I', len(data)) + tag + data)
+            fh.write(struct.pack('>I', zlib.crc32(tag + data)))
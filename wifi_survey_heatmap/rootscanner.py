@@ -0,0 +1,141 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import json
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+#: Argument that starts the privileged scanner child process of
+#: ``wifi-survey``; see :py:func:`~.main`.
+SECRET_ELEVATED_CHILD = "--internal-elevated-scannner"
+
+
+def child_command():
+    """
+    Return the command line that starts the privileged scanner child
+    process. It runs this module rather than ``wifi-survey`` itself, so that
+    the child only imports the libnl scanner and not wx and the rest of the
+    survey UI.
+    """
+    return [
+        sys.executable, '-m', 'wifi_survey_heatmap.rootscanner',
+        SECRET_ELEVATED_CHILD
+    ]
+
+
+def main_root():
+    from wifi_survey_heatmap.libnl import Scanner
+
+    data = json.loads(sys.stdin.readline())
+    if data["cmd"] != "init":
+        sys.stderr.print("Invalid command tuple:" + json.dumps(data))
+        return
+
+    scanner = Scanner(scan=False)
+    scanner.set_interface(data["interface"])
+
+    sys.stdout.write(json.dumps({"status": "ok", "data":None})+"\n")
+    sys.stdout.flush()
+
+    while True:
+        data = json.loads(sys.stdin.readline())
+        if data["cmd"] == "get_current_bssid":
+            result = scanner.get_current_bssid()
+        elif data["cmd"] == "get_iface_data":
+            result = scanner.get_iface_data()
+        elif data["cmd"] == "scan_all_access_points":
+            result = scanner.scan_all_access_points()
+        else:
+            sys.stderr.print("Invalid action tuple:" + json.dumps(data))
+            return
+        sys.stdout.write(json.dumps({"status": "ok", "data": result})+"\n")
+        sys.stdout.flush()
+
+class RemoteScanner(object):
+
+    def __init__(self, popen, scan=True, interface=None):
+        super().__init__()
+        logger.debug(
+            'Initializing RemoteScanner interface: %s',
+            interface
+        )
+        self.p = popen
+        # initialize the subprocess
+        self._write({"cmd": "init", "interface": interface})
+        self.interface_name = interface
+
+    def _write(self, data):
+        txt = json.dumps(data)
+        self.p.stdin.write(f"{txt}\n")
+        self.p.stdin.flush()
+        result = self.p.stdout.readline()
+        logger.debug(result)
+        if result == "" or result == "\n":
+            raise "Subprocess exited"
+        obj = json.loads(result)
+        if obj["status"] != "ok":
+            logger.warn(result)
+            raise obj
+        else:
+            return obj["data"]
+
+
+    def get_current_bssid(self):
+        return self._write({"cmd": "get_current_bssid"})
+
+    def get_iface_data(self):
+        return self._write({"cmd": "get_iface_data"})
+
+    def scan_all_access_points(self):
+        return self._write({"cmd": "scan_all_access_points"})
+
+
+def main():
+    if sys.argv[1:] != [SECRET_ELEVATED_CHILD]:
+        raise SystemExit(
+            'This is started by wifi-survey; it is not meant to be run directly'
+        )
+    if os.geteuid() != 0:
+        raise RuntimeError('ERROR: This script must be run as root/sudo.')
+    main_root()
+
+
+if __name__ == '__main__':
+    main()
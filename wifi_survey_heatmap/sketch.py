@@ -0,0 +1,177 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import math
+
+import numpy as np
+
+#: Default relative accuracy of the values returned by
+#: :py:meth:`~.QuantileSketch.quantile`.
+DEFAULT_RELATIVE_ACCURACY = 0.005
+
+#: Values closer to zero than this are all counted as zero.
+MIN_INDEXABLE_VALUE = 1e-9
+
+
+class QuantileSketch(object):
+    """
+    Mergeable, fixed-accuracy sketch of a distribution of values, for
+    estimating quantiles (percentiles) without keeping the values themselves.
+
+    Values are counted in logarithmically sized bins (as in DDSketch): bin
+    ``i`` holds the values with magnitude in ``(gamma ** (i - 1), gamma ** i]``
+    where ``gamma = (1 + a) / (1 - a)`` for relative accuracy ``a``, with
+    separate bins for negative values and one for zero. Any quantile is then
+    known to within a relative error of ``a``, whatever the range or units of
+    the values, and sketches with the same accuracy can be merged exactly.
+    The number of bins only grows with the logarithm of the value range (a
+    few hundred for any of the survey metrics).
+
+    :param relative_accuracy: relative accuracy ``a`` of the quantiles
+    :type relative_accuracy: float
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1.0 + relative_accuracy) / (1.0 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.count = 0
+        self.zero = 0
+        self.positive = {}
+        self.negative = {}
+
+    def add_array(self, values):
+        """
+        Add an array of values to the sketch. NaN values are ignored.
+
+        :param values: values to add
+        :type values: numpy.ndarray
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.count += len(values)
+        nonzero = np.abs(values) >= MIN_INDEXABLE_VALUE
+        self.zero += int(len(values) - nonzero.sum())
+        values = values[nonzero]
+        idx = np.ceil(np.log(np.abs(values)) / self._log_gamma)
+        negative = values < 0
+        for bins, sel in (
+            (self.positive, ~negative), (self.negative, negative)
+        ):
+            keys, counts = np.unique(idx[sel].astype(np.int64),
+                                     return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                bins[key] = bins.get(key, 0) + count
+
+    def merge(self, other):
+        """
+        Add all of the values counted in another sketch to this one.
+
+        :param other: sketch with the same relative accuracy as this one
+        :type other: QuantileSketch
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(
+                'Cannot merge sketches with different relative accuracy '
+                '(%s and %s)' % (self.relative_accuracy,
+                                 other.relative_accuracy)
+            )
+        self.count += other.count
+        self.zero += other.zero
+        for bins, other_bins in ((self.positive, other.positive),
+                                 (self.negative, other.negative)):
+            for key, count in other_bins.items():
+                bins[key] = bins.get(key, 0) + count
+
+    def _bin_value(self, key):
+        # the point with equal relative distance to both ends of the bin
+        return 2.0 * self._gamma ** key / (self._gamma + 1.0)
+
+    def quantile(self, q):
+        """
+        Return the approximate ``q`` quantile of the values added so far, or
+        None if there are none.
+
+        :param q: quantile, from 0 to 1
+        :type q: float
+        :rtype: float
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        bins = [
+            (-self._bin_value(k), self.negative[k])
+            for k in sorted(self.negative.keys(), reverse=True)
+        ]
+        bins.append((0.0, self.zero))
+        bins.extend(
+            (self._bin_value(k), self.positive[k])
+            for k in sorted(self.positive.keys())
+        )
+        for value, count in bins:
+            seen += count
+            if seen > rank:
+                return value
+        return value
+
+    def to_dict(self):
+        """
+        Return the sketch as a JSON-serializable dict, which
+        :py:meth:`~.from_dict` turns back into an identical sketch.
+        """
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'count': self.count,
+            'zero': self.zero,
+            'positive': sorted(self.positive.items()),
+            'negative': sorted(self.negative.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Return the sketch for a dict returned by :py:meth:`~.to_dict`.
+        """
+        sketch = cls(relative_accuracy=d['relative_accuracy'])
+        sketch.count = d['count']
+        sketch.zero = d['zero']
+        sketch.positive = {int(k): c for k, c in d['positive']}
+        sketch.negative = {int(k): c for k, c in d['negative']}
+        return sketch
@@ -0,0 +1,296 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+
+import numpy as np
+
+from wifi_survey_heatmap.survey import METRICS, Survey, _metric_value
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS survey (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS points (
+    id INTEGER PRIMARY KEY,
+    x NOT NULL,
+    y NOT NULL,
+    failed INTEGER
+);
+CREATE TABLE IF NOT EXISTS measurements (
+    point_id INTEGER PRIMARY KEY REFERENCES points(id) ON DELETE CASCADE,
+    mac TEXT,
+    ap_frequency REAL,
+    has_scan INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    present INTEGER NOT NULL,
+    %s
+);
+CREATE TABLE IF NOT EXISTS scan_results (
+    id INTEGER PRIMARY KEY,
+    point_id INTEGER NOT NULL REFERENCES points(id) ON DELETE CASCADE,
+    bssid TEXT NOT NULL,
+    ssid TEXT,
+    frequency REAL,
+    signal_mbm REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scan_results_point_id
+    ON scan_results(point_id);
+""" % ',\n    '.join('%s REAL' % k for k in METRICS.keys())
+
+
+class SQLiteStore(object):
+    """
+    Survey stored in a SQLite database, with one row per survey point in the
+    ``points`` table, its measurement in ``measurements`` (with a column
+    for each of :py:data:`~.METRICS` alongside the full ``result``) and its
+    scan results in ``scan_results``.
+
+    Point coordinates are stored without a column type, so that integer
+    and float coordinates are read back as they were stored, and ``failed``
+    is NULL for points without that key; :py:meth:`~.points` returns
+    exactly the points that were added. Bit ``i`` of ``present`` is set if
+    the ``i``-th of :py:data:`~.METRICS` is present in the result (even if
+    its value is null), as in :py:class:`~.Survey`.
+
+    Unlike the JSON and binary formats, which are rewritten as a whole every
+    time the survey changes, each change is a single small transaction, and
+    readers only query the columns they use. The database is opened in WAL
+    mode, so it stays consistent if the survey UI crashes or is killed.
+
+    :param path: path to the database file; created if it doesn't exist
+    :type path: str
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # measurements are saved from the survey UI's worker thread
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA foreign_keys = ON')
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def checkpoint(self):
+        """
+        Write all changes in the write-ahead log into the database file and
+        leave WAL mode, so that the database file is complete on its own and
+        can be moved or copied (e.g. by :py:func:`~.write_survey`) once the
+        store is closed.
+        """
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode = DELETE')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def header(self):
+        """dict of survey-wide values, i.e. ``img_path``"""
+        with self._lock:
+            return {
+                k: json.loads(v) for k, v in
+                self._conn.execute('SELECT key, value FROM survey')
+            }
+
+    def set_header(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO survey (key, value) VALUES (?, ?)',
+                (key, json.dumps(value))
+            )
+
+    def add_point(self, point):
+        """
+        Store a finished survey point.
+
+        :param point: survey point dict with ``x``, ``y``, ``result`` and
+          ``failed`` keys, as found in survey JSON files
+        :type point: dict
+        :return: ID of the new point, for :py:meth:`~.move_point` and
+          :py:meth:`~.remove_point`
+        :rtype: int
+        :raises KeyError: if the result lacks a required metric, like
+          loading a JSON survey with such a point would
+        """
+        result = dict(point['result'])
+        scan = result.pop('scan_results', None)
+        present = 0
+        metrics = []
+        for idx, spec in enumerate(METRICS.values()):
+            is_present, value = _metric_value(result, spec)
+            present |= is_present << idx
+            metrics.append(value)
+        failed = point.get('failed')
+        with self._lock, self._conn:
+            point_id = self._conn.execute(
+                'INSERT INTO points (x, y, failed) VALUES (?, ?, ?)',
+                (point['x'], point['y'],
+                 None if failed is None else int(failed))
+            ).lastrowid
+            self._conn.execute(
+                'INSERT INTO measurements (point_id, mac, ap_frequency, '
+                'has_scan, result, present, %s) '
+                'VALUES (?, ?, ?, ?, ?, ?, %s)' % (
+                    ', '.join(METRICS.keys()),
+                    ', '.join('?' for _ in METRICS.keys())
+                ), [
+                    point_id, result['mac'], result['frequency'],
+                    int(scan is not None), json.dumps(result), present
+                ] + metrics
+            )
+            if scan:
+                self._conn.executemany(
+                    'INSERT INTO scan_results (point_id, bssid, ssid, '
+                    'frequency, signal_mbm, data) VALUES (?, ?, ?, ?, ?, ?)',
+                    [
+                        (
+                            point_id, bssid, bss.get('ssid'),
+                            bss.get('frequency'), bss.get('signal_mbm'),
+                            json.dumps(bss)
+                        ) for bssid, bss in scan.items()
+                    ]
+                )
+        return point_id
+
+    def move_point(self, point_id, x, y):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE points SET x = ?, y = ? WHERE id = ?',
+                (x, y, point_id)
+            )
+
+    def remove_point(self, point_id):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM points WHERE id = ?', (point_id,))
+
+    def points(self):
+        """
+        Yield an ``(id, point)`` tuple for every stored survey point, in the
+        order they were added, where ``point`` is a dict as found in survey
+        JSON files.
+        """
+        with self._lock:
+            scans = {}
+            for point_id, bssid, data in self._conn.execute(
+                'SELECT point_id, bssid, data FROM scan_results ORDER BY id'
+            ):
+                scans.setdefault(point_id, {})[bssid] = json.loads(data)
+            rows = self._conn.execute(
+                'SELECT p.id, p.x, p.y, p.failed, m.has_scan, m.result '
+                'FROM points p JOIN measurements m ON m.point_id = p.id '
+                'ORDER BY p.id'
+            ).fetchall()
+        for point_id, x, y, failed, has_scan, result in rows:
+            result = json.loads(result)
+            if has_scan:
+                result['scan_results'] = scans.get(point_id, {})
+            point = {'x': x, 'y': y, 'result': result}
+            if failed is not None:
+                point['failed'] = bool(failed)
+            yield point_id, point
+
+    def load_survey(self):
+        """
+        Return the columns needed for heatmaps as a :py:class:`~.Survey`,
+        without decoding any of the stored JSON. Points marked ``failed``
+        are left out, like :py:func:`~.load_survey` does.
+
+        :rtype: Survey
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT p.id, p.x, p.y, m.mac, m.ap_frequency, m.has_scan, '
+                'm.present, %s '
+                'FROM points p JOIN measurements m ON m.point_id = p.id '
+                'WHERE p.failed IS NOT 1 ORDER BY p.id' % ', '.join(
+                    'm.%s' % k for k in METRICS.keys()
+                )
+            ).fetchall()
+            scan_rows = self._conn.execute(
+                "SELECT s.point_id, s.bssid, COALESCE(s.ssid, ''), "
+                's.frequency, s.signal_mbm '
+                'FROM scan_results s JOIN points p ON p.id = s.point_id '
+                'WHERE p.failed IS NOT 1 ORDER BY s.point_id, s.id'
+            ).fetchall()
+            failed = self._conn.execute(
+                'SELECT COUNT(*) FROM points WHERE failed = 1'
+            ).fetchone()[0]
+        if failed:
+            logger.warning('Skipping %d failed survey points', failed)
+        columns = list(zip(*rows)) or [()] * (7 + len(METRICS))
+        ids = np.array(columns[0], dtype=np.int_)
+        present = np.array(columns[6], dtype=np.int64)
+        values = {
+            k: np.array(columns[7 + idx], dtype=float)
+            for idx, k in enumerate(METRICS.keys())
+        }
+        scan = None
+        if all(columns[5]):
+            scan_columns = list(zip(*scan_rows)) or [()] * 5
+            scan = {
+                'point': np.searchsorted(
+                    ids, np.array(scan_columns[0], dtype=np.int_)
+                ),
+                'bssid': np.array(scan_columns[1], dtype=str),
+                'ssid': np.array(scan_columns[2], dtype=str),
+                'frequency': np.array(scan_columns[3], dtype=float),
+                'signal_mbm': np.array(scan_columns[4], dtype=float),
+            }
+        return Survey(
+            self.header, np.array(columns[1], dtype=float),
+            np.array(columns[2], dtype=float), values,
+            {k: (present >> idx) & 1 == 1
+             for idx, k in enumerate(METRICS.keys())},
+            list(columns[3]), np.array(columns[4], dtype=float), scan
+        )
@@ -0,0 +1,930 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import json
+import logging
+import os
+import sys
+from array import array
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+#: Number of characters read from a survey file at a time.
+CHUNK_SIZE = 1024 * 1024
+
+#: File extension of binary (NumPy ``.npz``) survey files.
+NPZ_EXTENSION = '.npz'
+
+#: File extension of SQLite survey stores (see :py:mod:`~.store`).
+SQLITE_EXTENSION = '.sqlite'
+
+#: Survey storage formats, by name, and their file extensions.
+STORES = {
+    'json': '.json',
+    'npz': NPZ_EXTENSION,
+    'sqlite': SQLITE_EXTENSION,
+}
+
+#: Version of the binary survey format written by :py:func:`~.write_npz`.
+NPZ_FORMAT = 1
+
+#: Location of the scan results in a survey point; these are stored in a
+#: separate, de-duplicated BSS table in binary survey files.
+SCAN_PATH = ('result', 'scan_results')
+
+#: Scan result fields that differ each time the same BSS is seen. Binary
+#: survey files store these per observation and the other fields once per
+#: distinct BSS.
+SCAN_VOLATILE = ('signal_mbm', 'signal_unspec', 'seen_ms_ago', 'tsf')
+
+
+#: How each heatmap metric is extracted from the ``result`` dict of a survey
+#: point, as a ``(path, required, scale, offset)`` tuple: the keys leading to
+#: the value, whether every point must have it (otherwise the metric has
+#: holes where it is missing), and a linear transform applied to the value.
+METRICS = {
+    'channel': (('channel',), True, 1.0, 0),
+    'tcp_upload_Mbps': (('tcp', 'received_Mbps'), False, 1.0, 0),
+    'tcp_download_Mbps': (('tcp-reverse', 'received_Mbps'), False, 1.0, 0),
+    'udp_download_Mbps': (('udp', 'Mbps'), False, 1.0, 0),
+    'jitter_download': (('udp', 'jitter_ms'), False, 1.0, 0),
+    'udp_upload_Mbps': (('udp-reverse', 'Mbps'), False, 1.0, 0),
+    'jitter_upload': (('udp-reverse', 'jitter_ms'), False, 1.0, 0),
+    'tx_power': (('tx_power',), True, 1.0, 0),
+    'frequency': (('frequency',), True, 1e-3, 0),
+    'channel_bitrate': (('bitrate',), False, 1.0, 0),
+    'signal_quality': (('signal_mbm',), True, 1.0, 130),
+}
+
+
+def _metric_value(result, spec):
+    """
+    Return a ``(present, value)`` tuple for one of :py:data:`~.METRICS` in
+    the ``result`` dict of a survey point.
+    """
+    path, required, scale, offset = spec
+    value = result
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            if required:
+                raise KeyError(key)
+            return False, None
+        value = value[key]
+    if value is not None:
+        value = value * scale + offset
+    return True, value
+
+
+class _JSONStream(object):
+    """
+    Minimal incremental JSON tokenizer over a text file handle, which only
+    ever holds (roughly) one top-level array element in memory at a time.
+    """
+
+    def __init__(self, fh, chunk_size=None):
+        self._fh = fh
+        self._chunk_size = chunk_size or CHUNK_SIZE
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self, size=None):
+        if self._eof:
+            return False
+        chunk = self._fh.read(size or self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """return the next non-whitespace character, or '' at EOF"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in \
+                    ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(
+                'Invalid survey JSON: expected %r but found %r' % (
+                    char, self.peek()
+                )
+            )
+        self._pos += 1
+
+    def more(self, close, first):
+        """
+        Consume the separator before the next element of an object or array
+        that ends with ``close``, and return whether there is one, or else
+        consume ``close``; ``first`` is whether no element was read yet.
+        """
+        if self.peek() == close:
+            self._pos += 1
+            return False
+        if not first:
+            self.expect(',')
+        return True
+
+    def key(self):
+        """decode and return the next object key, and consume the ':'"""
+        if self.peek() != '"':
+            raise ValueError(
+                'Invalid survey JSON: expected a key but found %r' % (
+                    self.peek()
+                )
+            )
+        key = self.value()
+        self.expect(':')
+        return key
+
+    def end(self):
+        """check that nothing but whitespace is left"""
+        if self.peek() != '':
+            raise ValueError(
+                'Invalid survey JSON: extra data after the document'
+            )
+
+    def value(self):
+        """decode and return the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                # incomplete value; read at least as much again as we have
+                if not self._fill(max(
+                    self._chunk_size, len(self._buf) - self._pos
+                )):
+                    raise
+                continue
+            if not self._eof and not isinstance(obj, (dict, list, str)) and (
+                end == len(self._buf) or self._buf[end] in '.eE+-'
+            ):
+                # a number, true/false/null may continue in the next chunk;
+                # "1." or "1e" is the start of a number, not 1
+                self._fill()
+                continue
+            self._pos = end
+            return obj
+
+
+def iter_survey_file(path, header=None):
+    """
+    Incrementally parse a survey JSON file, yielding each element of its
+    ``survey_points`` list in turn without ever loading the whole document.
+    Binary (``.npz``) survey files are decoded with :py:func:`~.read_npz`,
+    and SQLite stores (``.sqlite``) are read with
+    :py:meth:`~.SQLiteStore.points`.
+
+    :param path: path to the survey file
+    :type path: str
+    :param header: if given, a dict that all other top-level keys of the
+      document (i.e. ``img_path``) are stored in; these are complete once the
+      generator is exhausted
+    :type header: dict
+    :raises ValueError: if the document has no ``survey_points`` list
+    """
+    if header is None:
+        header = {}
+    if path.endswith(SQLITE_EXTENSION):
+        from wifi_survey_heatmap.store import SQLiteStore
+        with SQLiteStore(path) as store:
+            header.update(store.header)
+            for _, point in store.points():
+                yield point
+        return
+    if path.endswith(NPZ_EXTENSION):
+        data = read_npz(path)
+        for point in data.pop('survey_points'):
+            yield point
+        header.update(data)
+        return
+    found = False
+    with open(path, 'r') as fh:
+        stream = _JSONStream(fh)
+        stream.expect('{')
+        first = True
+        while stream.more('}', first):
+            first = False
+            key = stream.key()
+            if key != 'survey_points' or stream.peek() != '[':
+                header[key] = stream.value()
+                continue
+            found = True
+            stream.expect('[')
+            first_point = True
+            while stream.more(']', first_point):
+                first_point = False
+                yield stream.value()
+        stream.end()
+    if not found:
+        raise ValueError('No survey points found in %s' % path)
+
+
+def is_survey_file(path):
+    """
+    Return whether ``path`` looks like a survey file: a binary survey or
+    SQLite store by its extension (see :py:data:`~.STORES`), or a JSON
+    document with a ``survey_points`` list. Only the top-level keys of a JSON
+    document before that list are read, so this is cheap even for large
+    surveys, and other JSON files (thresholds, manifests) are rejected.
+
+    :param path: path to the file
+    :type path: str
+    :rtype: bool
+    """
+    if path.endswith(NPZ_EXTENSION) or path.endswith(SQLITE_EXTENSION):
+        return os.path.isfile(path)
+    if not path.endswith(STORES['json']):
+        return False
+    try:
+        with open(path, 'r') as fh:
+            stream = _JSONStream(fh)
+            stream.expect('{')
+            first = True
+            while stream.more('}', first):
+                first = False
+                if stream.key() == 'survey_points':
+                    return stream.peek() == '['
+                stream.value()
+            return False
+    except (OSError, ValueError):
+        return False
+
+
+class Survey(object):
+    """
+    Compact, columnar representation of the parts of a survey file that are
+    needed to generate heatmaps, built by :py:func:`~.load_survey`.
+
+    :ivar header: top-level keys of the survey file other than
+      ``survey_points`` (i.e. ``img_path``)
+    :ivar x: X coordinate of each point (float array)
+    :ivar y: Y coordinate of each point (float array)
+    :ivar values: metric name to float array of its value at each point;
+      NaN where the value is missing or null
+    :ivar present: metric name to boolean array of whether the metric was
+      measured at each point (null values are present)
+    :ivar mac: BSSID each point was connected to (list of str)
+    :ivar ap_frequency: frequency in MHz of the connected AP (float array)
+    :ivar scan: dict of flat arrays with one entry per scan result, or None
+      if not every point has scan results: ``point`` (index of the survey
+      point), ``bssid``, ``ssid`` (str arrays), ``frequency`` (Hz) and
+      ``signal_mbm``
+    """
+
+    def __init__(self, header, x, y, values, present, mac, ap_frequency,
+                 scan):
+        self.header = header
+        self.x = x
+        self.y = y
+        self.values = values
+        self.present = present
+        self.mac = mac
+        self.ap_frequency = ap_frequency
+        self.scan = scan
+
+    def __len__(self):
+        return len(self.x)
+
+    def distinct(self):
+        """
+        Return the index of the points at distinct coordinates, keeping the
+        first of several points at the same coordinates and logging a warning
+        for each of the others; if there are no duplicates, a slice of all
+        points, so that indexing with it doesn't copy the arrays.
+        """
+        _, idx = np.unique(
+            np.column_stack((self.x, self.y)), axis=0, return_index=True
+        )
+        if len(idx) == len(self):
+            return slice(None)
+        dupes = np.ones(len(self), dtype=bool)
+        dupes[idx] = False
+        for i in np.flatnonzero(dupes):
+            logger.warning(
+                'Two overlapping datapoints found. Discarding one of them. '
+                'point=%s', (float(self.x[i]), float(self.y[i]))
+            )
+        idx.sort()
+        return idx
+
+
+class BSSIDIndex(object):
+    """
+    Inverted index of a survey's scan results, from each BSSID seen to the
+    survey points it was seen at and its signal there. Built with a single
+    sort of the scan table of a :py:class:`~.Survey`.
+
+    :param scan: the ``scan`` dict of a :py:class:`~.Survey`
+    :type scan: dict
+    :param ignore_ssids: SSIDs whose scan results are left out
+    :type ignore_ssids: list
+    :ivar bssids: str array of the distinct BSSIDs, in sorted order
+    :ivar ssids: str array of the SSID of each BSSID
+    """
+
+    def __init__(self, scan, ignore_ssids=()):
+        keep = np.ones(len(scan['bssid']), dtype=bool)
+        if len(ignore_ssids):
+            keep = ~np.isin(scan['ssid'], ignore_ssids)
+        self.bssids, first, codes = np.unique(
+            scan['bssid'][keep], return_index=True, return_inverse=True
+        )
+        self.ssids = scan['ssid'][keep][first]
+        codes = codes.ravel()
+        order = np.argsort(codes, kind='stable')
+        self._point = scan['point'][keep][order]
+        self._signal = scan['signal_mbm'][keep][order]
+        self._bounds = np.searchsorted(
+            codes[order], np.arange(len(self.bssids) + 1)
+        )
+
+    def __len__(self):
+        return len(self.bssids)
+
+    def observations(self, idx):
+        """
+        Return ``(points, signal_mbm)`` arrays of the survey point indices
+        where the BSSID at index ``idx`` of :py:attr:`~.bssids` was seen, and
+        its signal at each.
+        """
+        start, end = self._bounds[idx], self._bounds[idx + 1]
+        return self._point[start:end], self._signal[start:end]
+
+
+def load_survey(path):
+    """
+    Load a survey file into a :py:class:`~.Survey`.
+
+    JSON files are streamed, extracting only the fields needed for heatmaps
+    from each point as it is parsed. Peak memory use is the size of the
+    resulting arrays plus one survey point, rather than several times the
+    size of the file. Binary (``.npz``) files and SQLite stores
+    (``.sqlite``) are already columnar, so only the needed columns are read
+    and nothing is parsed. Points marked ``failed`` (whose measurement was
+    aborted, so their results are incomplete) are left out.
+
+    Changes to JSON or binary surveys that are still only in the survey's
+    journal (see :py:mod:`~.journal`) are applied first.
+
+    :param path: path to the survey file
+    :type path: str
+    :rtype: Survey
+    """
+    from wifi_survey_heatmap.journal import has_journal_events, replay_journal
+    if path.endswith(SQLITE_EXTENSION):
+        from wifi_survey_heatmap.store import SQLiteStore
+        with SQLiteStore(path) as store:
+            survey = store.load_survey()
+    elif has_journal_events(path):
+        header = {}
+        survey = _survey_from_points(
+            replay_journal(path, header=header), header
+        )
+    elif path.endswith(NPZ_EXTENSION):
+        survey = _load_npz_survey(path)
+    else:
+        survey = _load_json_survey(path)
+    logger.info('Loaded %d survey points from %s', len(survey), path)
+    return survey
+
+
+def iter_survey(path, header=None):
+    """
+    Yield each point of a survey file, like :py:func:`~.iter_survey_file`,
+    but with any changes that are still only in the survey's journal applied
+    first, like :py:func:`~.load_survey`. Unless there are such changes, the
+    file is streamed.
+
+    :param path: path to the survey file
+    :type path: str
+    :param header: if given, a dict that all other top-level keys of the
+      survey file are stored in
+    :type header: dict
+    """
+    from wifi_survey_heatmap.journal import has_journal_events, replay_journal
+    if not path.endswith(SQLITE_EXTENSION) and has_journal_events(path):
+        for point in replay_journal(path, header=header):
+            yield point
+        return
+    for point in iter_survey_file(path, header=header):
+        yield point
+
+
+def _load_json_survey(path):
+    header = {}
+    return _survey_from_points(iter_survey_file(path, header=header), header)
+
+
+def _survey_from_points(points, header):
+    """
+    Build a :py:class:`~.Survey` from an iterable of survey point dicts;
+    ``header`` only has to be complete once ``points`` is exhausted.
+    """
+    x = array('d')
+    y = array('d')
+    values = {k: array('d') for k in METRICS.keys()}
+    present = {k: array('b') for k in METRICS.keys()}
+    mac = []
+    ap_frequency = array('d')
+    has_scan = True
+    scan_point = array('l')
+    scan_freq = array('d')
+    scan_signal = array('d')
+    scan_bssid = []
+    scan_ssid = []
+    failed = 0
+    for row in points:
+        if row.get('failed'):
+            failed += 1
+            continue
+        idx = len(x)
+        x.append(row['x'])
+        y.append(row['y'])
+        result = row['result']
+        for key, spec in METRICS.items():
+            is_present, value = _metric_value(result, spec)
+            present[key].append(is_present)
+            values[key].append(np.nan if value is None else value)
+        mac.append(result['mac'])
+        ap_frequency.append(result['frequency'])
+        if not has_scan:
+            continue
+        if 'scan_results' not in result:
+            has_scan = False
+            continue
+        for bssid, bss in result['scan_results'].items():
+            scan_point.append(idx)
+            scan_bssid.append(sys.intern(bssid))
+            scan_ssid.append(sys.intern(bss['ssid']))
+            scan_freq.append(bss['frequency'])
+            scan_signal.append(bss['signal_mbm'])
+    if failed:
+        logger.warning('Skipping %d failed survey points', failed)
+    scan = None
+    if has_scan:
+        scan = {
+            'point': np.frombuffer(scan_point, dtype=np.int_).copy(),
+            'bssid': np.array(scan_bssid, dtype=str),
+            'ssid': np.array(scan_ssid, dtype=str),
+            'frequency': np.frombuffer(scan_freq),
+            'signal_mbm': np.frombuffer(scan_signal),
+        }
+    return Survey(
+        header, np.frombuffer(x), np.frombuffer(y),
+        {k: np.frombuffer(v) for k, v in values.items()},
+        {k: np.frombuffer(v, dtype=np.int8).astype(bool)
+         for k, v in present.items()},
+        mac, np.frombuffer(ap_frequency), scan
+    )
+
+
+def survey_filename(title, store=None):
+    """
+    Return the survey file for a survey title.
+
+    If ``store`` is given, this is the title with that store's extension
+    (from :py:data:`~.STORES`) added if it doesn't already have it.
+    Otherwise it is the title itself if it already has one of those
+    extensions, or else the JSON file, unless only a binary or SQLite file
+    for the title exists.
+
+    :param title: survey title or filename
+    :type title: str
+    :param store: storage format; one of the :py:data:`~.STORES` keys
+    :type store: str
+    :rtype: str
+    """
+    if store is not None:
+        ext = STORES[store]
+        return title if title.endswith(ext) else title + ext
+    if any(title.endswith(ext) for ext in STORES.values()):
+        return title
+    if not os.path.exists(title + '.json'):
+        for ext in (NPZ_EXTENSION, SQLITE_EXTENSION):
+            if os.path.exists(title + ext):
+                return title + ext
+    return title + '.json'
+
+
+def _kind(value):
+    """
+    Return the one-character code for how a JSON leaf value is stored in a
+    binary survey: ``n`` (null, not stored), ``b``, ``i``, ``f``, ``s``, or
+    ``j`` for anything else, which is stored as JSON text.
+    """
+    if value is None:
+        return 'n'
+    if isinstance(value, bool):
+        return 'b'
+    if isinstance(value, int):
+        return 'i' if -2 ** 63 <= value < 2 ** 63 else 'j'
+    if isinstance(value, float):
+        return 'f'
+    if isinstance(value, str):
+        return 's'
+    return 'j'
+
+
+def _flatten(obj, path, leaves, special=None):
+    """
+    Append a ``(path, kind, value)`` tuple to ``leaves`` for every leaf of a
+    nested dict, depth first in key order. A dict at path ``special`` gets
+    kind ``S`` and is not descended into.
+    """
+    for key, value in obj.items():
+        leaf = path + (key,)
+        if leaf == special and isinstance(value, dict):
+            leaves.append((leaf, 'S', None))
+        elif isinstance(value, dict) and value:
+            _flatten(value, leaf, leaves, special=special)
+        else:
+            leaves.append((leaf, _kind(value), value))
+
+
+class _ColumnEncoder(object):
+    """
+    Store a sequence of nested dicts ("records") as columns: one array per
+    distinct ``(path, kind)`` leaf, plus one layout ("template") per distinct
+    sequence of leaves, which preserves key order and nesting.
+    """
+
+    def __init__(self, special=None):
+        self._special = special
+        self._templates = {}
+        self._record_templates = []
+        self._columns = {}
+
+    def add(self, record):
+        leaves = []
+        _flatten(record, (), leaves, special=self._special)
+        row = len(self._record_templates)
+        template = tuple((path, kind) for path, kind, _ in leaves)
+        self._record_templates.append(
+            self._templates.setdefault(template, len(self._templates))
+        )
+        for path, kind, value in leaves:
+            if kind in ('n', 'S'):
+                continue
+            if kind == 'j':
+                value = json.dumps(value)
+            rows, values = self._columns.setdefault((path, kind), ([], []))
+            rows.append(row)
+            values.append(value)
+
+    def save(self, prefix, arrays, meta):
+        """
+        Add this encoder's arrays, named with ``prefix``, to the ``arrays``
+        dict and its templates and column list to the ``meta`` dict.
+        """
+        num = len(self._record_templates)
+        arrays[prefix + 'template'] = np.array(
+            self._record_templates, dtype=np.int32
+        )
+        meta[prefix + 'templates'] = [
+            [[list(path), kind] for path, kind in template]
+            for template in self._templates.keys()
+        ]
+        meta[prefix + 'columns'] = []
+        for idx, ((path, kind), (rows, values)) in enumerate(
+            self._columns.items()
+        ):
+            if kind == 'i':
+                column = np.zeros(num, dtype=np.int64)
+            elif kind == 'f':
+                column = np.full(num, np.nan)
+            elif kind == 'b':
+                column = np.zeros(num, dtype=bool)
+            else:
+                column = np.full(num, '', dtype=np.array(values).dtype)
+            column[rows] = values
+            arrays['%s%d' % (prefix, idx)] = column
+            meta[prefix + 'columns'].append([list(path), kind])
+
+
+class _ColumnDecoder(object):
+    """
+    Read records stored by :py:class:`~._ColumnEncoder` from an open
+    ``.npz`` file.
+    """
+
+    def __init__(self, npz, meta, prefix):
+        self._npz = npz
+        self._prefix = prefix
+        self.record_templates = npz[prefix + 'template']
+        self.templates = [
+            [(tuple(path), kind) for path, kind in template]
+            for template in meta[prefix + 'templates']
+        ]
+        self._columns = {
+            (tuple(path), kind): '%s%d' % (prefix, idx)
+            for idx, (path, kind) in enumerate(meta[prefix + 'columns'])
+        }
+
+    def __len__(self):
+        return len(self.record_templates)
+
+    def column(self, path, kind):
+        """return the array for a ``(path, kind)`` leaf, or None"""
+        name = self._columns.get((path, kind))
+        if name is None:
+            return None
+        return self._npz[name]
+
+    def kinds(self, path):
+        """
+        Return an array of the kind of the leaf at ``path`` in each record,
+        with ``''`` where the record doesn't have it.
+        """
+        per_template = np.array([
+            dict(template).get(path, '') for template in self.templates
+        ] + [''])
+        return per_template[self.record_templates]
+
+    def numeric(self, path):
+        """
+        Return ``(values, present)`` arrays for the leaf at ``path``, as
+        floats that are NaN where the value is null or not a number.
+        """
+        kinds = self.kinds(path)
+        values = np.full(len(self), np.nan)
+        for kind in ('i', 'f'):
+            column = self.column(path, kind)
+            if column is not None:
+                mask = kinds == kind
+                values[mask] = column[mask]
+        return values, kinds != ''
+
+    def records(self, special=None):
+        """
+        Yield every record as a nested dict; ``special`` is called with the
+        record index to get the value of ``S`` leaves.
+        """
+        columns = {
+            key: self._npz[name].tolist()
+            for key, name in self._columns.items()
+        }
+        for row, template in enumerate(self.record_templates.tolist()):
+            record = {}
+            for path, kind in self.templates[template]:
+                parent = record
+                for key in path[:-1]:
+                    parent = parent.setdefault(key, {})
+                if kind == 'n':
+                    value = None
+                elif kind == 'S':
+                    value = special(row)
+                elif kind == 'j':
+                    value = json.loads(columns[(path, kind)][row])
+                else:
+                    value = columns[(path, kind)][row]
+                parent[path[-1]] = value
+            yield record
+
+
+def open_temp(path, mode='w'):
+    """
+    Create and open a new, uniquely named file in the directory of ``path``,
+    to write the new contents of ``path`` to and then :py:func:`os.replace`
+    it over ``path``. Unlike :py:func:`tempfile.mkstemp`, which makes the
+    file readable by its owner only, the file is created with the usual
+    permissions (as allowed by the umask).
+
+    :param path: path of the file that will be replaced
+    :type path: str
+    :param mode: ``'w'`` or ``'wb'``
+    :type mode: str
+    :return: ``(file object, path of the temporary file)`` tuple
+    :rtype: tuple
+    """
+    while True:
+        tmp = '%s.%s.tmp' % (os.path.abspath(path), os.urandom(4).hex())
+        try:
+            return open(tmp, mode.replace('w', 'x')), tmp
+        except FileExistsError:
+            continue
+
+
+def write_npz(path, data):
+    """
+    Write a survey to a binary (``.npz``) survey file, which can be
+    converted back to the identical survey with :py:func:`~.read_npz`.
+
+    Every leaf value of the survey points is stored in a typed column, and
+    the scan results in a table of distinct BSSes plus per-observation
+    columns for the :py:data:`~.SCAN_VOLATILE` fields. The file is written to
+    a temporary file and then moved into place.
+
+    :param path: path to write to; should end in ``.npz``
+    :type path: str
+    :param data: survey, i.e. a dict with ``img_path`` and ``survey_points``
+    :type data: dict
+    """
+    points = _ColumnEncoder(special=SCAN_PATH)
+    observations = _ColumnEncoder()
+    bss_index = {}
+    bss_table = []
+    scan_point = []
+    scan_bss = []
+    for idx, point in enumerate(data['survey_points']):
+        points.add(point)
+        scan = point.get(SCAN_PATH[0])
+        if isinstance(scan, dict):
+            scan = scan.get(SCAN_PATH[1])
+        if not isinstance(scan, dict):
+            continue
+        for bssid, bss in scan.items():
+            volatile = {}
+            if isinstance(bss, dict):
+                volatile = {
+                    k: v for k, v in bss.items() if k in SCAN_VOLATILE
+                }
+                entry = [
+                    bssid, list(bss.keys()),
+                    {k: v for k, v in bss.items() if k not in SCAN_VOLATILE}
+                ]
+            else:
+                entry = [bssid, None, bss]
+            entry = json.dumps(entry)
+            if entry not in bss_index:
+                bss_index[entry] = len(bss_table)
+                bss_table.append(entry)
+            scan_point.append(idx)
+            scan_bss.append(bss_index[entry])
+            observations.add(volatile)
+    meta = {
+        'format': NPZ_FORMAT,
+        'keys': list(data.keys()),
+        'header': {k: v for k, v in data.items() if k != 'survey_points'},
+    }
+    entries = [json.loads(e) for e in bss_table]
+    arrays = {
+        'bss': np.array(bss_table, dtype=str),
+        'bss_bssid': np.array([e[0] for e in entries], dtype=str),
+        'bss_ssid': np.array([
+            e[2].get('ssid', '') if isinstance(e[2], dict) else ''
+            for e in entries
+        ], dtype=str),
+        'bss_frequency': np.array([
+            e[2].get('frequency', np.nan) if isinstance(e[2], dict)
+            else np.nan for e in entries
+        ], dtype=float),
+        'scan_point': np.array(scan_point, dtype=np.int32),
+        'scan_bss': np.array(scan_bss, dtype=np.int32),
+    }
+    points.save('point_', arrays, meta)
+    observations.save('scan_', arrays, meta)
+    arrays['meta'] = np.array(json.dumps(meta))
+    fh, tmp = open_temp(path, 'wb')
+    try:
+        with fh:
+            np.savez_compressed(fh, **arrays)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _read_npz_meta(npz, path):
+    meta = json.loads(str(npz['meta']))
+    if meta.get('format') != NPZ_FORMAT:
+        raise ValueError(
+            'Unsupported binary survey format %s in %s' % (
+                meta.get('format'), path
+            )
+        )
+    return meta
+
+
+def read_npz(path):
+    """
+    Read a binary survey file written by :py:func:`~.write_npz` back into
+    the survey dict it was written from.
+
+    :param path: path to the ``.npz`` survey file
+    :type path: str
+    :rtype: dict
+    """
+    with np.load(path) as npz:
+        meta = _read_npz_meta(npz, path)
+        bss = [json.loads(e) for e in npz['bss'].tolist()]
+        observations = _ColumnDecoder(npz, meta, 'scan_').records()
+        scans = {}
+        for point, idx in zip(
+            npz['scan_point'].tolist(), npz['scan_bss'].tolist()
+        ):
+            bssid, keys, static = bss[idx]
+            volatile = next(observations)
+            if keys is not None:
+                static = {
+                    k: volatile[k] if k in SCAN_VOLATILE else static[k]
+                    for k in keys
+                }
+            scans.setdefault(point, []).append((bssid, static))
+
+        def scan_results(point):
+            return dict(scans.get(point, []))
+
+        points = list(
+            _ColumnDecoder(npz, meta, 'point_').records(special=scan_results)
+        )
+    return {
+        k: points if k == 'survey_points' else meta['header'][k]
+        for k in meta['keys']
+    }
+
+
+def _load_npz_survey(path):
+    with np.load(path) as npz:
+        meta = _read_npz_meta(npz, path)
+        points = _ColumnDecoder(npz, meta, 'point_')
+        keep = points.kinds(('failed',)) != 'b'
+        if not keep.all():
+            keep |= ~points.column(('failed',), 'b').astype(bool)
+        if not keep.all():
+            logger.warning(
+                'Skipping %d failed survey points', np.count_nonzero(~keep)
+            )
+        x = points.numeric(('x',))[0][keep]
+        y = points.numeric(('y',))[0][keep]
+        values = {}
+        present = {}
+        for key, (spec_path, required, scale, offset) in METRICS.items():
+            values[key], present[key] = (
+                column[keep] for column in points.numeric(
+                    ('result',) + spec_path
+                )
+            )
+            if required and not present[key].all():
+                raise KeyError(spec_path[-1])
+            values[key] = values[key] * scale + offset
+        ap_frequency = points.numeric(('result', 'frequency'))[0][keep]
+        mac = points.column(('result', 'mac'), 's')
+        if mac is None or not (
+            points.kinds(('result', 'mac'))[keep] == 's'
+        ).all():
+            raise KeyError('mac')
+        scan = None
+        if (points.kinds(SCAN_PATH)[keep] == 'S').all():
+            bss = npz['scan_bss']
+            point = npz['scan_point'].astype(np.int_)
+            kept = keep[point]
+            scan = {
+                # renumber the points that are left
+                'point': (np.cumsum(keep) - 1)[point[kept]],
+                'bssid': npz['bss_bssid'][bss[kept]],
+                'ssid': npz['bss_ssid'][bss[kept]],
+                'frequency': npz['bss_frequency'][bss[kept]],
+                'signal_mbm': _ColumnDecoder(
+                    npz, meta, 'scan_'
+                ).numeric(('signal_mbm',))[0][kept],
+            }
+        return Survey(
+            meta['header'], x, y, values, present, list(mac[keep]),
+            ap_frequency, scan
+        )
@@ -0,0 +1,208 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import logging
+
+import numpy as np
+
+from wifi_survey_heatmap.convert import write_survey
+
+logger = logging.getLogger(__name__)
+
+#: Wi-Fi channel numbers, and their center frequencies in MHz, that the
+#: access points of synthetic surveys are spread across.
+SYNTHETIC_CHANNELS = [
+    (1, 2412), (6, 2437), (11, 2462), (36, 5180), (44, 5220), (149, 5745)
+]
+
+#: Floorplan pixels per meter, for the path loss model of synthetic surveys.
+PIXELS_PER_METER = 40.0
+
+#: Size, in pixels, of the rooms drawn on synthetic floorplans.
+ROOM_SIZE = 400
+
+
+def synthetic_survey(num_points, bssids_per_scan=12, num_aps=None, iperf=1.0,
+                     width=2000, height=1500, img_path='floorplan.png',
+                     seed=0):
+    """
+    Return a synthetic survey, as a dict with ``img_path`` and
+    ``survey_points`` like the surveys written by ``wifi-survey``, for
+    benchmarking. The same arguments always give the same survey.
+
+    Access points are placed at random on the floorplan, and the signal
+    strength of each of them at each survey point follows a log-distance
+    path loss model with some noise. Each point is associated to its
+    strongest access point, and iperf3 throughput falls off with the signal
+    strength of that one.
+
+    :param num_points: number of survey points, all at distinct coordinates
+    :type num_points: int
+    :param bssids_per_scan: number of access points in the scan results of
+      each point (the strongest ones); 0 for points without scan results
+    :type bssids_per_scan: int
+    :param num_aps: total number of access points; defaults to twice
+      ``bssids_per_scan``
+    :type num_aps: int
+    :param iperf: fraction of the points that have iperf3 results
+    :type iperf: float
+    :param width: floorplan width in pixels
+    :type width: int
+    :param height: floorplan height in pixels
+    :type height: int
+    :param img_path: floorplan image path to store in the survey
+    :type img_path: str
+    :param seed: random seed
+    :type seed: int
+    :rtype: dict
+    """
+    rng = np.random.default_rng(seed)
+    if num_aps is None:
+        num_aps = max(1, 2 * bssids_per_scan)
+    bssids_per_scan = min(bssids_per_scan, num_aps)
+    bssids = [
+        '02:00:00:%02x:%02x:%02x' % ((i >> 16) & 255, (i >> 8) & 255, i & 255)
+        for i in range(num_aps)
+    ]
+    ssids = ['synthetic-%d' % (i % 4) for i in range(num_aps)]
+    ap_x = rng.uniform(0, width, num_aps)
+    ap_y = rng.uniform(0, height, num_aps)
+    ap_channel = rng.integers(len(SYNTHETIC_CHANNELS), size=num_aps)
+    pos = rng.choice((width + 1) * (height + 1), num_points, replace=False)
+    x = pos % (width + 1)
+    y = pos // (width + 1)
+    dist = np.hypot(
+        x[:, np.newaxis] - ap_x, y[:, np.newaxis] - ap_y
+    ) / PIXELS_PER_METER
+    signal = -30 - 30 * np.log10(1 + dist) + rng.normal(0, 2, dist.shape)
+    signal = np.clip(np.round(signal, 2), -100, -20)
+    strongest = np.argsort(-signal, axis=1)[:, :max(1, bssids_per_scan)]
+    has_iperf = rng.random(num_points) < iperf
+    noise = rng.uniform(0.9, 1.1, (num_points, 6))
+    points = []
+    for i in range(num_points):
+        ap = strongest[i, 0]
+        channel, freq = SYNTHETIC_CHANNELS[ap_channel[ap]]
+        # 0 at the noise floor to 1 right next to the access point
+        link = (signal[i, ap] + 100) / 70.0
+        if freq > 5000:
+            bitrate = 866.7 if link > 0.5 else 433.3
+        else:
+            bitrate = 144.4 if link > 0.5 else 72.2
+        result = {
+            'mac': bssids[ap],
+            'ssid': ssids[ap],
+            'channel': channel,
+            'frequency': freq,
+            'tx_power': 20.0,
+            'signal_mbm': float(signal[i, ap]),
+            'bitrate': bitrate,
+        }
+        if has_iperf[i]:
+            tcp = bitrate * 0.6 * link * noise[i, :2]
+            udp = bitrate * 0.5 * link * noise[i, 2:4]
+            jitter = 0.05 + (1 - link) * noise[i, 4:6]
+            for name, value in (('tcp', tcp[0]), ('tcp-reverse', tcp[1])):
+                result[name] = {
+                    'error': None, 'protocol': 'TCP',
+                    'sent_Mbps': round(float(value) * 1.02, 3),
+                    'received_Mbps': round(float(value), 3),
+                    'retransmits': int((1 - link) * 20),
+                }
+            for name, value, jit in (('udp', udp[0], jitter[0]),
+                                     ('udp-reverse', udp[1], jitter[1])):
+                result[name] = {
+                    'error': None, 'protocol': 'UDP',
+                    'Mbps': round(float(value), 3),
+                    'jitter_ms': round(float(jit), 4),
+                    'lost_percent': round(float((1 - link) * 5), 2),
+                }
+        if bssids_per_scan:
+            result['scan_results'] = {
+                bssids[j]: {
+                    'bssid': bssids[j],
+                    'ssid': ssids[j],
+                    'frequency': SYNTHETIC_CHANNELS[ap_channel[j]][1] * 1000000,
+                    'signal_mbm': float(signal[i, j]),
+                } for j in strongest[i]
+            }
+        points.append({
+            'x': int(x[i]), 'y': int(y[i]), 'result': result, 'failed': False
+        })
+    return {'img_path': img_path, 'survey_points': points}
+
+
+def synthetic_floorplan(width=2000, height=1500, room_size=ROOM_SIZE,
+                        wall=4):
+    """
+    Return a synthetic floorplan image: white, with a grid of walls
+    ``room_size`` pixels apart that each have a doorway in the middle.
+
+    :rtype: numpy.ndarray
+    """
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    door = room_size // 4
+    for pos in list(range(0, width, room_size)) + [width - wall]:
+        image[:, pos:pos + wall] = 64
+    for pos in list(range(0, height, room_size)) + [height - wall]:
+        image[pos:pos + wall, :] = 64
+    # doorways, leaving the outer walls intact
+    for pos in range(room_size // 2 - door // 2, height, room_size):
+        image[pos:pos + door, wall:width - wall] = 255
+    for pos in range(room_size // 2 - door // 2, width, room_size):
+        image[wall:height - wall, pos:pos + door] = 255
+    return image
+
+
+def write_synthetic_survey(path, num_points, img_path, width=2000,
+                           height=1500, **kwargs):
+    """
+    Write a :py:func:`~.synthetic_survey` to ``path`` (in the format given
+    by its extension, see :py:func:`~.write_survey`) and its
+    :py:func:`~.synthetic_floorplan` to the PNG file ``img_path``. Other
+    keyword arguments are passed on to :py:func:`~.synthetic_survey`.
+    """
+    from matplotlib.image import imsave
+    imsave(img_path, synthetic_floorplan(width, height))
+    data = synthetic_survey(
+        num_points, width=width, height=height, img_path=img_path, **kwargs
+    )
+    write_survey(path, data)
+    logger.info(
+        'Wrote synthetic survey of %d points to %s (floorplan: %s)',
+        num_points, path, img_path
+    )
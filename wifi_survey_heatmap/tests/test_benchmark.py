@@ -0,0 +1,62 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+from wifi_survey_heatmap.benchmark import (
+    PipelineBenchmark, format_pipeline_results
+)
+
+
+class TestPipelineBenchmark(object):
+
+    def test_run(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        bench = PipelineBenchmark(
+            width=120, height=80, bssids_per_scan=3, methods=['local'],
+            renderers=['raster'], stores=['json', 'npz']
+        )
+        results = bench.run([8, 12])
+        assert sorted(set(r[0] for r in results)) == [8, 12]
+        assert sorted(set((r[1], r[2]) for r in results if r[0] == 8)) == [
+            ('channels', None), ('interpolate', 'local'), ('load', 'json'),
+            ('load', 'npz'), ('plot', 'raster'), ('thresholds', 'json'),
+            ('thresholds', 'npz'),
+        ]
+        assert all(r[3] >= 0 for r in results)
+        lines = format_pipeline_results(results).splitlines()
+        assert len(lines) == len(results) + 1
+        # scratch files are removed
+        assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,190 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import wifi_survey_heatmap.heatmap
+from wifi_survey_heatmap.cache import GridCache
+from wifi_survey_heatmap.heatmap import HeatMapGenerator
+from wifi_survey_heatmap.synthetic import write_synthetic_survey
+
+
+def grid(seed, shape=(40, 60)):
+    return np.random.default_rng(seed).uniform(0, 100, shape)
+
+
+class TestGridCache(object):
+
+    def test_key(self):
+        x = np.array([1.0, 2.0, 3.0])
+        y = np.array([4.0, 5.0, 6.0])
+        values = np.array([7.0, 8.0, 9.0])
+        key = GridCache.key(x, y, values, (60, 40), 'local', neighbors=4)
+        assert key == GridCache.key(
+            x.astype(int), list(y), values.copy(), [60, 40], 'local',
+            neighbors=4
+        )
+        others = [
+            GridCache.key(x + [0, 0, 1], y, values, (60, 40), 'local',
+                          neighbors=4),
+            GridCache.key(x, y + [1, 0, 0], values, (60, 40), 'local',
+                          neighbors=4),
+            GridCache.key(x, y, values + [0, 1, 0], (60, 40), 'local',
+                          neighbors=4),
+            GridCache.key(x, y, values, (40, 60), 'local', neighbors=4),
+            GridCache.key(x, y, values, (60, 40), 'rbf', neighbors=4),
+            GridCache.key(x, y, values, (60, 40), 'local', neighbors=5),
+            GridCache.key(x, y, values, (60, 40), 'local'),
+        ]
+        assert len(set(others + [key])) == len(others) + 1
+
+    def test_hit_and_miss(self, tmp_path):
+        cache = GridCache(str(tmp_path / 'cache'))
+        assert cache.get('a') is None
+        z = grid(0)
+        cache.put('a', z)
+        result = cache.get('a')
+        assert result.dtype == np.float64
+        assert result.shape == z.shape
+        # grids are stored as float32
+        assert np.allclose(result, z, rtol=1e-6)
+        assert cache.get('b') is None
+        assert os.listdir(str(tmp_path / 'cache')) == ['a.npy']
+
+    def test_eviction(self, tmp_path):
+        z = grid(0)
+        cache = GridCache(str(tmp_path))
+        cache.put('a', z)
+        size = os.path.getsize(str(tmp_path / 'a.npy'))
+        cache.max_bytes = 2 * size
+        cache.put('b', grid(1))
+        for age, key in enumerate(['b', 'a']):
+            when = 1000000000 + age
+            os.utime(str(tmp_path / ('%s.npy' % key)), (when, when))
+        # a hit makes "b" the most recently used entry
+        assert cache.get('b') is not None
+        cache.put('c', grid(2))
+        assert sorted(os.listdir(str(tmp_path))) == ['b.npy', 'c.npy']
+        assert cache.get('a') is None
+        assert np.allclose(cache.get('b'), grid(1), rtol=1e-6)
+        # a limit below one grid keeps nothing
+        cache.max_bytes = size - 1
+        cache.evict()
+        assert os.listdir(str(tmp_path)) == []
+
+    @pytest.mark.parametrize('damage', ['empty', 'truncated', 'garbage'])
+    def test_corrupt(self, tmp_path, damage):
+        cache = GridCache(str(tmp_path))
+        z = grid(0)
+        cache.put('a', z)
+        fname = str(tmp_path / 'a.npy')
+        with open(fname, 'rb') as fh:
+            data = fh.read()
+        data = {
+            'empty': b'', 'truncated': data[:len(data) // 2],
+            'garbage': b'not a grid' * 100,
+        }[damage]
+        with open(fname, 'wb') as fh:
+            fh.write(data)
+        assert cache.get('a') is None
+        assert not os.path.exists(fname)
+        cache.put('a', z)
+        assert np.allclose(cache.get('a'), z, rtol=1e-6)
+
+
+class TestInterpolateCache(object):
+
+    def generate(self, monkeypatch, **kwargs):
+        """
+        return the interpolated grids of ``a.json``, and the metrics that
+        were interpolated rather than read from the cache
+        """
+        interpolated = []
+        interpolate_fields = wifi_survey_heatmap.heatmap.interpolate_fields
+
+        def record(method, x, y, fields, *args, **kwargs):
+            interpolated.extend(fields.keys())
+            return interpolate_fields(method, x, y, fields, *args, **kwargs)
+
+        monkeypatch.setattr(
+            wifi_survey_heatmap.heatmap, 'interpolate_fields', record
+        )
+        gen = HeatMapGenerator(
+            None, 'a.json', False, 'RdYlBu_r', None, cache_dir='cache',
+            renderer='raster', **kwargs
+        )
+        gen._prepare()
+        a, gx, gy, num_x, num_y = gen._grid_data
+        grids = gen._interpolate(a, gx, gy, num_x, num_y)
+        return grids, sorted(interpolated)
+
+    def test_cached(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        write_synthetic_survey('a.json', 20, 'floorplan.png', 60, 40, seed=1)
+        grids, interpolated = self.generate(monkeypatch)
+        assert interpolated == sorted(grids.keys())
+        assert len(os.listdir('cache')) == len(grids)
+        cached, interpolated = self.generate(monkeypatch)
+        assert interpolated == []
+        assert sorted(cached.keys()) == sorted(grids.keys())
+        for key, z in grids.items():
+            assert np.allclose(cached[key], z, rtol=1e-6, equal_nan=True)
+        # another grid or interpolation method misses
+        assert self.generate(monkeypatch, grid_cells=100)[1] == sorted(
+            grids.keys()
+        )
+        _, interpolated = self.generate(
+            monkeypatch, interpolation='local', neighbors=4
+        )
+        assert interpolated == sorted(grids.keys())
+        assert len(os.listdir('cache')) == 3 * len(grids)
+
+    def test_corrupt(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        write_synthetic_survey('a.json', 20, 'floorplan.png', 60, 40, seed=1)
+        grids, _ = self.generate(monkeypatch)
+        for fname in os.listdir('cache')[:2]:
+            with open(os.path.join('cache', fname), 'wb') as fh:
+                fh.write(b'')
+        cached, interpolated = self.generate(monkeypatch)
+        assert len(interpolated) == 2
+        for key, z in grids.items():
+            assert np.allclose(cached[key], z, rtol=1e-6, equal_nan=True)
+        assert self.generate(monkeypatch)[1] == []
@@ -0,0 +1,152 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import json
+import os
+import stat
+
+import numpy as np
+import pytest
+
+from wifi_survey_heatmap.convert import convert, read_survey, write_survey
+from wifi_survey_heatmap.survey import (
+    load_survey, open_temp, read_npz, write_npz
+)
+from wifi_survey_heatmap.synthetic import synthetic_survey
+
+
+def assert_same_survey(a, b):
+    """assert that two :py:class:`~.Survey` objects hold the same data"""
+    assert a.header == b.header
+    np.testing.assert_array_equal(a.x, b.x)
+    np.testing.assert_array_equal(a.y, b.y)
+    assert sorted(a.values.keys()) == sorted(b.values.keys())
+    for key in a.values.keys():
+        np.testing.assert_array_equal(a.values[key], b.values[key])
+        np.testing.assert_array_equal(a.present[key], b.present[key])
+    assert list(a.mac) == list(b.mac)
+    np.testing.assert_array_equal(a.ap_frequency, b.ap_frequency)
+    assert sorted(a.scan.keys()) == sorted(b.scan.keys())
+    for key in a.scan.keys():
+        np.testing.assert_array_equal(a.scan[key], b.scan[key])
+
+
+class TestNpz(object):
+
+    def test_round_trip(self, tmp_path):
+        data = synthetic_survey(20, seed=1)
+        path = str(tmp_path / 'survey.npz')
+        write_npz(path, data)
+        result = read_npz(path)
+        assert result == data
+        # key order is preserved too
+        assert json.dumps(result) == json.dumps(data)
+
+    def test_replaces_file(self, tmp_path):
+        path = str(tmp_path / 'survey.npz')
+        write_npz(path, synthetic_survey(20, seed=1))
+        data = synthetic_survey(5, seed=2)
+        write_npz(path, data)
+        assert read_npz(path) == data
+        assert os.listdir(str(tmp_path)) == ['survey.npz']
+
+    def test_permissions(self, tmp_path):
+        path = str(tmp_path / 'survey.npz')
+        umask = os.umask(0o022)
+        try:
+            write_npz(path, synthetic_survey(5))
+        finally:
+            os.umask(umask)
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+
+
+class TestOpenTemp(object):
+
+    def test_open_temp(self, tmp_path):
+        path = str(tmp_path / 'out.json')
+        umask = os.umask(0o027)
+        try:
+            fh1, tmp1 = open_temp(path)
+            fh2, tmp2 = open_temp(path, mode='wb')
+        finally:
+            os.umask(umask)
+        with fh1, fh2:
+            fh1.write('text')
+            fh2.write(b'bytes')
+        assert tmp1 != tmp2
+        for tmp in (tmp1, tmp2):
+            assert os.path.dirname(tmp) == str(tmp_path)
+            assert stat.S_IMODE(os.stat(tmp).st_mode) == 0o640
+        assert not os.path.exists(path)
+
+
+class TestConvert(object):
+
+    @pytest.mark.parametrize('src, dest', [
+        ('json', 'npz'),
+        ('npz', 'json'),
+        ('json', 'sqlite'),
+        ('sqlite', 'json'),
+        ('npz', 'sqlite'),
+        ('sqlite', 'npz'),
+    ])
+    def test_convert(self, tmp_path, src, dest):
+        data = synthetic_survey(15, seed=3)
+        src = str(tmp_path / ('survey.' + src))
+        dest = str(tmp_path / ('converted.' + dest))
+        write_survey(src, data)
+        convert(src, dest, verify=True)
+        assert read_survey(dest) == data
+        assert_same_survey(load_survey(dest), load_survey(src))
+
+    def test_json_npz_key_order(self, tmp_path):
+        data = synthetic_survey(10, seed=4)
+        src = str(tmp_path / 'survey.json')
+        write_survey(src, data)
+        convert(src, str(tmp_path / 'survey.npz'))
+        convert(str(tmp_path / 'survey.npz'), str(tmp_path / 'back.json'))
+        with open(src) as fh:
+            expected = fh.read()
+        with open(str(tmp_path / 'back.json')) as fh:
+            assert fh.read() == expected
+
+    def test_no_points(self, tmp_path):
+        src = str(tmp_path / 'thresholds.json')
+        with open(src, 'w') as fh:
+            fh.write(json.dumps({'signal_quality': {'min': 0}}))
+        with pytest.raises(RuntimeError):
+            convert(src, str(tmp_path / 'survey.npz'))
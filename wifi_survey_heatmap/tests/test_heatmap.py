@@ -0,0 +1,486 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import json
+import logging
+import os
+from collections import defaultdict
+
+import numpy as np
+import pytest
+from matplotlib.image import imread, imsave
+
+from wifi_survey_heatmap.convert import read_survey, write_survey
+from wifi_survey_heatmap.heatmap import (
+    OUTPUT_MANIFEST, WIFI_CHANNELS, HeatMapGenerator, expand_titles,
+    generate_batch, parse_args
+)
+from wifi_survey_heatmap.survey import load_survey
+from wifi_survey_heatmap.synthetic import (
+    synthetic_floorplan, synthetic_survey, write_synthetic_survey
+)
+from wifi_survey_heatmap.tests.test_convert import assert_same_survey
+from wifi_survey_heatmap.thresholds import survey_stats
+
+
+def baseline_channel_to_signal(data, ignore_ssids):
+    """the nested loops that HeatMapGenerator._channel_to_signal replaced"""
+    channels = defaultdict(list)
+    for row in data['survey_points']:
+        for scan in row['result']['scan_results']:
+            ssid = row['result']['scan_results'][scan]['ssid']
+            if ssid in ignore_ssids:
+                continue
+            freq = row['result']['scan_results'][scan]['frequency'] / 1e6
+            channels[int(freq)].append(
+                row['result']['scan_results'][scan]['signal_mbm'] + 100
+            )
+    for freq in channels.keys():
+        channels[freq] = sum(channels[freq]) / len(channels[freq])
+    freq_qual = {x: 0.0 for x in WIFI_CHANNELS.keys()}
+    for freq, qual in channels.items():
+        freq_qual[freq] += qual
+        for spread in range(
+            int(freq - (WIFI_CHANNELS[freq][1] / 2.0)),
+            int(freq + (WIFI_CHANNELS[freq][1] / 2.0) + 1.0)
+        ):
+            if spread in freq_qual and spread != freq:
+                freq_qual[spread] += qual
+    return {
+        WIFI_CHANNELS[x][0]: freq_qual[x] for x in freq_qual.keys()
+    }
+
+
+def channel_survey(seed=0):
+    """a synthetic survey with scan results on every known channel"""
+    data = synthetic_survey(40, bssids_per_scan=8, seed=seed)
+    rng = np.random.default_rng(seed)
+    freqs = sorted(WIFI_CHANNELS.keys())
+    for point in data['survey_points']:
+        for bss in point['result']['scan_results'].values():
+            bss['frequency'] = int(rng.choice(freqs)) * 1000000
+    return data
+
+
+class TestExpandTitles(object):
+
+    def test_skips_other_files(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        write_synthetic_survey('a.json', 5, 'floorplan.png', 60, 40)
+        write_synthetic_survey('b.npz', 5, 'floorplan.png', 60, 40)
+        with open('thresholds.json', 'w') as fh:
+            fh.write(json.dumps({'signal_quality': {'min': 0}}))
+        with open(OUTPUT_MANIFEST % 'a.json', 'w') as fh:
+            fh.write(json.dumps({'a.png': 'abc'}))
+        with open('broken.json', 'w') as fh:
+            fh.write('{"img_path": ')
+        assert expand_titles(['*.json', '*.npz', 'c.json']) == [
+            'a.json', 'b.npz', 'c.json'
+        ]
+
+    def test_no_surveys(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        with pytest.raises(SystemExit):
+            expand_titles(['*.json'])
+
+
+class TestParseArgs(object):
+
+    @pytest.mark.parametrize('argv, renderer', [
+        (['a.json'], 'matplotlib'),
+        (['--preview', 'a.json'], 'raster'),
+        (['--preview', '-n', '5', 'a.json'], 'matplotlib'),
+        (['--preview', '-r', 'matplotlib', 'a.json'], 'matplotlib'),
+        (['--watch', 'a.json'], 'raster'),
+        (['--watch', '-n', '5', 'a.json'], 'matplotlib'),
+        (['-r', 'raster', 'a.json'], 'raster'),
+    ])
+    def test_default_renderer(self, argv, renderer):
+        assert parse_args(argv).renderer == renderer
+
+
+class TestChannelToSignal(object):
+
+    @pytest.mark.parametrize(
+        'ignore_ssids', [[], ['synthetic-1', 'synthetic-3']]
+    )
+    def test_matches_baseline(self, tmp_path, monkeypatch, ignore_ssids):
+        monkeypatch.chdir(tmp_path)
+        data = channel_survey()
+        ssids = set(
+            bss['ssid'] for point in data['survey_points']
+            for bss in point['result']['scan_results'].values()
+        )
+        assert set(ignore_ssids) <= ssids
+        write_survey('a.json', data)
+        gen = HeatMapGenerator(
+            None, 'a.json', False, 'RdYlBu_r', None, ignore_ssids=ignore_ssids
+        )
+        result = gen._channel_to_signal()
+        expected = baseline_channel_to_signal(data, ignore_ssids)
+        assert sorted(result.keys()) == sorted(expected.keys())
+        # both bands are covered
+        assert min(result.keys()) < 15 < max(result.keys())
+        for channel, value in expected.items():
+            assert result[channel] == pytest.approx(value)
+
+    def test_unknown_frequency(self, tmp_path, monkeypatch, caplog):
+        monkeypatch.chdir(tmp_path)
+        data = channel_survey()
+        write_survey('a.json', data)
+        expected = HeatMapGenerator(
+            None, 'a.json', False, 'RdYlBu_r', None
+        )._channel_to_signal()
+        scan_results = data['survey_points'][0]['result']['scan_results']
+        bss = dict(list(scan_results.values())[0])
+        bss.update(bssid='00:00:00:00:00:99', frequency=2500000000)
+        scan_results[bss['bssid']] = bss
+        write_survey('a.json', data)
+        gen = HeatMapGenerator(None, 'a.json', False, 'RdYlBu_r', None)
+        with caplog.at_level(logging.WARNING):
+            result = gen._channel_to_signal()
+        assert result == pytest.approx(expected)
+        assert '2500' in caplog.text
+        assert len(gen._channel_graphs()) == 2
+
+
+class TestGenerateBatch(object):
+
+    def test_bad_survey(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        write_synthetic_survey('a.json', 10, 'floorplan.png', 60, 40)
+        write_synthetic_survey('c.json', 10, 'floorplan.png', 60, 40)
+        with open('b.json', 'w') as fh:
+            fh.write(json.dumps({
+                'img_path': 'floorplan.png', 'survey_points': []
+            }))
+        timings = generate_batch(
+            None, ['a.json', 'b.json', 'missing.json', 'c.json'], False,
+            'RdYlBu_r', None, renderer='raster'
+        )
+        assert [t['title'] for t in timings] == [
+            'a.json', 'b.json', 'missing.json', 'c.json'
+        ]
+        assert ['error' in t for t in timings] == [False, True, True, False]
+        for title in ('a.json', 'c.json'):
+            assert os.path.exists('signal_quality_%s.png' % title)
+            assert os.path.exists(OUTPUT_MANIFEST % title)
+        assert not os.path.exists('signal_quality_b.json.png')
+
+
+class TestChangedOutputs(object):
+
+    def changed(self, cname='RdYlBu_r', **kwargs):
+        """
+        return the metrics whose heatmaps a generator for ``a.json`` would
+        render, then render them so the next run starts from its manifest
+        """
+        gen = HeatMapGenerator(
+            None, 'a.json', False, cname, None, renderer='raster', **kwargs
+        )
+        tasks, keys = gen._prepare()
+        assert tasks == []
+        gen.generate()
+        return keys
+
+    def setup_survey(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        write_synthetic_survey('a.json', 20, 'floorplan.png', 60, 40, seed=1)
+        keys = self.changed()
+        assert sorted(keys) == sorted(HeatMapGenerator.graphs.keys())
+        for key in keys:
+            assert os.path.exists('%s_a.json.png' % key)
+        return keys
+
+    def test_unchanged(self, tmp_path, monkeypatch):
+        keys = self.setup_survey(tmp_path, monkeypatch)
+        names = ['%s_a.json.png' % key for key in keys]
+        mtimes = [os.stat(f).st_mtime_ns for f in names]
+        assert self.changed() == []
+        assert [os.stat(f).st_mtime_ns for f in names] == mtimes
+
+    def test_one_metric(self, tmp_path, monkeypatch):
+        self.setup_survey(tmp_path, monkeypatch)
+        data = read_survey('a.json')
+        data['survey_points'][0]['result']['tx_power'] += 3
+        write_survey('a.json', data)
+        assert self.changed() == ['tx_power']
+        assert self.changed() == []
+
+    def test_thresholds(self, tmp_path, monkeypatch):
+        self.setup_survey(tmp_path, monkeypatch)
+        with open('thresholds.json', 'w') as fh:
+            fh.write(json.dumps({'signal_quality': {'min': 0, 'max': 100}}))
+        assert self.changed(thresholds='thresholds.json') == [
+            'signal_quality'
+        ]
+        assert self.changed(thresholds='thresholds.json') == []
+        assert self.changed() == ['signal_quality']
+
+    @pytest.mark.parametrize('kwargs', [
+        {'cname': 'viridis'},
+        {'grid_cells': 100},
+        {'interpolation': 'local'},
+    ])
+    def test_render_options(self, tmp_path, monkeypatch, kwargs):
+        keys = self.setup_survey(tmp_path, monkeypatch)
+        assert self.changed(**kwargs) == keys
+        assert self.changed(**kwargs) == []
+        assert self.changed() == keys
+
+    @pytest.mark.parametrize('size', [(60, 40), (90, 60)])
+    def test_floorplan(self, tmp_path, monkeypatch, size):
+        keys = self.setup_survey(tmp_path, monkeypatch)
+        image = synthetic_floorplan(*size)
+        image[0, 0] = 0.5
+        imsave('floorplan.png', image)
+        assert self.changed() == keys
+        assert self.changed() == []
+
+    def test_force(self, tmp_path, monkeypatch):
+        keys = self.setup_survey(tmp_path, monkeypatch)
+        assert self.changed(force=True) == keys
+
+
+def bssid_survey(path):
+    """
+    write a survey to ``path`` with scan results of a few BSSIDs, each seen
+    at a known set of its points
+    """
+    data = synthetic_survey(10, seed=1)
+    seen = {
+        'aa:bb:cc:00:00:01': ('home', range(10)),
+        'aa:bb:cc:00:00:02': ('home', [0, 1]),
+        'aa:bb:cc:00:00:03': ('guest', range(10)),
+        'aa:bb:cc:00:00:04': ('', range(0, 10, 2)),
+        'aa:bb:cc:00:00:05': ('', range(1, 10, 2)),
+        'aa:bb:cc:00:00:06': ('home', range(5)),
+    }
+    for idx, point in enumerate(data['survey_points']):
+        template = list(point['result']['scan_results'].values())[0]
+        point['result']['scan_results'] = {
+            bssid: dict(
+                template, bssid=bssid, ssid=ssid,
+                signal_mbm=-40.0 - idx - 3 * num
+            )
+            for num, (bssid, (ssid, points)) in enumerate(sorted(seen.items()))
+            if idx in points
+        }
+    write_survey(path, data)
+
+
+class TestPerBSSID(object):
+
+    def setup_survey(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        write_synthetic_survey('a.json', 1, 'floorplan.png', 60, 40)
+        bssid_survey('a.json')
+        with open('aps.json', 'w') as fh:
+            fh.write(json.dumps({
+                'AA:BB:CC:00:00:04': 'Living room',
+                'aa:bb:cc:00:00:05': 'Living room',
+                'AA:BB:CC:00:00:06': 'Living_room',
+            }))
+
+    def test_names(self, tmp_path, monkeypatch):
+        self.setup_survey(tmp_path, monkeypatch)
+        gen = HeatMapGenerator(
+            None, 'a.json', False, 'RdYlBu_r', None, aps='aps.json',
+            ignore_ssids=['guest'], renderer='raster', per_bssid=True
+        )
+        gen.generate()
+        # too few points for aa:bb:cc:00:00:02, an ignored SSID for
+        # aa:bb:cc:00:00:03, and both BSSIDs of "Living room" in one heatmap
+        fields, names = gen._bssid_fields(gen.load_data())
+        assert names == {
+            'bssid_aa_bb_cc_00_00_01': 'aa:bb:cc:00:00:01 (home)',
+            'bssid_Living_room': 'Living room',
+            'bssid_Living_room_2': 'Living_room',
+        }
+        assert np.count_nonzero(np.isnan(fields['bssid_Living_room'])) == 0
+        assert np.count_nonzero(np.isnan(fields['bssid_Living_room_2'])) == 5
+        assert sorted(
+            f for f in os.listdir('.') if f.startswith('bssid_')
+        ) == [
+            'bssid_Living_room_2_a.json.png',
+            'bssid_Living_room_a.json.png',
+            'bssid_aa_bb_cc_00_00_01_a.json.png',
+        ]
+        with open(OUTPUT_MANIFEST % 'a.json') as fh:
+            manifest = json.loads(fh.read())
+        assert 'bssid_Living_room_2_a.json.png' in manifest
+
+    @pytest.mark.parametrize('renderer', ['matplotlib', 'raster'])
+    @pytest.mark.parametrize('batch', [False, True])
+    def test_jobs(self, tmp_path, monkeypatch, renderer, batch):
+        outputs = {}
+        for jobs in (1, 3):
+            path = tmp_path / ('jobs%d' % jobs)
+            path.mkdir()
+            self.setup_survey(path, monkeypatch)
+            kwargs = dict(
+                aps='aps.json', renderer=renderer, per_bssid=True, jobs=jobs
+            )
+            if batch:
+                generate_batch(
+                    None, ['a.json'], False, 'RdYlBu_r', None, **kwargs
+                )
+            else:
+                HeatMapGenerator(
+                    None, 'a.json', False, 'RdYlBu_r', None, **kwargs
+                ).generate()
+            outputs[jobs] = {
+                f: imread(f) for f in os.listdir('.') if f.endswith('.png')
+                and f != 'floorplan.png'
+            }
+        assert sorted(outputs[3].keys()) == sorted(outputs[1].keys())
+        assert 'bssid_Living_room_2_a.json.png' in outputs[1]
+        for fname, image in outputs[1].items():
+            assert np.array_equal(outputs[3][fname], image), fname
+
+
+class TestLoadData(object):
+
+    def nan_survey(self):
+        """
+        a survey with TCP upload results at odd points only, null UDP
+        download jitter at the first five points and no UDP upload results
+        """
+        data = synthetic_survey(20, seed=1)
+        for idx, point in enumerate(data['survey_points']):
+            if idx % 2 == 0:
+                del point['result']['tcp']
+            if idx < 5:
+                point['result']['udp']['jitter_ms'] = None
+            del point['result']['udp-reverse']
+        return data
+
+    def generate(self, title):
+        gen = HeatMapGenerator(
+            None, title, False, 'RdYlBu_r', None, renderer='raster'
+        )
+        gen.generate()
+        return gen
+
+    def test_nan_model(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        write_synthetic_survey('a.json', 1, 'floorplan.png', 60, 40)
+        data = self.nan_survey()
+        data['img_path'] = 'floorplan.png'
+        write_survey('a.json', data)
+        gen = self.generate('a.json')
+        a = gen.load_data()
+        odd = np.arange(20) % 2 == 1
+        assert np.array_equal(~np.isnan(a['tcp_upload_Mbps']), odd)
+        assert np.array_equal(
+            a['tcp_upload_Mbps'][odd], [
+                p['result']['tcp']['received_Mbps']
+                for p in data['survey_points'][1::2]
+            ]
+        )
+        assert np.isnan(a['jitter_download'][:5]).all()
+        assert not np.isnan(a['jitter_download'][5:]).any()
+        # null values were measured, missing ones weren't
+        assert gen._survey.present['jitter_download'].all()
+        assert np.array_equal(gen._survey.present['tcp_upload_Mbps'], odd)
+        assert np.isnan(a['udp_upload_Mbps']).all()
+        x, y, fields = gen._interpolation_inputs(a)
+        assert 'udp_upload_Mbps' not in fields
+        assert 'jitter_upload' not in fields
+        # unsurveyed corners get the metric's minimum, not NaN
+        assert len(x) == 24
+        assert (
+            fields['tcp_upload_Mbps'][20:] ==
+            np.nanmin(a['tcp_upload_Mbps'])
+        ).all()
+        for key in ('tcp_upload_Mbps', 'jitter_download', 'signal_quality'):
+            assert os.path.exists('%s_a.json.png' % key)
+        with open(OUTPUT_MANIFEST % 'a.json') as fh:
+            manifest = json.loads(fh.read())
+        for key in ('udp_upload_Mbps', 'jitter_upload'):
+            assert not os.path.exists('%s_a.json.png' % key)
+            assert '%s_a.json.png' % key not in manifest
+
+    def test_partial_metric(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        write_synthetic_survey('a.json', 1, 'floorplan.png', 60, 40)
+        data = self.nan_survey()
+        data['img_path'] = 'floorplan.png'
+        write_survey('a.json', data)
+        # only the points the metric was measured at
+        data['survey_points'] = data['survey_points'][1::2]
+        write_survey('b.json', data)
+        self.generate('a.json')
+        self.generate('b.json')
+        assert np.array_equal(
+            imread('tcp_upload_Mbps_a.json.png'),
+            imread('tcp_upload_Mbps_b.json.png')
+        )
+
+    @pytest.mark.parametrize('ext', ['.json', '.npz', '.sqlite'])
+    def test_failed_points(self, tmp_path, monkeypatch, ext):
+        monkeypatch.chdir(tmp_path)
+        write_synthetic_survey('a.json', 1, 'floorplan.png', 60, 40)
+        data = synthetic_survey(
+            20, width=60, height=40, img_path='floorplan.png', seed=1
+        )
+        write_survey('clean' + ext, data)
+        points = data['survey_points']
+        for idx in (0, 7, 13):
+            failed = json.loads(json.dumps(points[idx]))
+            failed.update(x=failed['x'] + 1, failed=True)
+            failed['result']['signal_mbm'] = -20.0
+            failed['result']['tcp'] = None
+            points.insert(idx, failed)
+        if ext == '.json':
+            # aborted before anything was measured
+            points.insert(3, {'x': 5, 'y': 5, 'result': {}, 'failed': True})
+        write_survey('failed' + ext, data)
+        assert_same_survey(
+            load_survey('failed' + ext), load_survey('clean' + ext)
+        )
+        assert survey_stats('failed' + ext, cache=False).to_dict() == (
+            survey_stats('clean' + ext, cache=False).to_dict()
+        )
+        self.generate('clean' + ext)
+        gen = self.generate('failed' + ext)
+        assert len(gen.load_data()['x']) == 20
+        for key in ('signal_quality', 'tcp_upload_Mbps'):
+            assert np.array_equal(
+                imread('%s_clean%s.png' % (key, ext)),
+                imread('%s_failed%s.png' % (key, ext))
+            )
@@ -0,0 +1,137 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import numpy as np
+import pytest
+
+import wifi_survey_heatmap.interpolate as interpolate_module
+from wifi_survey_heatmap.interpolate import (
+    Interpolator, interpolate, interpolate_fields
+)
+
+
+def random_survey(num_points, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0, 1000, num_points)
+    y = rng.uniform(0, 800, num_points)
+    z = rng.uniform(-90, -30, num_points)
+    return x, y, z
+
+
+def grid():
+    gx, gy = np.meshgrid(np.linspace(0, 1000, 50), np.linspace(0, 800, 40))
+    return gx.flatten(), gy.flatten()
+
+
+class TestRbf(object):
+
+    def test_matches_scipy(self, monkeypatch):
+        from scipy.interpolate import Rbf
+        x, y, z = random_survey(150)
+        gx, gy = grid()
+        # evaluate the grid in several chunks
+        monkeypatch.setattr(interpolate_module, 'RBF_CHUNK_ELEMENTS', 10000)
+        expected = Rbf(x, y, z, function='linear')(gx, gy)
+        assert np.allclose(interpolate('rbf', x, y, z, gx, gy), expected)
+
+    def test_several_metrics(self):
+        x, y, z = random_survey(50)
+        gx, gy = grid()
+        values = np.column_stack((z, z * 2 + 1))
+        result = Interpolator('rbf', x, y, gx, gy)(values)
+        assert result.shape == (len(gx), 2)
+        assert np.allclose(result[:, 0], interpolate('rbf', x, y, z, gx, gy))
+        assert np.allclose(
+            result[:, 1], interpolate('rbf', x, y, z * 2 + 1, gx, gy)
+        )
+
+
+class TestInterpolateFields(object):
+
+    @pytest.mark.parametrize('method', ['rbf', 'local'])
+    def test_nan_groups(self, method, monkeypatch):
+        created = []
+
+        class CountingInterpolator(Interpolator):
+
+            def __init__(self, *args, **kwargs):
+                created.append(len(args[1]))
+                super(CountingInterpolator, self).__init__(*args, **kwargs)
+
+        monkeypatch.setattr(
+            interpolate_module, 'Interpolator', CountingInterpolator
+        )
+        x, y, z = random_survey(40)
+        holes = z.copy()
+        holes[::3] = np.nan
+        other = z.copy()
+        other[:5] = np.nan
+        fields = {
+            'full': z, 'full2': z + 10, 'holes': holes, 'holes2': holes * 2,
+            'other': other, 'empty': np.full(40, np.nan)
+        }
+        gx, gy = grid()
+        result = interpolate_fields(method, x, y, fields, gx, gy)
+        # one interpolator for each distinct set of points with values
+        assert sorted(created) == [26, 35, 40]
+        assert sorted(result.keys()) == [
+            'full', 'full2', 'holes', 'holes2', 'other'
+        ]
+        for key, values in fields.items():
+            if key == 'empty':
+                continue
+            valid = ~np.isnan(values)
+            expected = Interpolator(method, x[valid], y[valid], gx, gy)(
+                values[valid]
+            )
+            assert np.allclose(result[key], expected)
+
+
+class TestLocal(object):
+
+    @pytest.mark.parametrize('neighbors', [1, 4, 16])
+    def test_exact_at_points(self, neighbors):
+        x, y, z = random_survey(200)
+        result = interpolate('local', x, y, z, x, y, neighbors=neighbors)
+        assert np.allclose(result, z)
+
+    def test_within_range(self):
+        x, y, z = random_survey(200)
+        gx, gy = grid()
+        result = interpolate('local', x, y, z, gx, gy)
+        assert result.min() >= z.min() - 1e-9
+        assert result.max() <= z.max() + 1e-9
@@ -0,0 +1,268 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import json
+import os
+import threading
+
+import pytest
+
+from wifi_survey_heatmap.convert import convert, read_survey, write_survey
+from wifi_survey_heatmap.journal import (
+    SurveyJournal, has_journal_events, journal_path, replay_journal
+)
+from wifi_survey_heatmap.survey import load_survey, open_temp, write_npz
+from wifi_survey_heatmap.synthetic import synthetic_survey
+from wifi_survey_heatmap.tests.test_convert import assert_same_survey
+
+
+def replace_survey(path, data):
+    """
+    Atomically replace the survey file at ``path``, leaving its journal
+    alone, like the survey UI does
+    """
+    if path.endswith('.npz'):
+        write_npz(path, data)
+        return
+    fh, tmp = open_temp(path)
+    with fh:
+        fh.write(json.dumps(data))
+    os.replace(tmp, path)
+
+
+def open_journal(path):
+    """
+    Open a :py:class:`~.SurveyJournal` for the survey at ``path`` that only
+    compacts when closed.
+    """
+    header = {}
+    points = replay_journal(path, header=header)
+    return SurveyJournal(
+        path, header, points, lambda data: replace_survey(path, data),
+        interval=3600
+    )
+
+
+def crash(journal):
+    """stop ``journal`` like a killed process would, without compacting"""
+    journal._stop.set()
+    journal._thread.join()
+    journal._fh.close()
+
+
+class TestSurveyJournal(object):
+
+    def setup_survey(self, tmp_path, ext='.json'):
+        data = synthetic_survey(6, seed=1)
+        path = str(tmp_path / ('survey' + ext))
+        write_survey(path, data)
+        new = synthetic_survey(8, seed=2)['survey_points'][7]
+        expected = [dict(p) for p in data['survey_points']]
+        expected[1] = dict(expected[1], x=5, y=6)
+        del expected[3]
+        expected.append(new)
+        return path, data, new, expected
+
+    def edit(self, journal, new):
+        journal.move_point(1, 5, 6)
+        journal.remove_point(3)
+        journal.add_point(new)
+
+    def edit_concurrently(self, journal, new):
+        """
+        make the changes of :py:meth:`edit` from another thread, and return
+        whether they completed without waiting for the journal's lock
+        """
+        editor = threading.Thread(target=self.edit, args=(journal, new))
+        editor.daemon = True
+        editor.start()
+        editor.join(10)
+        return not editor.is_alive()
+
+    def test_replay_after_crash(self, tmp_path):
+        path, data, new, expected = self.setup_survey(tmp_path)
+        journal = open_journal(path)
+        self.edit(journal, new)
+        crash(journal)
+        assert has_journal_events(path)
+        # the survey file itself is unchanged
+        with open(path) as fh:
+            assert json.loads(fh.read()) == data
+        header = {}
+        assert replay_journal(path, header=header) == expected
+        assert header == {'img_path': data['img_path']}
+
+    def test_truncated_event(self, tmp_path):
+        path, data, new, expected = self.setup_survey(tmp_path)
+        journal = open_journal(path)
+        self.edit(journal, new)
+        crash(journal)
+        with open(journal_path(path), 'a') as fh:
+            fh.write('{"event": "add", "id"')
+        assert replay_journal(path) == expected
+
+    def test_compact(self, tmp_path):
+        path, data, new, expected = self.setup_survey(tmp_path)
+        journal = open_journal(path)
+        self.edit(journal, new)
+        journal.close()
+        assert not has_journal_events(path)
+        result = read_survey(path)
+        assert result['survey_points'] == expected
+        assert result['journal_seq'] == 3
+
+    def test_reopen_after_crash(self, tmp_path):
+        path, data, new, expected = self.setup_survey(tmp_path)
+        journal = open_journal(path)
+        self.edit(journal, new)
+        crash(journal)
+        # IDs of points match the replayed survey after compaction
+        journal = open_journal(path)
+        journal.remove_point(0)
+        journal.close()
+        assert read_survey(path)['survey_points'] == expected[1:]
+
+    def test_crash_during_compaction(self, tmp_path):
+        path, data, new, expected = self.setup_survey(tmp_path)
+        journal = open_journal(path)
+        self.edit(journal, new)
+        crash(journal)
+        # the survey file was written, but the journal not reset
+        with open(path, 'w') as fh:
+            fh.write(json.dumps({
+                'img_path': data['img_path'], 'journal_seq': 3,
+                'survey_points': expected
+            }))
+        assert replay_journal(path) == expected
+
+    def test_edit_during_compaction(self, tmp_path):
+        path, data, new, expected = self.setup_survey(tmp_path)
+        journal = open_journal(path)
+        journal.move_point(0, 1, 2)
+        expected[0] = dict(expected[0], x=1, y=2)
+        writing = threading.Event()
+        release = threading.Event()
+        write = journal._write
+
+        def slow_write(data):
+            writing.set()
+            assert release.wait(10)
+            write(data)
+
+        journal._write = slow_write
+        thread = threading.Thread(target=journal.compact)
+        thread.start()
+        assert writing.wait(10)
+        # changes don't wait for the survey file to be written
+        edited = self.edit_concurrently(journal, new)
+        release.set()
+        assert edited
+        thread.join()
+        result = read_survey(path)
+        assert result['journal_seq'] == 1
+        assert has_journal_events(path)
+        assert replay_journal(path) == expected
+        journal.close()
+        assert read_survey(path)['survey_points'] == expected
+
+    @pytest.mark.parametrize('written', [False, True])
+    def test_crash_while_compacting(self, tmp_path, written):
+        path, data, new, expected = self.setup_survey(tmp_path)
+        journal = open_journal(path)
+        journal.move_point(0, 1, 2)
+        expected[0] = dict(expected[0], x=1, y=2)
+        write = journal._write
+
+        def crashing_write(data):
+            assert self.edit_concurrently(journal, new)
+            if written:
+                write(data)
+            raise RuntimeError('killed')
+
+        journal._write = crashing_write
+        with pytest.raises(RuntimeError, match='killed'):
+            journal.compact()
+        crash(journal)
+        assert read_survey(path).get('journal_seq', 0) == (
+            1 if written else 0
+        )
+        assert replay_journal(path) == expected
+
+    def test_npz(self, tmp_path):
+        path, data, new, expected = self.setup_survey(tmp_path, ext='.npz')
+        journal = open_journal(path)
+        self.edit(journal, new)
+        crash(journal)
+        assert replay_journal(path) == expected
+
+
+class TestJournalledSurvey(object):
+
+    def setup_crashed(self, tmp_path):
+        data = synthetic_survey(6, seed=3)
+        path = str(tmp_path / 'survey.json')
+        write_survey(path, data)
+        journal = open_journal(path)
+        new = synthetic_survey(8, seed=4)['survey_points'][7]
+        journal.add_point(new)
+        crash(journal)
+        data['survey_points'].append(new)
+        return path, data
+
+    def test_read_survey(self, tmp_path):
+        path, data = self.setup_crashed(tmp_path)
+        assert read_survey(path) == data
+
+    def test_load_survey(self, tmp_path):
+        path, data = self.setup_crashed(tmp_path)
+        expected = str(tmp_path / 'expected.json')
+        write_survey(expected, data)
+        assert_same_survey(load_survey(path), load_survey(expected))
+
+    def test_convert(self, tmp_path):
+        path, data = self.setup_crashed(tmp_path)
+        for ext in ('.npz', '.sqlite'):
+            dest = str(tmp_path / ('converted' + ext))
+            convert(path, dest, verify=True)
+            assert read_survey(dest) == data
+
+    def test_write_removes_journal(self, tmp_path):
+        path, data = self.setup_crashed(tmp_path)
+        other = synthetic_survey(3, seed=5)
+        write_survey(path, other)
+        assert not os.path.exists(journal_path(path))
+        assert read_survey(path) == other
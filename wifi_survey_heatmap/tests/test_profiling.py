@@ -0,0 +1,247 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import json
+import os
+import pstats
+import sys
+
+import pytest
+
+from wifi_survey_heatmap.heatmap import HeatMapGenerator, main, parse_args
+from wifi_survey_heatmap.profiling import StageProfiler, format_profile
+from wifi_survey_heatmap.synthetic import write_synthetic_survey
+
+
+def outer_work():
+    return sum(range(1000))
+
+
+def inner_work():
+    return sum(range(2000))
+
+
+def record(stage, path, start, wall, cpu=0.0, peak_rss=0, **labels):
+    """a record like those of :py:meth:`~.StageProfiler.stage`"""
+    result = dict(labels)
+    result.update(
+        stage=stage, path=path, pid=1, start=start, wall=wall, cpu=cpu,
+        peak_rss=peak_rss
+    )
+    return result
+
+
+def functions(fname):
+    """names of the functions in a cProfile statistics file"""
+    return set(key[2] for key in pstats.Stats(fname).stats.keys())
+
+
+class TestStageProfiler(object):
+
+    def test_nesting(self):
+        profiler = StageProfiler()
+        with profiler.stage('outer', survey='a.json', metric=None):
+            outer_work()
+            with profiler.stage('inner', metric='tx_power'):
+                inner_work()
+            with profiler.stage('inner', metric='channel'):
+                pass
+        inner, other, outer = profiler.records
+        assert outer['stage'] == 'outer'
+        assert outer['survey'] == 'a.json'
+        assert 'metric' not in outer
+        assert outer['path'] == ['outer a.json']
+        assert inner['path'] == ['outer a.json', 'inner tx_power']
+        assert other['path'] == ['outer a.json', 'inner channel']
+        assert inner['metric'] == 'tx_power'
+        for rec in profiler.records:
+            assert rec['pid'] == os.getpid()
+            assert rec['wall'] >= 0 and rec['cpu'] >= 0
+            assert rec['peak_rss'] > 0
+            assert 'pstats' not in rec
+        assert outer['start'] <= inner['start'] <= other['start']
+        assert outer['wall'] >= inner['wall'] + other['wall']
+        assert outer['peak_rss'] >= inner['peak_rss']
+
+    def test_exception(self):
+        profiler = StageProfiler()
+        with pytest.raises(RuntimeError):
+            with profiler.stage('outer'):
+                with profiler.stage('inner'):
+                    raise RuntimeError('failed')
+        assert [r['path'] for r in profiler.records] == [
+            ['outer', 'inner'], ['outer']
+        ]
+        with profiler.stage('next'):
+            pass
+        assert profiler.records[-1]['path'] == ['next']
+
+    def test_disabled(self, tmp_path):
+        stats_dir = str(tmp_path / 'stats')
+        profiler = StageProfiler(stats_dir=stats_dir, enabled=False)
+        with profiler.stage('outer'):
+            with profiler.stage('inner'):
+                pass
+        assert profiler.records == []
+        assert profiler.summary() == []
+        assert not os.path.exists(stats_dir)
+
+    def test_summary(self):
+        profiler = StageProfiler()
+        profiler.records = [
+            record('plot', ['generate', 'plot a'], 3.0, 0.5, 0.25, 100,
+                   metric='a'),
+            record('generate', ['generate'], 1.0, 4.0, 2.0, 300),
+            record('plot', ['generate', 'plot b'], 2.0, 1.0, 0.5, 200,
+                   metric='b'),
+            record('plot', ['generate', 'plot a'], 4.0, 0.25, 0.25, 400,
+                   metric='a'),
+            record('imshow', ['generate', 'plot a', 'imshow a'], 3.5, 0.125,
+                   metric='a'),
+            record('load', ['load'], 0.0, 0.5),
+        ]
+        assert profiler.summary() == [
+            {'stage': 'load', 'path': ['load'], 'calls': 1, 'wall': 0.5,
+             'cpu': 0.0, 'peak_rss': 0},
+            {'stage': 'generate', 'path': ['generate'], 'calls': 1,
+             'wall': 4.0, 'cpu': 2.0, 'peak_rss': 300},
+            {'stage': 'plot', 'metric': 'b', 'path': ['generate', 'plot b'],
+             'calls': 1, 'wall': 1.0, 'cpu': 0.5, 'peak_rss': 200},
+            {'stage': 'plot', 'metric': 'a', 'path': ['generate', 'plot a'],
+             'calls': 2, 'wall': 0.75, 'cpu': 0.5, 'peak_rss': 400},
+            {'stage': 'imshow', 'metric': 'a',
+             'path': ['generate', 'plot a', 'imshow a'], 'calls': 1,
+             'wall': 0.125, 'cpu': 0.0, 'peak_rss': 0},
+        ]
+        lines = format_profile(profiler.summary()).splitlines()
+        assert lines[0].split() == [
+            'stage', 'metric', 'calls', 'wall', '[s]', 'cpu', '[s]', 'peak',
+            'MiB'
+        ]
+        assert [line.split()[:3] for line in lines[1:]] == [
+            ['load', '-', '1'], ['generate', '-', '1'], ['plot', 'b', '1'],
+            ['plot', 'a', '2'], ['imshow', 'a', '1'],
+        ]
+        # nested stages are indented
+        assert lines[4].startswith('  plot')
+        assert lines[5].startswith('    imshow')
+
+    def test_extend(self):
+        profiler = StageProfiler()
+        worker = [record('plot', ['plot a'], 2.0, 1.0, metric='a')]
+        with profiler.stage('render'):
+            profiler.extend(worker)
+        assert profiler.records[0]['path'] == ['render', 'plot a']
+        assert [r['path'] for r in profiler.summary()] == [
+            ['render'], ['render', 'plot a']
+        ]
+
+    def test_stats_dir(self, tmp_path):
+        stats_dir = str(tmp_path / 'stats')
+        profiler = StageProfiler(stats_dir=stats_dir)
+        with profiler.stage('outer', survey='my survey.json'):
+            outer_work()
+            with profiler.stage('inner', metric='tx_power'):
+                inner_work()
+        inner, outer = profiler.records
+        assert sorted(os.listdir(stats_dir)) == sorted([
+            os.path.basename(inner['pstats']),
+            os.path.basename(outer['pstats']),
+        ])
+        assert os.path.basename(outer['pstats']) == (
+            'outer_my_survey.json-%d-2.pstats' % os.getpid()
+        )
+        # each file only has the time spent outside of nested stages
+        assert 'outer_work' in functions(outer['pstats'])
+        assert 'inner_work' not in functions(outer['pstats'])
+        assert 'inner_work' in functions(inner['pstats'])
+        assert 'outer_work' not in functions(inner['pstats'])
+
+
+class TestGeneratorProfile(object):
+
+    def test_workers(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        write_synthetic_survey('a.json', 20, 'floorplan.png', 60, 40)
+        profiler = StageProfiler()
+        HeatMapGenerator(
+            None, 'a.json', False, 'RdYlBu_r', None, renderer='raster',
+            jobs=2, profiler=profiler
+        ).generate()
+        plots = [r for r in profiler.records if r['stage'] == 'plot']
+        assert len(plots) == 11
+        for rec in plots:
+            assert rec['pid'] != os.getpid()
+            assert rec['survey'] == 'a.json'
+            assert rec['path'] == [
+                'generate a.json', 'render a.json',
+                'plot a.json %s' % rec['metric']
+            ]
+        summary = profiler.summary()
+        assert [r['stage'] for r in summary[:3]] == [
+            'load_survey', 'generate', 'load_image'
+        ]
+        assert sum(r['calls'] for r in summary if r['stage'] == 'plot') == 11
+
+    def test_main(self, tmp_path, monkeypatch, capsys):
+        monkeypatch.chdir(tmp_path)
+        write_synthetic_survey('a.json', 20, 'floorplan.png', 60, 40)
+        monkeypatch.setattr(sys, 'argv', [
+            'wifi-heatmap', '-r', 'raster', '--profile', 'profile.json',
+            '--profile-stats', 'stats', 'a.json'
+        ])
+        main()
+        with open('profile.json') as fh:
+            report = json.loads(fh.read())
+        assert report['summary'][0]['stage'] == 'load_survey'
+        stages = set(r['stage'] for r in report['records'])
+        assert {
+            'load_survey', 'generate', 'interpolate', 'render', 'plot'
+        } <= stages
+        assert sorted(os.listdir('stats')) == sorted(
+            os.path.basename(r['pstats']) for r in report['records']
+        )
+        for rec in report['records']:
+            pstats.Stats(rec['pstats'])
+        out = capsys.readouterr().out
+        assert out.splitlines()[0].split()[:2] == ['stage', 'metric']
+        assert '  plot' in out
+
+    def test_stats_requires_profile(self, capsys):
+        with pytest.raises(SystemExit):
+            parse_args(['--profile-stats', 'stats', 'a.json'])
+        assert '--profile-stats requires --profile' in capsys.readouterr().err
@@ -0,0 +1,128 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import numpy as np
+import pytest
+
+from PIL import Image
+
+from wifi_survey_heatmap.raster import (
+    colormap_lut, composite, draw_markers, lut_indices, write_png
+)
+
+matplotlib = pytest.importorskip('matplotlib')
+matplotlib.use('agg')
+
+
+def imshow_rgb(z, cmap, vmin, vmax):
+    """draw ``z`` with imshow, one image pixel per figure pixel"""
+    import matplotlib.pyplot as pp
+    height, width = z.shape
+    fig = pp.figure(figsize=(width / 100.0, height / 100.0), dpi=100)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.axis('off')
+    ax.imshow(
+        z, cmap=cmap, vmin=vmin, vmax=vmax, interpolation='nearest',
+        aspect='auto'
+    )
+    fig.canvas.draw()
+    rgb = np.asarray(fig.canvas.buffer_rgba())[:, :, :3].astype(int)
+    pp.close(fig)
+    return rgb
+
+
+class TestComposite(object):
+
+    @pytest.mark.parametrize('cname', ['RdYlBu_r', 'viridis'])
+    @pytest.mark.parametrize('uniform', [False, True])
+    def test_matches_imshow(self, cname, uniform):
+        cmap = matplotlib.colormaps[cname]
+        if uniform:
+            z = np.full((40, 60), 20.0)
+            vmin = vmax = 20.0
+        else:
+            z = np.random.default_rng(0).uniform(0, 100, (40, 60))
+            vmin, vmax = 10.0, 90.0
+        base = np.full((40, 60, 3), 255, dtype=np.uint8)
+        result = composite(base, z, vmin, vmax, colormap_lut(cmap), alpha=1)
+        expected = imshow_rgb(z, cmap, vmin, vmax)
+        # matplotlib truncates colors to 8 bits where composite rounds
+        assert np.abs(result - expected).max() <= 1
+
+    def test_uniform_first_color(self):
+        lut = colormap_lut(matplotlib.colormaps['RdYlBu_r'])
+        idx = lut_indices(np.full((3, 4), 20.0), 20.0, 20.0, len(lut))
+        assert (idx == 0).all()
+
+    def test_blend(self):
+        lut = colormap_lut(matplotlib.colormaps['RdYlBu_r'])
+        base = np.zeros((4, 4, 3), dtype=np.uint8)
+        z = np.full((4, 4), 100.0)
+        result = composite(base, z, 0.0, 100.0, lut)
+        expected = np.round(lut[-1, :3] * 255 * 0.5)
+        assert np.abs(result - expected).max() <= 1
+
+
+class TestWritePng(object):
+
+    @pytest.mark.parametrize('channels', [3, 4])
+    def test_round_trip(self, tmp_path, channels):
+        image = np.random.default_rng(0).integers(
+            0, 256, (30, 50, channels), dtype=np.uint8
+        )
+        fname = str(tmp_path / 'out.png')
+        write_png(fname, image)
+        with Image.open(fname) as im:
+            assert im.mode == {3: 'RGB', 4: 'RGBA'}[channels]
+            assert (np.asarray(im) == image).all()
+
+
+class TestDrawMarkers(object):
+
+    def test_draw(self):
+        image = np.full((40, 40, 3), 255, dtype=np.uint8)
+        draw_markers(
+            image, np.array([[10.0, 10.0], [38.0, 20.0]]),
+            np.array([[1.0, 0.0, 0.0, 1.0], [0.0, 0.0, 1.0, 1.0]]), 5
+        )
+        # filled with the point's color, with a black outline
+        assert tuple(image[10, 10]) == (255, 0, 0)
+        assert tuple(image[10, 15]) == (0, 0, 0)
+        assert tuple(image[10, 17]) == (255, 255, 255)
+        # markers on the edge of the image are clipped
+        assert tuple(image[20, 38]) == (0, 0, 255)
+        assert tuple(image[20, 33]) == (0, 0, 0)
@@ -0,0 +1,115 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from wifi_survey_heatmap.sketch import QuantileSketch
+
+
+def sample_values(seed=0):
+    """values of both signs spanning several orders of magnitude, and zeros"""
+    rng = np.random.default_rng(seed)
+    return np.concatenate((
+        -rng.lognormal(3, 1, 500), np.zeros(50), rng.lognormal(1, 2, 1000),
+        rng.uniform(-1, 1, 200)
+    ))
+
+
+def true_quantile(values, q):
+    """the value that QuantileSketch.quantile approximates"""
+    values = np.sort(values)
+    return values[int(np.floor(q * (len(values) - 1)))]
+
+
+def same_sketch(a, b):
+    return a.to_dict() == b.to_dict()
+
+
+class TestQuantileSketch(object):
+
+    @pytest.mark.parametrize('accuracy', [0.005, 0.02])
+    def test_accuracy(self, accuracy):
+        values = sample_values()
+        sketch = QuantileSketch(relative_accuracy=accuracy)
+        sketch.add_array(np.append(values, np.nan))
+        assert sketch.count == len(values)
+        for q in np.linspace(0, 1, 101):
+            expected = true_quantile(values, q)
+            assert abs(sketch.quantile(q) - expected) <= (
+                accuracy * abs(expected) + 1e-9
+            )
+
+    def test_zero(self):
+        sketch = QuantileSketch()
+        sketch.add_array(np.array([-2.0, 0.0, 0.0, 0.0, 3.0]))
+        assert sketch.zero == 3
+        assert sketch.quantile(0.5) == 0.0
+        assert sketch.quantile(0) < 0 < sketch.quantile(1)
+
+    def test_empty(self):
+        sketch = QuantileSketch()
+        sketch.add_array(np.array([np.nan]))
+        assert sketch.count == 0
+        assert sketch.quantile(0.5) is None
+
+    def test_merge(self):
+        values = sample_values()
+        whole = QuantileSketch()
+        whole.add_array(values)
+        merged = QuantileSketch()
+        for part in np.array_split(values, 4):
+            sketch = QuantileSketch()
+            sketch.add_array(part)
+            merged.merge(sketch)
+        assert same_sketch(merged, whole)
+
+    def test_merge_different_accuracy(self):
+        with pytest.raises(ValueError):
+            QuantileSketch(0.01).merge(QuantileSketch(0.02))
+
+    def test_round_trip(self):
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        sketch.add_array(sample_values())
+        copy = QuantileSketch.from_dict(json.loads(json.dumps(
+            sketch.to_dict()
+        )))
+        assert same_sketch(copy, sketch)
+        for q in (0, 0.02, 0.5, 0.98, 1):
+            assert copy.quantile(q) == sketch.quantile(q)
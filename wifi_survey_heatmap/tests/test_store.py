@@ -0,0 +1,165 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import json
+import os
+import shutil
+
+import pytest
+
+from wifi_survey_heatmap.convert import convert, read_survey, write_survey
+from wifi_survey_heatmap.store import SQLiteStore
+from wifi_survey_heatmap.survey import load_survey
+from wifi_survey_heatmap.synthetic import synthetic_survey
+from wifi_survey_heatmap.tests.test_convert import assert_same_survey
+
+
+class TestSQLiteStore(object):
+
+    def test_header(self, tmp_path):
+        path = str(tmp_path / 'survey.sqlite')
+        with SQLiteStore(path) as store:
+            store.set_header('img_path', 'floorplan.png')
+            store.set_header('img_path', 'other.png')
+            store.set_header('extra', {'a': [1, 2]})
+        with SQLiteStore(path) as store:
+            assert store.header == {
+                'img_path': 'other.png', 'extra': {'a': [1, 2]}
+            }
+
+    def test_points(self, tmp_path):
+        points = synthetic_survey(4, seed=1)['survey_points']
+        path = str(tmp_path / 'survey.sqlite')
+        with SQLiteStore(path) as store:
+            ids = [store.add_point(p) for p in points]
+            store.move_point(ids[1], 12.5, 7.0)
+            store.remove_point(ids[2])
+        with SQLiteStore(path) as store:
+            result = list(store.points())
+        assert [i for i, _ in result] == [ids[0], ids[1], ids[3]]
+        assert result[0][1] == points[0]
+        assert result[2][1] == points[3]
+        moved = dict(points[1], x=12.5, y=7.0)
+        assert result[1][1] == moved
+
+    def test_load_survey(self, tmp_path):
+        data = synthetic_survey(25, iperf=0.5, seed=2)
+        # null values are present, but missing values aren't
+        for point in data['survey_points'][:5]:
+            if 'udp' in point['result']:
+                point['result']['udp']['jitter_ms'] = None
+        point = data['survey_points'][5]['result']
+        point['tcp'] = dict(point.get('tcp', {}), received_Mbps=None)
+        path = str(tmp_path / 'survey.sqlite')
+        json_path = str(tmp_path / 'survey.json')
+        write_survey(path, data)
+        write_survey(json_path, data)
+        survey = load_survey(path)
+        assert survey.present['tcp_upload_Mbps'][5]
+        assert not survey.present['tcp_upload_Mbps'].all()
+        assert_same_survey(survey, load_survey(json_path))
+
+    def test_missing_required_metric(self, tmp_path):
+        data = synthetic_survey(3, seed=3)
+        del data['survey_points'][1]['result']['tx_power']
+        path = str(tmp_path / 'survey.sqlite')
+        json_path = str(tmp_path / 'survey.json')
+        # rejected like loading the JSON survey is
+        write_survey(json_path, data)
+        with pytest.raises(KeyError):
+            load_survey(json_path)
+        with SQLiteStore(path) as store:
+            store.add_point(data['survey_points'][0])
+            with pytest.raises(KeyError):
+                store.add_point(data['survey_points'][1])
+            assert len(list(store.points())) == 1
+
+
+class TestWriteSurvey(object):
+
+    def test_round_trip(self, tmp_path):
+        data = synthetic_survey(20, seed=3)
+        path = str(tmp_path / 'survey.sqlite')
+        write_survey(path, data)
+        assert read_survey(path) == data
+        assert sorted(os.listdir(str(tmp_path))) == ['survey.sqlite']
+
+    def test_point_types(self, tmp_path):
+        data = synthetic_survey(4, seed=3)
+        points = data['survey_points']
+        points[0].update(x=10.5, y=20.0)
+        del points[1]['failed']
+        points[2]['failed'] = True
+        path = str(tmp_path / 'survey.sqlite')
+        write_survey(path, data)
+        result = read_survey(path)
+        assert json.dumps(result, sort_keys=True) == json.dumps(
+            data, sort_keys=True
+        )
+        assert [type(p['x']) for p in result['survey_points']] == [
+            float, int, int, int
+        ]
+        assert 'failed' not in result['survey_points'][1]
+
+    def test_convert_verify(self, tmp_path):
+        data = synthetic_survey(10, iperf=0.5, seed=4)
+        for point in data['survey_points']:
+            del point['failed']
+        src = str(tmp_path / 'survey.json')
+        write_survey(src, data)
+        convert(src, str(tmp_path / 'survey.sqlite'), verify=True)
+        convert(
+            str(tmp_path / 'survey.sqlite'), str(tmp_path / 'back.json'),
+            verify=True
+        )
+        with open(src) as a, open(str(tmp_path / 'back.json')) as b:
+            assert json.loads(a.read()) == json.loads(b.read())
+
+    def test_replace_with_stale_wal(self, tmp_path):
+        path = str(tmp_path / 'survey.sqlite')
+        store = SQLiteStore(path)
+        for point in synthetic_survey(10, seed=4)['survey_points']:
+            store.add_point(point)
+        # keep a copy of the write-ahead log, as left by a crashed writer
+        shutil.copy(path + '-wal', str(tmp_path / 'wal'))
+        store.close()
+        shutil.copy(str(tmp_path / 'wal'), path + '-wal')
+        data = synthetic_survey(5, seed=5)
+        write_survey(path, data)
+        assert not os.path.exists(path + '-wal')
+        assert not os.path.exists(path + '-shm')
+        assert read_survey(path) == data
@@ -0,0 +1,218 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import io
+import json
+
+import pytest
+
+import wifi_survey_heatmap.survey
+from wifi_survey_heatmap.survey import (
+    _JSONStream, _survey_from_points, is_survey_file, iter_survey_file,
+    load_survey
+)
+from wifi_survey_heatmap.synthetic import synthetic_survey
+from wifi_survey_heatmap.tests.test_convert import assert_same_survey
+
+
+def awkward_survey():
+    """
+    a small survey whose values include every kind of JSON value, strings
+    that need escaping and numbers in every notation
+    """
+    data = synthetic_survey(3, bssids_per_scan=2, seed=1)
+    data['img_path'] = 'floor "plan" \\ é漢\U0001f4f6\n.png'
+    data['notes'] = {
+        'nested': [[], {}, [{'a': [1, [2, {'b': None}]]}]],
+        'flags': [True, False, None],
+        'numbers': [0, -0, 1e300, -2.5e-300, 12345678901234567890, 0.1],
+        'empty': '',
+    }
+    point = data['survey_points'][0]
+    point['x'] = 1234567
+    point['y'] = 0.5
+    point['result']['ssid'] = 'café "\\/\t\b\f\r'
+    point['result']['signal_mbm'] = -4.25e1
+    point['result']['bitrate'] = 1.5e+2
+    point['result']['tcp'] = None
+    del point['result']['udp']
+    data['survey_points'][1]['result']['tx_power'] = None
+    return data
+
+
+def documents(data):
+    """``data`` as JSON in several layouts"""
+    return [
+        json.dumps(data),
+        json.dumps(data, indent=2),
+        json.dumps(data, ensure_ascii=False, separators=(',', ':')),
+        # header keys after the survey points
+        json.dumps(dict(
+            [('survey_points', data['survey_points'])] +
+            [(k, v) for k, v in data.items() if k != 'survey_points']
+        )),
+        ' \n\t' + json.dumps(data, indent='\t').replace(',', ' ,\r\n') + '\n',
+        # numbers in notations json.dumps doesn't use
+        json.dumps(data).replace(
+            '"signal_mbm": -42.5', '"signal_mbm": -4.25E+1'
+        ).replace('"x": 1234567', '"x": 1.234567e6').replace(
+            '"bitrate": 150.0', '"bitrate": 15000E-2'
+        ),
+    ]
+
+
+def parse_stream(text, chunk_size):
+    """read the top-level array ``text`` value by value"""
+    stream = _JSONStream(io.StringIO(text), chunk_size=chunk_size)
+    stream.expect('[')
+    values = []
+    while stream.more(']', not values):
+        values.append(stream.value())
+    stream.end()
+    return values
+
+
+class TestJSONStream(object):
+
+    @pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 1000])
+    def test_values(self, chunk_size):
+        values = [
+            0, -1, 1.5, -0.25, 1e-07, 2.5e+20, 12345678901234567890,
+            True, False, None, '', 'a"b\\cé\U0001f4f6\n', [], {},
+            {'a': [1, {'b': 'c'}], 'd': {}}, [[[]]],
+        ]
+        text = json.dumps(values)
+        assert parse_stream(text, chunk_size) == values
+        text = '[1.5E3 ,-2e-2,\n1E+2, 10.0e0 ]'
+        assert parse_stream(text, chunk_size) == json.loads(text)
+
+    @pytest.mark.parametrize('text', [
+        '[1 2]', '[1,,2]', '[,1]', '[1,]', '[1] 2', '[1.]', '[1e]',
+        '[-]', '["a]', '[tru]', '[1',
+    ])
+    @pytest.mark.parametrize('chunk_size', [1, 2, 1000])
+    def test_invalid(self, text, chunk_size):
+        with pytest.raises(ValueError):
+            json.loads(text)
+        with pytest.raises(ValueError):
+            parse_stream(text, chunk_size)
+
+
+class TestSurveyFile(object):
+
+    @pytest.mark.parametrize('chunk_size', [1, 7, 64, 1024 * 1024])
+    def test_same_as_json_load(self, tmp_path, monkeypatch, chunk_size):
+        monkeypatch.setattr(
+            wifi_survey_heatmap.survey, 'CHUNK_SIZE', chunk_size
+        )
+        data = awkward_survey()
+        path = str(tmp_path / 'survey.json')
+        for text in documents(data):
+            with open(path, 'w') as fh:
+                fh.write(text)
+            expected = json.loads(text)
+            assert expected == data
+            header = {}
+            points = list(iter_survey_file(path, header=header))
+            assert points == expected.pop('survey_points')
+            assert header == expected
+            assert is_survey_file(path)
+            assert_same_survey(
+                load_survey(path), _survey_from_points(points, header)
+            )
+
+    @pytest.mark.parametrize('text, survey', [
+        ('{"survey_points": []}', True),
+        ('{"img_path": "a.png", "survey_points": [{"x": 1}]}', True),
+        ('{"a": {"survey_points": []}, "b": ["survey_points"]}', False),
+        ('{"survey_points": {}}', False),
+        ('{"survey_points": null}', False),
+        ('{"min": 0, "max": 100}', False),
+        ('{}', False),
+        ('[{"survey_points": []}]', False),
+        ('"survey_points"', False),
+    ])
+    def test_is_survey_file(self, tmp_path, text, survey):
+        path = str(tmp_path / 'survey.json')
+        with open(path, 'w') as fh:
+            fh.write(text)
+        doc = json.loads(text)
+        assert survey == (
+            isinstance(doc, dict) and
+            isinstance(doc.get('survey_points'), list)
+        )
+        assert is_survey_file(path) == survey
+
+    @pytest.mark.parametrize('chunk_size', [1, 1024 * 1024])
+    def test_truncated(self, tmp_path, monkeypatch, chunk_size):
+        monkeypatch.setattr(
+            wifi_survey_heatmap.survey, 'CHUNK_SIZE', chunk_size
+        )
+        text = json.dumps(synthetic_survey(2, bssids_per_scan=1, seed=1))
+        path = str(tmp_path / 'survey.json')
+        for end in range(len(text)):
+            with open(path, 'w') as fh:
+                fh.write(text[:end])
+            with pytest.raises(ValueError):
+                json.loads(text[:end])
+            with pytest.raises(ValueError):
+                list(iter_survey_file(path))
+            with pytest.raises(ValueError):
+                load_survey(path)
+
+    @pytest.mark.parametrize('text', [
+        '{"img_path": "a.png" "survey_points": [{"x": 1}]}',
+        '{"img_path": "a.png",, "survey_points": [{"x": 1}]}',
+        '{, "survey_points": [{"x": 1}]}',
+        '{"survey_points": [{"x": 1}], }',
+        '{"survey_points": [{"x": 1} {"x": 2}]}',
+        '{"survey_points": [{"x": 1},]}',
+        '{"survey_points": [{"x": 1}]} []',
+        '{"survey_points": [{"x": 1}]}}',
+        '{1: 2, "survey_points": [{"x": 1}]}',
+        '{"survey_points": [{"x": 1.}]}',
+        '{"survey_points": [{"x": 1e}]}',
+        '{"survey_points" [{"x": 1}]}',
+    ])
+    def test_invalid(self, tmp_path, text):
+        path = str(tmp_path / 'survey.json')
+        with open(path, 'w') as fh:
+            fh.write(text)
+        with pytest.raises(ValueError):
+            json.loads(text)
+        with pytest.raises(ValueError):
+            list(iter_survey_file(path))
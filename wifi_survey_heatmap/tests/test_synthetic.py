@@ -0,0 +1,95 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import numpy as np
+
+from wifi_survey_heatmap.convert import read_survey
+from wifi_survey_heatmap.survey import load_survey
+from wifi_survey_heatmap.synthetic import (
+    synthetic_floorplan, synthetic_survey, write_synthetic_survey
+)
+
+
+class TestSyntheticSurvey(object):
+
+    def test_deterministic(self):
+        assert synthetic_survey(50, seed=7) == synthetic_survey(50, seed=7)
+        assert synthetic_survey(50, seed=7) != synthetic_survey(50, seed=8)
+
+    def test_points(self):
+        data = synthetic_survey(
+            200, bssids_per_scan=5, width=300, height=200, img_path='fp.png'
+        )
+        assert data['img_path'] == 'fp.png'
+        points = data['survey_points']
+        assert len(points) == 200
+        coords = set((p['x'], p['y']) for p in points)
+        assert len(coords) == 200
+        assert all(0 <= x <= 300 and 0 <= y <= 200 for x, y in coords)
+        for point in points:
+            assert len(point['result']['scan_results']) == 5
+            assert point['result']['mac'] in point['result']['scan_results']
+
+    def test_iperf(self):
+        points = synthetic_survey(100, iperf=0.0)['survey_points']
+        assert not any('tcp' in p['result'] for p in points)
+        points = synthetic_survey(100, iperf=1.0)['survey_points']
+        assert all('tcp' in p['result'] for p in points)
+
+    def test_no_scan_results(self):
+        points = synthetic_survey(10, bssids_per_scan=0)['survey_points']
+        assert not any('scan_results' in p['result'] for p in points)
+
+
+class TestWriteSyntheticSurvey(object):
+
+    def test_write(self, tmp_path):
+        path = str(tmp_path / 'survey.npz')
+        img_path = str(tmp_path / 'floorplan.png')
+        write_synthetic_survey(
+            path, 30, img_path, width=120, height=80, seed=3
+        )
+        assert read_survey(path) == synthetic_survey(
+            30, width=120, height=80, img_path=img_path, seed=3
+        )
+        assert len(load_survey(path)) == 30
+
+    def test_floorplan(self):
+        image = synthetic_floorplan(120, 80, room_size=40)
+        assert image.shape == (80, 120, 3)
+        assert image.dtype == np.uint8
+        assert (image == 255).any() and (image < 255).any()
@@ -0,0 +1,159 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+import wifi_survey_heatmap.thresholds as thresholds
+from wifi_survey_heatmap.convert import write_survey
+from wifi_survey_heatmap.survey import load_survey
+from wifi_survey_heatmap.synthetic import synthetic_survey
+from wifi_survey_heatmap.tests.test_journal import crash, open_journal
+from wifi_survey_heatmap.thresholds import (
+    STATS_SUFFIX, MetricStats, ThresholdGenerator, parse_args, survey_stats
+)
+
+
+def same_stats(a, b):
+    return a.to_dict() == b.to_dict()
+
+
+class TestMetricStats(object):
+
+    def test_round_trip(self):
+        stats = MetricStats()
+        values = np.array([-60.0, np.nan, -45.5, -70.0])
+        stats.add_array('signal_quality', values)
+        stats.add_array('tcp_download_Mbps', np.array([np.nan]))
+        copy = MetricStats.from_dict(json.loads(json.dumps(stats.to_dict())))
+        assert same_stats(copy, stats)
+        assert copy.count['signal_quality'] == 3
+        assert copy.min['signal_quality'] == -70.0
+        assert copy.max['signal_quality'] == -45.5
+        assert copy.count['tcp_download_Mbps'] == 0
+        assert copy.percentile('signal_quality', 0) == -70.0
+        assert copy.percentile('signal_quality', 100) == -45.5
+
+    def test_merge(self):
+        values = np.random.default_rng(0).uniform(-90, -30, 100)
+        whole = MetricStats()
+        whole.add_array('signal_quality', values)
+        merged = MetricStats()
+        for part in np.array_split(values, 3):
+            stats = MetricStats()
+            stats.add_array('signal_quality', part)
+            merged.merge(stats)
+        assert same_stats(merged, whole)
+
+
+class TestSurveyStats(object):
+
+    def test_cache(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        write_survey('a.json', synthetic_survey(20, seed=1))
+        computed = []
+        orig = thresholds._survey_stats
+
+        def counting(path):
+            computed.append(path)
+            return orig(path)
+
+        monkeypatch.setattr(thresholds, '_survey_stats', counting)
+        stats = survey_stats('a.json')
+        assert os.path.exists('a.json' + STATS_SUFFIX)
+        assert same_stats(survey_stats('a.json'), stats)
+        assert same_stats(survey_stats('a.json', cache=False), stats)
+        assert len(computed) == 2
+        # changes to the survey, its journal or WAL invalidate the cache
+        write_survey('a.json', synthetic_survey(21, seed=1))
+        stats = survey_stats('a.json')
+        assert stats.count['signal_quality'] == 21
+        journal = open_journal('a.json')
+        journal.add_point(synthetic_survey(22, seed=2)['survey_points'][21])
+        crash(journal)
+        stats = survey_stats('a.json')
+        assert stats.count['signal_quality'] == 22
+        with open('a.json-wal', 'wb') as fh:
+            fh.write(b'wal')
+        survey_stats('a.json')
+        assert len(computed) == 5
+        survey_stats('a.json')
+        assert len(computed) == 5
+        assert len(load_survey('a.json')) == 22
+
+
+class TestThresholdGenerator(object):
+
+    def write_surveys(self):
+        titles = []
+        for seed in range(3):
+            titles.append('s%d.json' % seed)
+            write_survey(titles[-1], synthetic_survey(
+                15 + seed * 5, iperf=0.3 * seed, seed=seed
+            ))
+        return titles
+
+    @pytest.mark.parametrize('percentiles', [None, (2, 98)])
+    def test_jobs_match_serial(self, tmp_path, monkeypatch, percentiles):
+        monkeypatch.chdir(tmp_path)
+        titles = self.write_surveys()
+        results = []
+        for jobs in (1, 3):
+            ThresholdGenerator().generate(
+                titles, jobs=jobs, percentiles=percentiles, cache=False
+            )
+            with open('thresholds.json', 'r') as fh:
+                results.append(json.loads(fh.read()))
+        assert results[0] == results[1]
+        assert 'signal_quality' in results[0]
+
+    def test_bad_survey(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        titles = self.write_surveys()
+        with open('bad.json', 'w') as fh:
+            fh.write('{"img_path": "x.png", "survey_points": [{"x": 1')
+        for jobs in (1, 2):
+            with pytest.raises(SystemExit) as ex:
+                ThresholdGenerator().generate(titles + ['bad.json'], jobs=jobs)
+            assert ex.value.code == 1
+        assert not os.path.exists('thresholds.json')
+
+    def test_default_jobs(self):
+        assert parse_args(['a.json']).jobs == 1
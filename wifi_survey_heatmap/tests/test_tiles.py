@@ -0,0 +1,238 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+from matplotlib.image import imsave
+
+from wifi_survey_heatmap.convert import read_survey, write_survey
+from wifi_survey_heatmap.heatmap import HeatMapGenerator
+from wifi_survey_heatmap.interpolate import interpolate_fields
+from wifi_survey_heatmap.synthetic import (
+    synthetic_floorplan, write_synthetic_survey
+)
+from wifi_survey_heatmap.tiles import (
+    MANIFEST_NAME, TileIndex, TilePyramid, tile_hash, tile_path
+)
+
+
+class TestTilePyramid(object):
+
+    @pytest.mark.parametrize('width, height, counts', [
+        (200, 100, [1]),
+        (256, 256, [1]),
+        (257, 100, [1, 2]),
+        (512, 256, [1, 2]),
+        (1000, 700, [1, 4, 12]),
+        (300, 1100, [1, 2, 3, 10]),
+    ])
+    def test_tiles_per_zoom(self, width, height, counts):
+        pyramid = TilePyramid(width, height)
+        tiles = list(pyramid.tiles())
+        assert pyramid.max_zoom == len(counts) - 1
+        assert [
+            len([t for t in tiles if t[0] == zoom])
+            for zoom in range(pyramid.max_zoom + 1)
+        ] == counts
+        assert len(set(tiles)) == len(tiles)
+        assert tiles == sorted(tiles)
+
+    def test_extent(self):
+        pyramid = TilePyramid(1000, 700)
+        # the whole floorplan, at a quarter of its resolution
+        assert pyramid.extent(0, 0, 0) == ((0, 0, 1000, 700), (250, 175))
+        assert pyramid.extent(2, 1, 1) == ((256, 256, 512, 512), (256, 256))
+        # clipped to the bottom right corner of the floorplan
+        assert pyramid.extent(2, 3, 2) == ((768, 512, 1000, 700), (232, 188))
+        assert pyramid.extent(1, 1, 1) == ((512, 512, 1000, 700), (244, 94))
+
+
+class TestTileIndex(object):
+
+    def test_neighborhood(self):
+        rng = np.random.default_rng(0)
+        x = rng.uniform(0, 1000, 200)
+        y = rng.uniform(0, 700, 200)
+        fields = {'a': rng.uniform(0, 100, 200)}
+        pyramid = TilePyramid(1000, 700)
+        index = TileIndex(x, y, neighbors=8)
+        for tile in pyramid.tiles():
+            (x0, y0, x1, y1), _ = pyramid.extent(*tile)
+            idx = index.neighborhood((x0, y0, x1, y1))
+            gx, gy = np.meshgrid(
+                np.linspace(x0, x1, 20), np.linspace(y0, y1, 20)
+            )
+            gx, gy = gx.flatten(), gy.flatten()
+            expected = interpolate_fields(
+                'local', x, y, fields, gx, gy, neighbors=8
+            )['a']
+            result = interpolate_fields(
+                'local', x[idx], y[idx], {'a': fields['a'][idx]}, gx, gy,
+                neighbors=8
+            )['a']
+            assert np.allclose(result, expected)
+            if tile[0] == pyramid.max_zoom:
+                assert len(idx) < len(x)
+
+
+class TestTileHash(object):
+
+    def test_inputs(self):
+        x = np.array([1.0, 2.0, 3.0])
+        y = np.array([4.0, 5.0, 6.0])
+        fields = {'a': np.array([7.0, 8.0, 9.0])}
+        params = {'cmap': 'viridis', 'image': ['abc', 100, 80]}
+        digest = tile_hash(x, y, fields, params)
+        assert tile_hash(
+            x.copy(), y.copy(), {'a': fields['a'].copy()}, dict(params)
+        ) == digest
+        # integer coordinates hash like the same floats
+        assert tile_hash(
+            x.astype(int), y.astype(int), fields, params
+        ) == digest
+        changed = [
+            tile_hash(x + [0, 0, 1], y, fields, params),
+            tile_hash(x, y, {'a': fields['a'] + [0, 1, 0]}, params),
+            tile_hash(x, y, {'b': fields['a']}, params),
+            tile_hash(x, y, fields, dict(params, cmap='RdYlBu_r')),
+            tile_hash(x, y, fields, dict(params, image=['abd', 100, 80])),
+            tile_hash(x, y, fields, dict(params, image=['abc', 101, 80])),
+        ]
+        assert len(set(changed + [digest])) == len(changed) + 1
+
+
+class TestGenerateTiles(object):
+
+    def generate(self, cname='RdYlBu_r', **kwargs):
+        """
+        render the tiles of ``a.json`` to ``tiles`` and return the
+        ``(zoom, x, y)`` of the tiles that were rendered
+        """
+        rendered = []
+        render_tile = HeatMapGenerator._render_tile
+
+        def record(gen, tile, idx):
+            rendered.append(tile)
+            render_tile(gen, tile, idx)
+
+        HeatMapGenerator._render_tile = record
+        try:
+            HeatMapGenerator(
+                None, 'a.json', False, cname, None, tiles_dir='tiles',
+                interpolation='local', neighbors=4, **kwargs
+            ).generate()
+        finally:
+            HeatMapGenerator._render_tile = render_tile
+        return rendered
+
+    def manifest(self):
+        with open(os.path.join('tiles', MANIFEST_NAME)) as fh:
+            return json.loads(fh.read())
+
+    def setup_survey(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        write_synthetic_survey(
+            'a.json', 40, 'floorplan.png', 600, 400, seed=1
+        )
+        tiles = list(TilePyramid(600, 400).tiles())
+        assert self.generate() == tiles
+        for tile in tiles:
+            for key in ('signal_quality', 'tx_power'):
+                assert os.path.exists(tile_path('tiles', key, tile))
+        assert len(self.manifest()) == len(tiles)
+        return tiles
+
+    def test_unchanged(self, tmp_path, monkeypatch):
+        self.setup_survey(tmp_path, monkeypatch)
+        manifest = self.manifest()
+        assert self.generate() == []
+        assert self.manifest() == manifest
+
+    def test_one_point(self, tmp_path, monkeypatch):
+        tiles = self.setup_survey(tmp_path, monkeypatch)
+        old = self.manifest()
+        data = read_survey('a.json')
+        signal = [p['result']['signal_mbm'] for p in data['survey_points']]
+        # a point near a corner that doesn't set the color scale range
+        point = min(
+            (
+                p for p in data['survey_points']
+                if min(signal) < p['result']['signal_mbm'] < max(signal)
+            ), key=lambda p: p['x'] + p['y']
+        )
+        point['result']['signal_mbm'] = (min(signal) + max(signal)) / 2.0
+        write_survey('a.json', data)
+        rendered = self.generate()
+        new = self.manifest()
+        # only the tiles near the point, and the whole floorplan tile
+        assert (0, 0, 0) in rendered
+        assert 0 < len(rendered) < len(tiles)
+        assert sorted(rendered) == sorted(
+            tuple(int(v) for v in name.split('/'))
+            for name in new if new[name] != old[name]
+        )
+        assert self.generate() == []
+
+    def test_missing_tile(self, tmp_path, monkeypatch):
+        self.setup_survey(tmp_path, monkeypatch)
+        os.unlink(tile_path('tiles', 'tx_power', (2, 2, 1)))
+        assert self.generate() == [(2, 2, 1)]
+
+    @pytest.mark.parametrize('size', [(600, 400), (700, 400)])
+    def test_floorplan(self, tmp_path, monkeypatch, size):
+        self.setup_survey(tmp_path, monkeypatch)
+        old = self.manifest()
+        image = synthetic_floorplan(*size)
+        image[0, 0] = 0.5
+        imsave('floorplan.png', image)
+        rendered = self.generate()
+        assert rendered == list(TilePyramid(*size).tiles())
+        new = self.manifest()
+        for name, digest in old.items():
+            assert new.get(name) != digest
+
+    def test_options(self, tmp_path, monkeypatch):
+        tiles = self.setup_survey(tmp_path, monkeypatch)
+        assert self.generate(cname='viridis') == tiles
+        with open('thresholds.json', 'w') as fh:
+            fh.write(json.dumps({'tx_power': {'min': 0, 'max': 30}}))
+        assert self.generate(
+            cname='viridis', thresholds='thresholds.json'
+        ) == tiles
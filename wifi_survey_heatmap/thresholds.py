@@ -37,34 +37,280 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 
 import sys
 import argparse
+import hashlib
 import logging
 import json
+import os
+from array import array
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-from wifi_survey_heatmap.heatmap import HeatMapGenerator
+import numpy as np
+
+from wifi_survey_heatmap.journal import journal_path
+from wifi_survey_heatmap.sketch import (
+    DEFAULT_RELATIVE_ACCURACY, QuantileSketch
+)
+from wifi_survey_heatmap.survey import (
+    METRICS, NPZ_EXTENSION, SQLITE_EXTENSION, _metric_value, iter_survey,
+    load_survey, open_temp, survey_filename
+)
 
 FORMAT = "[%(asctime)s %(levelname)s] %(message)s"
 logging.basicConfig(level=logging.WARNING, format=FORMAT)
 logger = logging.getLogger()
 
+#: Suffix added to a survey filename for its cached :py:class:`~.MetricStats`.
+STATS_SUFFIX = '.stats'
+
+#: Version of the cached statistics; bump this to invalidate existing caches.
+STATS_VERSION = 1
+
+#: Number of values of one metric buffered while streaming a JSON survey
+#: before they are added to its :py:class:`~.MetricStats` at once.
+STATS_BATCH_SIZE = 4096
+
+
+class MetricStats(object):
+    """
+    Running count, minimum, maximum and :py:class:`~.QuantileSketch` of the
+    values of each of :py:data:`~.METRICS` (see :py:func:`~.survey_stats`).
+    The statistics of separate surveys can be combined with
+    :py:meth:`~.merge`.
+    """
+
+    def __init__(self):
+        self.count = {k: 0 for k in METRICS.keys()}
+        self.min = {k: np.inf for k in METRICS.keys()}
+        self.max = {k: -np.inf for k in METRICS.keys()}
+        self.sketch = {k: QuantileSketch() for k in METRICS.keys()}
+
+    def add_array(self, key, values):
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.count[key] += len(values)
+        self.min[key] = min(self.min[key], float(values.min()))
+        self.max[key] = max(self.max[key], float(values.max()))
+        self.sketch[key].add_array(values)
+
+    def merge(self, other):
+        for key in METRICS.keys():
+            self.count[key] += other.count[key]
+            self.min[key] = min(self.min[key], other.min[key])
+            self.max[key] = max(self.max[key], other.max[key])
+            self.sketch[key].merge(other.sketch[key])
+
+    def percentile(self, key, percent):
+        """
+        Return the approximate ``percent`` percentile of the values of metric
+        ``key``. The 0th and 100th percentiles are the exact minimum and
+        maximum.
+        """
+        if percent <= 0:
+            return self.min[key]
+        if percent >= 100:
+            return self.max[key]
+        value = self.sketch[key].quantile(percent / 100.0)
+        return min(max(value, self.min[key]), self.max[key])
+
+    def to_dict(self):
+        return {
+            key: {
+                'count': self.count[key],
+                'min': self.min[key] if self.count[key] else None,
+                'max': self.max[key] if self.count[key] else None,
+                'sketch': self.sketch[key].to_dict(),
+            } for key in METRICS.keys()
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls()
+        for key in METRICS.keys():
+            if not d[key]['count']:
+                continue
+            stats.count[key] = d[key]['count']
+            stats.min[key] = d[key]['min']
+            stats.max[key] = d[key]['max']
+            stats.sketch[key] = QuantileSketch.from_dict(d[key]['sketch'])
+        return stats
+
+
+def survey_digest(path):
+    """
+    Return a hash of the content of the survey file at ``path``, along with
+    its journal (see :py:mod:`~.journal`) and SQLite write-ahead log, if
+    there are any.
+    """
+    h = hashlib.sha256()
+    h.update(repr((
+        STATS_VERSION, DEFAULT_RELATIVE_ACCURACY, sorted(METRICS.items())
+    )).encode())
+    for fname in (path, journal_path(path), path + '-wal'):
+        if not os.path.exists(fname):
+            continue
+        h.update(fname[len(path):].encode())
+        with open(fname, 'rb') as fh:
+            for chunk in iter(partial(fh.read, 1024 * 1024), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def _load_cached_stats(path, digest):
+    """
+    Return the cached :py:class:`~.MetricStats` of the survey file at
+    ``path``, or None if there are none for the current ``digest`` of it.
+    """
+    try:
+        with open(path + STATS_SUFFIX, 'r') as fh:
+            cached = json.loads(fh.read())
+        if cached['digest'] != digest:
+            logger.debug('Cached statistics of %s are stale', path)
+            return None
+        return MetricStats.from_dict(cached['metrics'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _save_cached_stats(path, digest, stats):
+    fname = path + STATS_SUFFIX
+    try:
+        fh, tmp = open_temp(fname)
+        with fh:
+            fh.write(json.dumps({
+                'digest': digest, 'metrics': stats.to_dict()
+            }))
+        os.replace(tmp, fname)
+    except OSError as ex:
+        logger.warning('Unable to cache statistics in %s: %s', fname, ex)
+
+
+def survey_stats(title, cache=True):
+    """
+    Return the :py:class:`~.MetricStats` of one survey, in a single pass over
+    its points. JSON surveys are streamed point by point, without building
+    arrays of the whole survey; binary and SQLite surveys are columnar
+    already, so their metric columns are read directly. Like
+    :py:meth:`~.HeatMapGenerator.load_data`, only the first of several points
+    at the same coordinates is counted.
+
+    If ``cache`` is True, the statistics are stored next to the survey file
+    (with :py:data:`~.STATS_SUFFIX` added to its name) along with a hash of
+    the survey (see :py:func:`~.survey_digest`), and only computed again
+    once the survey changes.
+
+    :param title: survey title or filename
+    :type title: str
+    :param cache: whether to use and update the cached statistics
+    :type cache: bool
+    :rtype: MetricStats
+    """
+    path = survey_filename(title)
+    if not cache:
+        return _survey_stats(path)
+    digest = survey_digest(path)
+    stats = _load_cached_stats(path, digest)
+    if stats is not None:
+        logger.info('Using cached statistics of %s', path)
+        return stats
+    stats = _survey_stats(path)
+    _save_cached_stats(path, digest, stats)
+    return stats
+
+
+def _survey_stats(path):
+    stats = MetricStats()
+    if path.endswith(NPZ_EXTENSION) or path.endswith(SQLITE_EXTENSION):
+        survey = load_survey(path)
+        idx = survey.distinct()
+        for key in METRICS.keys():
+            stats.add_array(key, survey.values[key][idx])
+        return stats
+    specs = list(METRICS.items())
+    buffers = {k: array('d') for k in METRICS.keys()}
+    seen = set()
+    failed = 0
+    for point in iter_survey(path):
+        # like load_survey, leave out points whose measurement was aborted
+        if point.get('failed'):
+            failed += 1
+            continue
+        if (point['x'], point['y']) in seen:
+            logger.warning(
+                'Two overlapping datapoints found in %s. Discarding one of '
+                'them. point=%s', path, (point['x'], point['y'])
+            )
+            continue
+        seen.add((point['x'], point['y']))
+        result = point['result']
+        for key, spec in specs:
+            _, value = _metric_value(result, spec)
+            # null (and NaN) values count as missing
+            if value is None or value != value:
+                continue
+            buf = buffers[key]
+            buf.append(value)
+            if len(buf) >= STATS_BATCH_SIZE:
+                stats.add_array(key, np.frombuffer(buf))
+                del buf[:]
+    for key, buf in buffers.items():
+        stats.add_array(key, np.frombuffer(buf))
+    if failed:
+        logger.warning('Skipping %d failed survey points', failed)
+    logger.info('Read %d survey points from %s', len(seen), path)
+    return stats
+
 
 class ThresholdGenerator(object):
 
-    def generate(self, titles):
+    def generate(self, titles, jobs=1, percentiles=None, cache=True):
+        """
+        Write the overall minimum and maximum of each metric across the
+        surveys ``titles`` to ``thresholds.json``. Each survey is reduced to
+        its :py:class:`~.MetricStats` in one pass (see
+        :py:func:`~.survey_stats`), ``jobs`` surveys at a time in worker
+        processes, and the per-survey results are merged at the end.
+
+        :param percentiles: if given, a ``(low, high)`` tuple of percentiles
+          to write as the thresholds instead of the minimum and maximum, so
+          that a few outlying values don't stretch the color scale
+        :type percentiles: tuple
+        :param cache: whether to use and update the cached statistics of
+          each survey
+        :type cache: bool
+        """
+        stats_func = partial(survey_stats, cache=cache)
+        try:
+            if jobs < 2 or len(titles) < 2:
+                partials = [stats_func(t) for t in titles]
+            else:
+                with ProcessPoolExecutor(
+                    max_workers=min(jobs, len(titles))
+                ) as pool:
+                    partials = list(pool.map(stats_func, titles))
+        except ValueError as ex:
+            logger.error(str(ex))
+            raise SystemExit(1)
+        stats = MetricStats()
+        for survey in partials:
+            stats.merge(survey)
         res = defaultdict(dict)
-        items = [
-            HeatMapGenerator(
-                None, t, False, 'RdYlBu_r', None
-            ).load_data()
-            for t in titles
-        ]
-        for key in HeatMapGenerator.graphs.keys():
-            res[key]['min'] = min([
-                min(value for value in x[key] if value is not None) for x in items
-            ])
-            res[key]['max'] = max([
-                max(value for value in x[key] if value is not None) for x in items
-            ])
+        for key in METRICS.keys():
+            if not stats.count[key]:
+                logger.info('Skipping %s: no values in any survey', key)
+                continue
+            res[key]['min'] = float(stats.min[key])
+            res[key]['max'] = float(stats.max[key])
+            if percentiles is not None:
+                res[key]['min'] = stats.percentile(key, percentiles[0])
+                res[key]['max'] = stats.percentile(key, percentiles[1])
+                logger.info(
+                    '%s: p%g=%s p%g=%s (min=%s max=%s)', key, percentiles[0],
+                    res[key]['min'], percentiles[1], res[key]['max'],
+                    stats.min[key], stats.max[key]
+                )
         with open('thresholds.json', 'w') as fh:
             fh.write(json.dumps(res))
         logger.info('Wrote: thresholds.json')
@@ -82,11 +328,29 @@ def parse_args(argv):
     )
     p.add_argument('-v', '--verbose', dest='verbose', action='count', default=0,
                    help='verbose output. specify twice for debug-level output.')
+    p.add_argument('-j', '--jobs', dest='jobs', action='store', type=int,
+                   default=1,
+                   help='Number of surveys to read in parallel worker '
+                        'processes (default: %(default)s)')
+    p.add_argument('-p', '--percentiles', dest='percentiles', action='store',
+                   type=float, nargs=2, metavar=('LOW', 'HIGH'), default=None,
+                   help='Use the LOW and HIGH percentiles of each metric '
+                        '(e.g. 2 98) as thresholds instead of the minimum '
+                        'and maximum')
+    p.add_argument('--no-cache', dest='cache', action='store_false',
+                   default=True,
+                   help='Do not use or write the cached statistics of each '
+                        'survey (stored next to it, with a "%s" suffix)'
+                        % STATS_SUFFIX)
     p.add_argument(
         'TITLE', type=str, help='Title for survey (and data filename)',
         nargs='+'
     )
     args = p.parse_args(argv)
+    if args.percentiles is not None:
+        low, high = args.percentiles
+        if not 0 <= low < high <= 100:
+            p.error('--percentiles must be 0 <= LOW < HIGH <= 100')
     return args
 
 
@@ -128,7 +392,10 @@ def main():
     elif args.verbose == 1:
         set_log_info()
 
-    ThresholdGenerator().generate(args.TITLE)
+    ThresholdGenerator().generate(
+        args.TITLE, jobs=args.jobs, percentiles=args.percentiles,
+        cache=args.cache
+    )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,197 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/wifi-survey-heatmap>
+
+##################################################################################
+Copyright 2017 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of wifi-survey-heatmap, also known as wifi-survey-heatmap.
+
+    wifi-survey-heatmap is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    wifi-survey-heatmap is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with wifi-survey-heatmap.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/wifi-survey-heatmap> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+
+import numpy as np
+from PIL import Image
+
+from wifi_survey_heatmap.interpolate import DEFAULT_NEIGHBORS
+
+logger = logging.getLogger(__name__)
+
+#: Width and height of each tile, in pixels.
+TILE_SIZE = 256
+
+#: Name of the file, in the root of a tile directory, that records the
+#: content hash of every tile.
+MANIFEST_NAME = 'manifest.json'
+
+
+class TilePyramid(object):
+    """
+    Geometry of a tile pyramid over a floorplan image.
+
+    At the highest zoom level, ``max_zoom``, one tile pixel is one floorplan
+    pixel; each lower level halves the resolution, down to zoom level 0 where
+    the whole floorplan fits in a single tile. Tiles are addressed as
+    ``(zoom, x, y)`` with ``x`` and ``y`` counted from the top left.
+    """
+
+    def __init__(self, width, height, tile_size=TILE_SIZE):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.max_zoom = max(
+            0, int(math.ceil(math.log2(max(width, height) / tile_size)))
+        )
+
+    def scale(self, zoom):
+        """tile pixels per floorplan pixel at ``zoom``"""
+        return 2.0 ** (zoom - self.max_zoom)
+
+    def tiles(self):
+        """
+        Yield every ``(zoom, x, y)`` tile address, lowest zoom level first.
+        """
+        for zoom in range(self.max_zoom + 1):
+            span = self.tile_size / self.scale(zoom)
+            for tx in range(int(math.ceil(self.width / span))):
+                for ty in range(int(math.ceil(self.height / span))):
+                    yield zoom, tx, ty
+
+    def extent(self, zoom, tx, ty):
+        """
+        Return the area of the floorplan covered by a tile, as
+        ``(x0, y0, x1, y1)`` floorplan coordinates clipped to the floorplan,
+        and the ``(width, height)`` in pixels of the covered part of the tile.
+        """
+        scale = self.scale(zoom)
+        span = self.tile_size / scale
+        x0 = tx * span
+        y0 = ty * span
+        x1 = min(self.width, x0 + span)
+        y1 = min(self.height, y0 + span)
+        size = (
+            max(1, int(round((x1 - x0) * scale))),
+            max(1, int(round((y1 - y0) * scale)))
+        )
+        return (x0, y0, x1, y1), size
+
+
+class TileIndex(object):
+    """
+    KD-tree index of the survey points, used to find the points that can
+    influence the ``local`` interpolation within a tile.
+    """
+
+    def __init__(self, x, y, neighbors=DEFAULT_NEIGHBORS):
+        from scipy.spatial import cKDTree
+        self._tree = cKDTree(np.column_stack((x, y)).astype(float))
+        self._k = min(neighbors, len(x))
+
+    def neighborhood(self, extent):
+        """
+        Return the sorted indices of all survey points that are among the
+        ``neighbors`` nearest points of any location within ``extent``.
+
+        If ``d`` is the distance from the tile center to its k-th nearest
+        point and ``h`` is half the tile diagonal, every location in the tile
+        has its k nearest points within ``d + h`` of itself, so within
+        ``d + 2h`` of the center. Interpolating a tile from just these points
+        gives exactly the same result as using the whole survey.
+        """
+        x0, y0, x1, y1 = extent
+        center = ((x0 + x1) / 2.0, (y0 + y1) / 2.0)
+        half_diagonal = math.hypot(x1 - x0, y1 - y0) / 2.0
+        dist, _ = self._tree.query(center, k=self._k)
+        radius = np.max(dist) + 2 * half_diagonal
+        return np.array(
+            sorted(self._tree.query_ball_point(center, radius)), dtype=int
+        )
+
+
+def tile_hash(x, y, fields, params):
+    """
+    Return a hash of everything that determines the content of a tile (or
+    of any other output): the survey points in its neighborhood, the names
+    and values of their metrics, and the render parameters (color scale
+    ranges, colormap, etc.).
+
+    :param fields: metric name to values at the neighborhood points
+    :type fields: dict
+    :param params: JSON-serializable render parameters
+    :rtype: str
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(
+        [params, sorted(fields.keys())], sort_keys=True
+    ).encode())
+    for arr in [x, y] + [fields[k] for k in sorted(fields.keys())]:
+        h.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def tile_path(root, key, tile):
+    """path of the PNG for metric ``key`` and tile ``(zoom, x, y)``"""
+    zoom, tx, ty = tile
+    return os.path.join(root, key, str(zoom), str(tx), '%d.png' % ty)
+
+
+def write_tile(fname, image, tile_size=TILE_SIZE):
+    """
+    Write a ``uint8`` RGB array as a ``tile_size`` square RGBA PNG; the part
+    of the tile outside the floorplan is left transparent.
+    """
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    tile = Image.new('RGBA', (tile_size, tile_size), (0, 0, 0, 0))
+    tile.paste(Image.fromarray(image), (0, 0))
+    tile.save(fname, compress_level=1)
+
+
+def load_manifest(root, name=MANIFEST_NAME):
+    """
+    Return the output name to hash dict stored in the manifest ``name`` in
+    directory ``root`` (by default, the tile manifest), or an empty dict if
+    there is none.
+    """
+    try:
+        with open(os.path.join(root, name), 'r') as fh:
+            return json.loads(fh.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(root, manifest, name=MANIFEST_NAME):
+    fname = os.path.join(root, name)
+    with open(fname + '.tmp', 'w') as fh:
+        fh.write(json.dumps(manifest, sort_keys=True))
+    os.replace(fname + '.tmp', fname)
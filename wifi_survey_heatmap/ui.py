@@ -47,6 +47,13 @@ from pubsub import pub
 
 from wifi_survey_heatmap.collector import Collector
 from wifi_survey_heatmap.libnl import Scanner
+from wifi_survey_heatmap.journal import SurveyJournal, replay_journal
+from wifi_survey_heatmap.rootscanner import RemoteScanner, child_command
+from wifi_survey_heatmap.store import SQLiteStore
+from wifi_survey_heatmap.survey import (
+    NPZ_EXTENSION, SQLITE_EXTENSION, STORES, open_temp, survey_filename,
+    write_npz
+)
 
 FORMAT = "[%(asctime)s %(levelname)s] %(message)s"
 logging.basicConfig(level=logging.WARNING, format=FORMAT)
@@ -100,6 +107,8 @@ class SurveyPoint(object):
         self.progress = 0
         self.dotSize = 20
         self.result = {}
+        # ID in the survey store, once saved
+        self.store_id = None
 
     def set_result(self, res):
         self.result = res
@@ -218,9 +227,22 @@ class FloorplanPanel(wx.Panel):
         self._moving_y = None
         self.scale_x = 1.0
         self.scale_y = 1.0
-        self.data_filename = '%s.json' % self.parent.survey_title
-        if os.path.exists(self.data_filename):
-            self._load_file(self.data_filename)
+        self.data_filename = survey_filename(
+            self.parent.survey_title, store=self.parent.store
+        )
+        if self.data_filename.endswith(SQLITE_EXTENSION):
+            self.store = SQLiteStore(self.data_filename)
+            self.store.set_header('img_path', self.img_path)
+            self._load_store()
+        else:
+            header = {}
+            points = []
+            if os.path.exists(self.data_filename):
+                points = self._load_file(self.data_filename, header)
+            header['img_path'] = self.img_path
+            self.store = SurveyJournal(
+                self.data_filename, header, points, self._write_json
+            )
         self._duration = self.parent.duration
         self.collector = Collector(
             self.parent.server, self._duration, self.parent.scanner)
@@ -228,17 +250,27 @@ class FloorplanPanel(wx.Panel):
         self.current_worker = None
 
     # UI thread only
-    def _load_file(self, fpath):
-        with open(fpath, 'r') as fh:
-            raw = fh.read()
-        data = json.loads(raw)
-        if 'survey_points' not in data:
+    def _load_file(self, fpath, header):
+        try:
+            points = replay_journal(fpath, header=header)
+        except ValueError:
             logger.error('Trying to load incompatible JSON file')
             exit(1)
-        for point in data['survey_points']:
+        for idx, point in enumerate(points):
+            p = SurveyPoint(self, point['x'], point['y'])
+            p.set_result(point['result'])
+            p.set_is_finished()
+            p.store_id = idx
+            self.survey_points.append(p)
+        return points
+
+    # UI thread only
+    def _load_store(self):
+        for point_id, point in self.store.points():
             p = SurveyPoint(self, point['x'], point['y'])
             p.set_result(point['result'])
             p.set_is_finished()
+            p.store_id = point_id
             self.survey_points.append(p)
 
     # UI thread only
@@ -313,7 +345,7 @@ class FloorplanPanel(wx.Panel):
             return
         self.survey_points.remove(point)
         self.setStatus(f'Removed point at ({x}, {y})')
-        self._write_json()
+        self._save_point(point, 'remove')
 
     # UI thread only
     def onLeftDown(self, event):
@@ -348,14 +380,15 @@ class FloorplanPanel(wx.Panel):
         res = self.YesNo(
             f'Move point from ({oldx}, {oldy}) to ({x}, {y})?'
         )
-        if not res:
+        if res:
+            self._save_point(self._moving_point, 'move')
+        else:
             self._moving_point.x = self._moving_x
             self._moving_point.y = self._moving_y
         self._moving_point = None
         self._moving_x = None
         self._moving_y = None
         self.Refresh()
-        self._write_json()
 
     # UI thread only
     def onMotion(self, event):
@@ -472,7 +505,7 @@ class FloorplanPanel(wx.Panel):
         self.setStatus(
             'Saving to: %s' % self.data_filename
         )
-        self._write_json()
+        self._save_point(self.survey_points[-1], 'add')
         self._ding()
 
     # any thread
@@ -482,20 +515,44 @@ class FloorplanPanel(wx.Panel):
         subprocess.call([self.parent.ding_command, self.parent.ding_path])
 
     # any thread
-    def _write_json(self):
-        # Only store finished survey points
-        survey_points = [p.as_dict for p in self.survey_points if p.is_finished]
-
-        res = json.dumps(
-            {'img_path': self.img_path, 'survey_points': survey_points},
-            cls=SafeEncoder, indent=2
-        )
-        with open(self.data_filename, 'w') as fh:
-            fh.write(res)
+    def _save_point(self, point, action):
+        """
+        Save a change to one survey point; ``action`` is ``add`` (when its
+        measurement finishes), ``move`` or ``remove``. This only writes the
+        change to the SQLite store or survey journal, not the whole survey.
+        """
+        if action == 'add':
+            point.store_id = self.store.add_point(
+                json.loads(json.dumps(point.as_dict, cls=SafeEncoder))
+            )
+        elif point.store_id is None:
+            # never finished, so never saved
+            return
+        elif action == 'move':
+            self.store.move_point(point.store_id, point.x, point.y)
+        else:
+            self.store.remove_point(point.store_id)
         self.setStatus(
             'Saved to %s; ready...' % self.data_filename
         )
 
+    # journal compaction thread
+    def _write_json(self, data):
+        if self.data_filename.endswith(NPZ_EXTENSION):
+            write_npz(self.data_filename, data)
+            return
+        res = json.dumps(data, cls=SafeEncoder, indent=2)
+        # write to a new file and rename it, so that the survey file is
+        # never left half-written
+        fh, tmp = open_temp(self.data_filename)
+        try:
+            with fh:
+                fh.write(res)
+            os.replace(tmp, self.data_filename)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
     # UI thread only
     def warn(self, message, caption='Warning!'):
         dlg = wx.MessageDialog(self.parent, message, caption,
@@ -549,10 +606,11 @@ class MainFrame(wx.Frame):
 
     def __init__(
             self, img_path, server, survey_title, scan, bssid, ding,
-            ding_command, duration, scanner, *args, **kw
+            ding_command, duration, scanner, *args, store=None, **kw
     ):
         super(MainFrame, self).__init__(*args, **kw)
         self.img_path = img_path
+        self.store = store
         self.server = server
         self.scan = scan
         self.survey_title = survey_title
@@ -566,6 +624,7 @@ class MainFrame(wx.Frame):
         self.scanner = scanner
         self.pnl = FloorplanPanel(self)
         self.makeMenuBar()
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
 
     def makeMenuBar(self):
         fileMenu = wx.Menu()
@@ -580,6 +639,11 @@ class MainFrame(wx.Frame):
         """Close the frame, terminating the application."""
         self.Close(True)
 
+    def OnClose(self, event):
+        """Save any pending survey changes before the frame closes."""
+        self.pnl.store.close()
+        event.Skip()
+
 
 def parse_args(argv):
     """
@@ -614,6 +678,11 @@ def parse_args(argv):
     p.add_argument('-t', '--title', dest='TITLE', type=str,
                    default=None, help='Title for survey (and data filename)'
                    )
+    p.add_argument('--store', dest='store', action='store', type=str,
+                   choices=sorted(STORES.keys()), default=None,
+                   help='Survey file format; "sqlite" saves each point as '
+                        'it changes instead of rewriting the whole file. '
+                        'Default is an existing file for the title, or json')
     p.add_argument('--libnl-debug', dest='libnl_debug', action='store_true',
                    default=False,
                    help='enable debug-level logging for libnl')
@@ -702,87 +771,17 @@ def ask_for_floorplan(app):
     return resu
 
 
-def main_root():
-    data = json.loads(sys.stdin.readline())
-    if data["cmd"] != "init":
-        sys.stderr.print("Invalid command tuple:" + json.dumps(data))
-        return
-
-    scanner = Scanner(scan=False)
-    scanner.set_interface(data["interface"])
-
-    sys.stdout.write(json.dumps({"status": "ok", "data":None})+"\n")
-    sys.stdout.flush()
-
-    while True:
-        data = json.loads(sys.stdin.readline())
-        if data["cmd"] == "get_current_bssid":
-            result = scanner.get_current_bssid()
-        elif data["cmd"] == "get_iface_data":
-            result = scanner.get_iface_data()
-        elif data["cmd"] == "scan_all_access_points":
-            result = scanner.scan_all_access_points()
-        else:
-            sys.stderr.print("Invalid action tuple:" + json.dumps(data))
-            return
-        sys.stdout.write(json.dumps({"status": "ok", "data": result})+"\n")
-        sys.stdout.flush()
-
-class RemoteScanner(object):
-
-    def __init__(self, popen, scan=True, interface=None):
-        super().__init__()
-        logger.debug(
-            'Initializing RemoteScanner interface: %s',
-            interface
-        )
-        self.p = popen
-        # initialize the subprocess
-        self._write({"cmd": "init", "interface": interface})
-        self.interface_name = interface
-
-    def _write(self, data):
-        txt = json.dumps(data)
-        self.p.stdin.write(f"{txt}\n")
-        self.p.stdin.flush()
-        result = self.p.stdout.readline()
-        logger.debug(result)
-        if result == "" or result == "\n":
-            raise "Subprocess exited"
-        obj = json.loads(result)
-        if obj["status"] != "ok":
-            logger.warn(result)
-            raise obj
-        else:
-            return obj["data"]
-
-
-    def get_current_bssid(self):
-        return self._write({"cmd": "get_current_bssid"})
-
-    def get_iface_data(self):
-        return self._write({"cmd": "get_iface_data"})
-
-    def scan_all_access_points(self):
-        return self._write({"cmd": "scan_all_access_points"})
-
-SECRET_ELEVATED_CHILD = "--internal-elevated-scannner"
-
-
 def main():
-    if sys.argv[1:] == [SECRET_ELEVATED_CHILD]:
-        if os.geteuid() != 0:
-            raise RuntimeError('ERROR: This script must be run as root/sudo.')
-        main_root()
-        return
-
     p = None
     if os.getuid() != 0:
         pass # we can parse the args first
     else:
         if os.getenv("SUDO_UID") is not None:
             # Drop to the sudo UID after we span the child
-            p = Popen([sys.executable, sys.argv[0], SECRET_ELEVATED_CHILD], stdin=PIPE, stdout=PIPE,text=True)
+            p = subprocess.Popen(
+                child_command(), stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, text=True
+            )
             uid = int(os.getenv("SUDO_UID"))
             gid = int(os.getenv("SUDO_GID"))
             logger.warning("Launched process via SUDO UID, spawned privledged child and dropping permissiong to uid=" + str(uid))
@@ -809,7 +808,10 @@ def main():
     app = wx.App()
 
     if args.scan and p is None:
-        p = Popen(['pkexec', 'env', 'HOME='+os.getenv("HOME"), sys.executable, sys.argv[0], SECRET_ELEVATED_CHILD], stdout=PIPE, stdin=PIPE, text=True)
+        p = subprocess.Popen(
+            ['pkexec', 'env', 'HOME=' + os.getenv("HOME")] + child_command(),
+            stdout=subprocess.PIPE, stdin=subprocess.PIPE, text=True
+        )
 
     scanner = Scanner(scan=args.scan)
 
@@ -842,6 +844,7 @@ def main():
         IMAGE, args.IPERF3_SERVER, TITLE, args.scan,
         args.BSSID, args.ding, args.ding_command, args.IPERF3_DURATION,
         scanner, None, title='wifi-survey: %s' % args.TITLE,
+        store=args.store
     )
     frm.Show()
     frm.SetStatusText('%s' % frm.pnl.GetSize())